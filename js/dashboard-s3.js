@@ -91,6 +91,16 @@ async function loadDashboardData() {
     try {
         updateConnectionStatus('connected', 'Loading data...');
         
+        // One /batch round trip for everything the tabs request on load
+        await window.dataService.prefetchDashboardData([
+            '/analytics',
+            '/filters',
+            '/query-logs?limit=1000',
+            '/query-logs',
+            '/user-metrics?days=30',
+            '/team-metrics?days=30'
+        ]);
+        
         // Get data from data service
         const userData = await window.dataService.getUsers();
         allUsers = userData.allUsers;
@@ -1403,7 +1413,18 @@ async function openQueryDetailModal(logId) {
     // Show modal immediately with basic data
     const modal = document.getElementById('query-detail-modal');
     modal.classList.add('show');
-    
+
+    // List rows only carry text previews; load the full bodies from the detail endpoint once
+    if (!log.fullBodyLoaded) {
+        const fullLog = await window.dataService.getQueryLogById(log.query_id, log.request_timestamp);
+        if (fullLog) {
+            log.user_query = fullLog.user_query;
+            log.query = fullLog.user_query;
+            log.llm_response = fullLog.llm_response;
+            log.fullBodyLoaded = true;
+        }
+    }
+
     // User Information Section
     document.getElementById('modal-query-id').textContent = log.query_id || '-';
     document.getElementById('modal-conversation-id').textContent = log.conversation_id || '-';
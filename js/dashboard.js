@@ -36,6 +36,22 @@ let trustByTeamPageSize = 10;
 let trustByTeamTotalCount = 0;
 let allTrustByTeamData = [];
 
+// Recent query logs (10000 rows) shared by every tab of one dashboard load
+let recentQueryLogsPromise = null;
+
+/**
+ * Recent query logs, fetched once per dashboard load
+ */
+function getRecentQueryLogs() {
+    if (!recentQueryLogsPromise) {
+        recentQueryLogsPromise = window.dataService.getQueryLogs({ limit: 10000 }).catch(error => {
+            recentQueryLogsPromise = null;
+            throw error;
+        });
+    }
+    return recentQueryLogsPromise;
+}
+
 // Initialize dashboard when page loads
 document.addEventListener('DOMContentLoaded', function() {
     console.log('🚀 Initializing RAG Query Monitoring Dashboard...');
@@ -90,6 +106,18 @@ function showTab(tabId) {
 async function loadDashboardData() {
     try {
         updateConnectionStatus('connected', 'Loading data...');
+        recentQueryLogsPromise = null;
+        
+        // One /batch round trip for everything the tabs request on load.
+        // Query logs only at page size: the 10000-row lists go on their own requests,
+        // otherwise a single oversized list would turn the whole batch into a 413
+        await window.dataService.prefetchDashboardData([
+            '/analytics',
+            '/filters',
+            '/query-logs?limit=1000',
+            '/user-metrics?days=30',
+            '/team-metrics?days=30'
+        ]);
         
         // Get data from data service
         const userData = await window.dataService.getUsers();
@@ -171,7 +199,7 @@ async function updateUserMetrics() {
         const tomorrow = new Date(today);
         tomorrow.setDate(tomorrow.getDate() + 1);
         
-        const queryLogs = await window.dataService.getQueryLogs({ limit: 10000 });
+        const queryLogs = await getRecentQueryLogs();
         
         // Filter logs for today
         const todayLogs = queryLogs.filter(log => {
@@ -531,7 +559,7 @@ async function loadTeamUsersTableWithPagination() {
     
     // We need to fetch query logs to get user_name and person_name for each person
     try {
-        const queryLogs = await window.dataService.getQueryLogs({ limit: 10000 });
+        const queryLogs = await getRecentQueryLogs();
         
         // Build a map of person_name -> {user_name, iam_group}
         // Note: In the database, the fields are user_name, person_name, and iam_group
@@ -723,7 +751,7 @@ function updateRequestsDetailsHeaders() {
 async function loadDailyTrendChart() {
     try {
         // Get real data from query logs for last 10 days
-        const queryLogs = await window.dataService.getQueryLogs({ limit: 10000 });
+        const queryLogs = await getRecentQueryLogs();
         
         // Group by date and count queries
         const dateCounts = {};
@@ -855,7 +883,7 @@ async function loadModelUsageTable() {
     
     try {
         // Get real data from query logs
-        const queryLogs = await window.dataService.getQueryLogs({ limit: 10000 });
+        const queryLogs = await getRecentQueryLogs();
         
         // Count usage by model and team
         const modelTeamUsage = {};
@@ -946,7 +974,7 @@ async function loadModelUsageTable() {
 async function loadModelConsumptionEvolution() {
     try {
         // Get real data from query logs for last 10 days
-        const queryLogs = await window.dataService.getQueryLogs({ limit: 10000 });
+        const queryLogs = await getRecentQueryLogs();
         
         // Group by model and date
         const modelDateCounts = {};
@@ -999,7 +1027,7 @@ async function loadModelConsumptionEvolution() {
 async function loadResponseTimeEvolution() {
     try {
         // Get real data from query logs for last 10 days
-        const queryLogs = await window.dataService.getQueryLogs({ limit: 10000 });
+        const queryLogs = await getRecentQueryLogs();
         
         // Group by date and calculate average response time
         const dateTimes = {};
@@ -1061,7 +1089,7 @@ async function loadRequestsHistoryTab() {
 async function fetchQueryLogsData() {
     try {
         // Fetch query logs from database via Lambda (get more records to include all users)
-        const queryLogs = await window.dataService.getQueryLogs({ limit: 10000 });
+        const queryLogs = await getRecentQueryLogs();
         
         allQueryLogsData = queryLogs.map(log => ({
             // Legacy fields for backward compatibility
@@ -1333,7 +1361,28 @@ async function populateFilterDropdowns() {
     }
 }
 
-function applyFilters() {
+/**
+ * Query ids whose full text matches the search, as decided by the server.
+ * List rows only carry a 200-char preview of the query, so a local match would miss later text.
+ * Returns null if the server search fails (the caller then falls back to the preview).
+ */
+async function fetchSearchMatches(searchText, startDate, endDate) {
+    try {
+        const matches = await window.dataService.getQueryLogs({
+            search: searchText,
+            fields: 'query_id',
+            limit: 10000,
+            start_date: startDate,
+            end_date: endDate
+        });
+        return new Set(matches.map(log => log.query_id));
+    } catch (error) {
+        console.error('Error searching query logs:', error);
+        return null;
+    }
+}
+
+async function applyFilters() {
     const searchText = document.getElementById('filter-search').value.toLowerCase();
     const person = document.getElementById('filter-person').value;
     const team = document.getElementById('filter-team').value;
@@ -1353,10 +1402,13 @@ function applyFilters() {
         }
     }
     
+    const searchMatches = searchText ? await fetchSearchMatches(searchText, startDate, endDate) : null;
+    
     filteredQueryLogsData = allQueryLogsData.filter(log => {
-        // Search filter - buscar en query, session_token y conversation_id_bedrock
+        // Search filter - buscar en query (texto completo en el servidor), session_token y conversation_id_bedrock
         if (searchText) {
-            const queryMatch = log.query.toLowerCase().includes(searchText);
+            const queryMatch = (searchMatches && searchMatches.has(log.query_id)) ||
+                (log.query || '').toLowerCase().includes(searchText);
             const sessionTokenMatch = log.session_token && log.session_token.toLowerCase().includes(searchText);
             const conversationIdMatch = log.conversation_id_bedrock && log.conversation_id_bedrock.toLowerCase().includes(searchText);
             
@@ -1519,6 +1571,20 @@ async function openQueryDetailModal(logId) {
     const modal = document.getElementById('query-detail-modal');
     modal.classList.add('show');
     
+    // List rows only carry text previews; load the full bodies from the detail endpoint once
+    if (!log.fullBodyLoaded) {
+        const fullLog = await window.dataService.getQueryLogById(log.query_id, log.request_timestamp);
+        if (fullLog) {
+            log.query_text = fullLog.user_query;
+            log.user_query = fullLog.user_query;
+            log.llm_response = fullLog.llm_response;
+            log.tools_used = fullLog.tools_used;
+            log.tool_results = fullLog.tool_results;
+            log.retrieved_docs_count = fullLog.retrieved_docs_count;
+            log.fullBodyLoaded = true;
+        }
+    }
+    
     // Basic Information Section
     document.getElementById('modal-id').textContent = log.id || log.query_id || '-';
     document.getElementById('modal-session-token').textContent = log.session_token || '-';
@@ -1964,6 +2030,7 @@ function exportModelUsageTable() {
 // ========== UTILITY FUNCTIONS ==========
 
 function refreshRequestsDetails() {
+    recentQueryLogsPromise = null;
     loadRequestsDetailsTab();
 }
 
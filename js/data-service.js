@@ -11,10 +11,44 @@ let cachedData = {
     lastUpdate: null
 };
 
+// Responses prefetched through /batch, keyed by endpoint (GET only)
+const BATCH_PREFETCH_TTL_MS = 60 * 1000;
+let prefetchedResponses = new Map();
+
+// GETs in flight, keyed by endpoint: concurrent callers share one request
+let inFlightRequests = new Map();
+
 /**
  * Make authenticated API call to Lambda backend
  */
 async function makeAPICall(endpoint, method = 'GET', body = null) {
+    if (method === 'GET' && !body) {
+        const prefetched = prefetchedResponses.get(endpoint);
+        if (prefetched && Date.now() - prefetched.fetchedAt < BATCH_PREFETCH_TTL_MS) {
+            return prefetched.data;
+        }
+
+        const pending = inFlightRequests.get(endpoint);
+        if (pending) {
+            return pending;
+        }
+
+        const request = fetchJSON(endpoint, method, body).finally(() => {
+            if (inFlightRequests.get(endpoint) === request) {
+                inFlightRequests.delete(endpoint);
+            }
+        });
+        inFlightRequests.set(endpoint, request);
+        return request;
+    }
+
+    return fetchJSON(endpoint, method, body);
+}
+
+/**
+ * Single request to the Lambda backend, parsed as JSON
+ */
+async function fetchJSON(endpoint, method, body) {
     try {
         const options = {
             method: method,
@@ -40,6 +74,61 @@ async function makeAPICall(endpoint, method = 'GET', body = null) {
     }
 }
 
+/**
+ * Fetch several GET endpoints in a single /batch round trip
+ * @param {Array<string>} endpoints - Endpoints with query string, e.g. '/query-logs?limit=1000'
+ * @returns {Promise<Object>} Map of endpoint -> parsed body (only successful sub-responses)
+ */
+async function batchFetch(endpoints) {
+    const unique = [...new Set(endpoints)];
+    const response = await makeAPICall('/batch', 'POST', {
+        requests: unique.map((endpoint, index) => ({ id: String(index), path: endpoint }))
+    });
+    
+    const results = {};
+    unique.forEach((endpoint, index) => {
+        const sub = response.responses?.[String(index)];
+        if (sub && sub.status === 200) {
+            results[endpoint] = sub.body;
+        } else {
+            console.warn(`⚠️ Batch sub-request ${endpoint} failed:`, sub?.body);
+        }
+    });
+    
+    console.log(`📦 Batch: ${unique.length} requests in one call`, response.batch);
+    return results;
+}
+
+/**
+ * Prefetch the endpoints needed on page load with one /batch call.
+ * Later makeAPICall() calls for the same endpoints are served from memory;
+ * on failure they simply fall back to individual requests.
+ */
+async function prefetchDashboardData(endpoints) {
+    const requested = [...(endpoints || [
+        '/analytics',
+        '/filters',
+        '/query-logs?limit=1000',
+        '/user-metrics?days=30',
+        '/team-metrics?days=30'
+    ])];
+    
+    // Trust analytics live in the same Lambda when both configs point to it
+    if (window.TRUST_API_CONFIG?.enabled && window.TRUST_API_CONFIG.base_url === API_BASE_URL) {
+        requested.push('/trust-analytics?days=7');
+    }
+    
+    try {
+        const results = await batchFetch(requested);
+        const fetchedAt = Date.now();
+        Object.entries(results).forEach(([endpoint, data]) => {
+            prefetchedResponses.set(endpoint, { data, fetchedAt });
+        });
+    } catch (error) {
+        console.warn('⚠️ Batch prefetch failed, falling back to individual requests:', error);
+    }
+}
+
 /**
  * Fetch analytics data from Lambda
  */
@@ -98,6 +187,23 @@ async function getFilters(forceRefresh = false) {
     }
 }
 
+/**
+ * Type-ahead search over filter values (case-insensitive prefix)
+ * @param {string} prefix - Typed text
+ * @param {string} dimension - 'persons' or 'teams'
+ * @param {number} limit - Maximum number of suggestions
+ */
+async function searchFilterValues(prefix, dimension = 'persons', limit = 20) {
+    try {
+        const params = new URLSearchParams({ prefix, dimension, limit: limit.toString() });
+        const data = await makeAPICall(`/filters?${params.toString()}`);
+        return data[dimension] || [];
+    } catch (error) {
+        console.error('Error searching filter values:', error);
+        return [];
+    }
+}
+
 /**
  * Fetch users and their team assignments from analytics data
  */
@@ -184,104 +290,57 @@ async function getUsers() {
 }
 
 /**
- * Fetch user metrics (queries, response times, etc.) from analytics
- * Uses pagination to fetch all data for the last 30 days
+ * Build the last-11-days array (index 10 is today) from a {YYYY-MM-DD: count} map
+ */
+function buildDailySeries(dailyCounts) {
+    const daily = Array(11).fill(0);
+    const today = new Date();
+    
+    for (let i = 0; i < 11; i++) {
+        const date = new Date(today);
+        date.setDate(date.getDate() - (10 - i));
+        const dateKey = date.toISOString().split('T')[0];
+        daily[i] = (dailyCounts && dailyCounts[dateKey]) || 0;
+    }
+    
+    return daily;
+}
+
+/**
+ * Convert a server-side aggregate entry into the dashboard metrics shape
+ */
+function toDashboardMetrics(entry) {
+    return {
+        daily: buildDailySeries(entry.daily),
+        monthly: entry.total,
+        avgResponseTime: (entry.avg_response_time_ms || 0) / 1000,
+        p95ResponseTime: (entry.p95_response_time_ms || 0) / 1000,
+        tokensTotal: entry.tokens_total || 0
+    };
+}
+
+/**
+ * Fetch user metrics (queries, response times, etc.) for the last 30 days
+ * Aggregated server-side by the /user-metrics endpoint
  */
 async function getUserMetrics(forceRefresh = false) {
     console.log('📊 Fetching user metrics from database...');
     
     try {
-        const analytics = await getAnalytics(null, null, forceRefresh);
-        
-        if (!analytics) {
-            return {};
-        }
-        
+        // refresh=1 skips both the prefetched copy and the server cache
+        const data = await makeAPICall(`/user-metrics?days=30${forceRefresh ? '&refresh=1' : ''}`);
         const metrics = {};
         
-        // Calculate date range for last 30 days to ensure we get all recent data
-        const today = new Date();
-        const thirtyDaysAgo = new Date(today);
-        thirtyDaysAgo.setDate(thirtyDaysAgo.getDate() - 30);
-        
-        const startDate = thirtyDaysAgo.toISOString();
-        const endDate = today.toISOString();
-        
-        // Fetch ALL query logs using pagination
-        const allQueryLogs = await fetchAllQueryLogsWithPagination(startDate, endDate);
-        
-        console.log(`📊 Processing ${allQueryLogs.length} query logs for user metrics`);
-        
-        // Calculate metrics per user
-        const userStats = {};
-        
-        // Also calculate hourly data for today
-        const todayStart = new Date(today);
-        todayStart.setHours(0, 0, 0, 0);
-        const hourlyDataToday = Array(24).fill(0);
-        
-        allQueryLogs.forEach(log => {
-            const person = log.person;
-            if (!person) return;
-            
-            if (!userStats[person]) {
-                userStats[person] = {
-                    dailyCounts: {},
-                    totalQueries: 0,
-                    totalResponseTime: 0,
-                    queryCount: 0
-                };
-            }
-            
-            // Count by date
-            const date = new Date(log.request_timestamp);
-            const dateKey = date.toISOString().split('T')[0];
-            userStats[person].dailyCounts[dateKey] = (userStats[person].dailyCounts[dateKey] || 0) + 1;
-            userStats[person].totalQueries++;
-            
-            // Count hourly for today
-            if (date >= todayStart) {
-                const hour = date.getHours();
-                hourlyDataToday[hour]++;
-            }
-            
-            // Sum response times
-            if (log.processing_time_ms) {
-                userStats[person].totalResponseTime += log.processing_time_ms;
-                userStats[person].queryCount++;
-            }
-        });
-        
-        // Build metrics object with last 11 days (index 0-10, where 10 is today)
-        Object.keys(userStats).forEach(person => {
-            const daily = Array(11).fill(0);
-            const today = new Date();
-            
-            // Fill last 11 days
-            for (let i = 0; i < 11; i++) {
-                const date = new Date(today);
-                date.setDate(date.getDate() - (10 - i));
-                const dateKey = date.toISOString().split('T')[0];
-                daily[i] = userStats[person].dailyCounts[dateKey] || 0;
-            }
-            
-            const avgResponseTime = userStats[person].queryCount > 0 
-                ? userStats[person].totalResponseTime / userStats[person].queryCount / 1000 
-                : 0;
-            
-            metrics[person] = {
-                daily: daily,
-                monthly: userStats[person].totalQueries,
-                avgResponseTime: avgResponseTime
-            };
+        Object.keys(data.users || {}).forEach(person => {
+            metrics[person] = toDashboardMetrics(data.users[person]);
         });
         
-        console.log(`✅ User metrics calculated for ${Object.keys(metrics).length} users`);
+        console.log(`✅ User metrics received for ${Object.keys(metrics).length} users`);
         
         // Return both user metrics and hourly data for today
         return {
             userMetrics: metrics,
-            hourlyDataToday: hourlyDataToday
+            hourlyDataToday: data.hourlyToday || Array(24).fill(0)
         };
     } catch (error) {
         console.error('Error fetching user metrics:', error);
@@ -293,87 +352,21 @@ async function getUserMetrics(forceRefresh = false) {
 }
 
 /**
- * Fetch team metrics from analytics
- * Uses pagination to fetch all data for the last 30 days
+ * Fetch team metrics for the last 30 days
+ * Aggregated server-side by the /team-metrics endpoint
  */
 async function getTeamMetrics(forceRefresh = false) {
     console.log('📊 Fetching team metrics from database...');
     
     try {
-        const analytics = await getAnalytics(null, null, forceRefresh);
-        
-        if (!analytics) {
-            return {};
-        }
-        
+        const data = await makeAPICall(`/team-metrics?days=30${forceRefresh ? '&refresh=1' : ''}`);
         const teamMetrics = {};
         
-        // Calculate date range for last 30 days to ensure we get all recent data
-        const today = new Date();
-        const thirtyDaysAgo = new Date(today);
-        thirtyDaysAgo.setDate(thirtyDaysAgo.getDate() - 30);
-        
-        const startDate = thirtyDaysAgo.toISOString();
-        const endDate = today.toISOString();
-        
-        // Fetch ALL query logs using pagination
-        const allQueryLogs = await fetchAllQueryLogsWithPagination(startDate, endDate);
-        
-        console.log(`📊 Processing ${allQueryLogs.length} query logs for team metrics`);
-        
-        // Calculate metrics per team
-        const teamStats = {};
-        
-        allQueryLogs.forEach(log => {
-            const team = log.team || log.iam_group || 'Unknown';
-            
-            if (!teamStats[team]) {
-                teamStats[team] = {
-                    dailyCounts: {},
-                    totalQueries: 0,
-                    totalResponseTime: 0,
-                    queryCount: 0
-                };
-            }
-            
-            // Count by date
-            const date = new Date(log.request_timestamp);
-            const dateKey = date.toISOString().split('T')[0];
-            teamStats[team].dailyCounts[dateKey] = (teamStats[team].dailyCounts[dateKey] || 0) + 1;
-            teamStats[team].totalQueries++;
-            
-            // Sum response times
-            if (log.processing_time_ms) {
-                teamStats[team].totalResponseTime += log.processing_time_ms;
-                teamStats[team].queryCount++;
-            }
-        });
-        
-        // Build metrics object with last 11 days
-        Object.keys(teamStats).forEach(team => {
-            const daily = Array(11).fill(0);
-            const today = new Date();
-            
-            // Fill last 11 days
-            for (let i = 0; i < 11; i++) {
-                const date = new Date(today);
-                date.setDate(date.getDate() - (10 - i));
-                const dateKey = date.toISOString().split('T')[0];
-                daily[i] = teamStats[team].dailyCounts[dateKey] || 0;
-            }
-            
-            const avgResponseTime = teamStats[team].queryCount > 0 
-                ? teamStats[team].totalResponseTime / teamStats[team].queryCount / 1000 
-                : 0;
-            
-            teamMetrics[team] = {
-                daily: daily,
-                monthly: teamStats[team].totalQueries,
-                avgResponseTime: avgResponseTime
-            };
+        Object.keys(data.teams || {}).forEach(team => {
+            teamMetrics[team] = toDashboardMetrics(data.teams[team]);
         });
         
-        console.log(`✅ Team metrics calculated for ${Object.keys(teamMetrics).length} teams`);
+        console.log(`✅ Team metrics received for ${Object.keys(teamMetrics).length} teams`);
         
         return teamMetrics;
     } catch (error) {
@@ -462,6 +455,8 @@ async function getQueryLogs(filters = {}) {
         if (filters.search) params.append('search', filters.search);
         if (filters.limit) params.append('limit', filters.limit);
         if (filters.offset) params.append('offset', filters.offset);
+        if (filters.view) params.append('view', filters.view);
+        if (filters.fields) params.append('fields', filters.fields);
         
         const endpoint = `/query-logs${params.toString() ? '?' + params.toString() : ''}`;
         const data = await makeAPICall(endpoint);
@@ -475,12 +470,17 @@ async function getQueryLogs(filters = {}) {
 
 /**
  * Fetch a specific query log by ID
+ * requestTimestamp (optional) lets the backend look in a single partition
  */
-async function getQueryLogById(queryId) {
+async function getQueryLogById(queryId, requestTimestamp = null) {
     console.log(`📊 Fetching query log ${queryId} from database...`);
     
     try {
-        const data = await makeAPICall(`/query-logs/${queryId}`);
+        let endpoint = `/query-logs/${queryId}`;
+        if (requestTimestamp) {
+            endpoint += `?at=${encodeURIComponent(requestTimestamp)}`;
+        }
+        const data = await makeAPICall(endpoint);
         return data;
     } catch (error) {
         console.error('Error fetching query log:', error);
@@ -488,6 +488,43 @@ async function getQueryLogById(queryId) {
     }
 }
 
+/**
+ * Fetch conversation summaries (turns, tokens, avg trust, tools), newest first
+ * Pass filters.after = previous next_cursor to get the next page
+ */
+async function getConversations(filters = {}) {
+    console.log('📊 Fetching conversations from database...');
+    
+    try {
+        const params = new URLSearchParams();
+        if (filters.person) params.append('person', filters.person);
+        if (filters.team) params.append('team', filters.team);
+        if (filters.start_date) params.append('start_date', filters.start_date);
+        if (filters.end_date) params.append('end_date', filters.end_date);
+        if (filters.limit) params.append('limit', filters.limit);
+        if (filters.after) params.append('after', filters.after);
+        
+        return await makeAPICall(`/conversations${params.toString() ? '?' + params.toString() : ''}`);
+    } catch (error) {
+        console.error('Error fetching conversations:', error);
+        return { data: [], has_more: false, next_cursor: null };
+    }
+}
+
+/**
+ * Fetch a conversation summary and all its turns in one call
+ */
+async function getConversation(conversationId, view = 'summary') {
+    console.log(`📊 Fetching conversation ${conversationId} from database...`);
+    
+    try {
+        return await makeAPICall(`/conversations/${conversationId}?view=${view}`);
+    } catch (error) {
+        console.error('Error fetching conversation:', error);
+        return null;
+    }
+}
+
 /**
  * Fetch complete query log details including analysis and retrieved documents
  */
@@ -520,7 +557,7 @@ async function getQueryLogDetails(queryId) {
 }
 
 /**
- * Fetch all query logs using pagination
+ * Fetch all query logs using keyset (cursor) pagination
  * @param {string} startDate - Start date in ISO format
  * @param {string} endDate - End date in ISO format
  * @param {number} pageSize - Number of records per page (default: 1000)
@@ -530,7 +567,7 @@ async function fetchAllQueryLogsWithPagination(startDate, endDate, pageSize = 10
     console.log(`📊 Fetching all query logs with pagination (${startDate} to ${endDate})...`);
     
     const allLogs = [];
-    let offset = 0;
+    let nextCursor = null;
     let hasMore = true;
     let pageCount = 0;
     
@@ -541,26 +578,23 @@ async function fetchAllQueryLogsWithPagination(startDate, endDate, pageSize = 10
                 start_date: startDate,
                 end_date: endDate,
                 limit: pageSize.toString(),
-                offset: offset.toString()
+                pagination: 'cursor'
             });
             
+            // Each page resumes after the last (created_at, id) seen, so deep pages cost the same as the first
+            if (nextCursor) params.append('after', nextCursor);
+            
             const endpoint = `/query-logs?${params.toString()}`;
             const response = await makeAPICall(endpoint);
             
             if (response.data && response.data.length > 0) {
                 allLogs.push(...response.data);
                 console.log(`  📄 Page ${pageCount}: Fetched ${response.data.length} records (total: ${allLogs.length})`);
-                
-                // Check if there are more records
-                if (response.data.length < pageSize) {
-                    hasMore = false;
-                } else {
-                    offset += pageSize;
-                }
-            } else {
-                hasMore = false;
             }
             
+            nextCursor = response.next_cursor || null;
+            hasMore = Boolean(nextCursor);
+            
             // Safety limit: stop after 50 pages (50,000 records)
             if (pageCount >= 50) {
                 console.warn('⚠️ Reached maximum page limit (50 pages)');
@@ -577,6 +611,48 @@ async function fetchAllQueryLogsWithPagination(startDate, endDate, pageSize = 10
     }
 }
 
+/**
+ * Fetch confidence and latency percentiles (p50/p80/p95/p99) merged server-side from daily sketches
+ * @param {string} startDate - YYYY-MM-DD
+ * @param {string} endDate - YYYY-MM-DD
+ * @param {Array<string>} teams - Optional team subset
+ */
+async function getPercentiles(startDate = null, endDate = null, teams = []) {
+    try {
+        const params = new URLSearchParams();
+        if (startDate) params.append('start_date', startDate);
+        if (endDate) params.append('end_date', endDate);
+        if (teams.length) params.append('teams', teams.join(','));
+        
+        return await makeAPICall(`/percentiles${params.toString() ? '?' + params.toString() : ''}`);
+    } catch (error) {
+        console.error('Error fetching percentiles:', error);
+        return null;
+    }
+}
+
+/**
+ * Fetch token and cost totals
+ * @param {string} startDate - YYYY-MM-DD
+ * @param {string} endDate - YYYY-MM-DD
+ * @param {Array<string>} groupBy - Any of team, person, day, model
+ * @param {Array<string>} teams - Optional team subset
+ */
+async function getUsage(startDate = null, endDate = null, groupBy = ['team'], teams = []) {
+    try {
+        const params = new URLSearchParams();
+        if (startDate) params.append('start_date', startDate);
+        if (endDate) params.append('end_date', endDate);
+        if (groupBy.length) params.append('group_by', groupBy.join(','));
+        if (teams.length) params.append('teams', teams.join(','));
+        
+        return await makeAPICall(`/usage${params.toString() ? '?' + params.toString() : ''}`);
+    } catch (error) {
+        console.error('Error fetching usage:', error);
+        return null;
+    }
+}
+
 /**
  * Clear cached data
  */
@@ -586,6 +662,8 @@ function clearCache() {
         filters: null,
         lastUpdate: null
     };
+    prefetchedResponses = new Map();
+    inFlightRequests = new Map();
     console.log('🗑️ Cache cleared');
 }
 
@@ -601,6 +679,13 @@ async function getTrustAnalytics(days = 7, forceRefresh = false) {
     }
     
     try {
+        // Same Lambda as the dashboard API: may already be prefetched by /batch
+        // (refresh=1 skips both the prefetched copy and the server cache)
+        if (window.TRUST_API_CONFIG.base_url === API_BASE_URL) {
+            const query = `days=${days}${forceRefresh ? '&refresh=1' : ''}`;
+            return await makeAPICall(`/trust-analytics?${query}`);
+        }
+        
         const endpoint = `${window.TRUST_API_CONFIG.base_url}/trust-analytics?days=${days}`;
         console.log('Calling Trust API:', endpoint);
         
@@ -623,6 +708,7 @@ async function getTrustAnalytics(days = 7, forceRefresh = false) {
 window.dataService = {
     getAnalytics,
     getFilters,
+    searchFilterValues,
     getUsers,
     getUserMetrics,
     getTeamMetrics,
@@ -631,7 +717,13 @@ window.dataService = {
     getQueryLogs,
     getQueryLogById,
     getQueryLogDetails,
+    getConversations,
+    getConversation,
     getTrustAnalytics,
+    getPercentiles,
+    getUsage,
+    batchFetch,
+    prefetchDashboardData,
     clearCache,
     API_BASE_URL
 };
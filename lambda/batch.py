@@ -0,0 +1,143 @@
+"""
+Dashboard Lambda - Peticiones por lotes (/batch)
+Recibe varias sub-peticiones GET en un único cuerpo JSON, deduplica las
+idénticas y las ejecuta en un pool de hilos acotado. Cada hilo toma su
+conexión del pool de db (psycopg2 no admite consultas simultáneas sobre una
+misma conexión), así que con BATCH_MAX_WORKERS=1 todo el lote usa una sola.
+
+Formato de entrada:
+    {"requests": [{"id": "logs", "path": "/query-logs", "params": {"limit": "1000"}},
+                  {"id": "filters", "path": "/filters"},
+                  {"path": "/analytics?start_date=2025-01-01"}]}
+"""
+
+import base64
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from db import POOL_MAX_SIZE
+from response_cache import cache_key, normalize_path
+from serialization import dumps
+
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', '20'))
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', str(POOL_MAX_SIZE)))
+
+# Rutas que no tienen sentido dentro de un lote (binarias o recursivas)
+EXCLUDED_PATHS = ('/batch', '/query-logs/export')
+
+# Cabeceras de la sub-respuesta que se conservan en el resultado
+FORWARDED_HEADERS = ('ETag', 'X-Cache', 'X-Cache-Age')
+
+
+class BatchError(ValueError):
+    """Cuerpo de /batch mal formado"""
+
+
+def read_event_body(event):
+    """Cuerpo de la petición de Lambda URL (puede venir en base64)"""
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return body
+
+
+def _normalize_params(params):
+    """{'limit': 1000} / {'limit': ['1000']} -> {'limit': ['1000']}"""
+    normalized = {}
+    for key, value in (params or {}).items():
+        values = value if isinstance(value, list) else [value]
+        normalized[str(key)] = [str(v) for v in values]
+    return normalized
+
+
+def parse_batch(raw):
+    """
+    Valida el cuerpo y devuelve [(id, path, query_params, etag), ...].
+    Lanza BatchError si no es una lista de sub-peticiones válida.
+    """
+    try:
+        payload = json.loads(raw) if isinstance(raw, str) else raw
+    except json.JSONDecodeError as e:
+        raise BatchError(f'Invalid JSON body: {e}')
+
+    items = payload.get('requests') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        raise BatchError("Body must contain a non-empty 'requests' list")
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise BatchError(f'Too many sub-requests (max {BATCH_MAX_REQUESTS})')
+
+    requests = []
+    seen_ids = set()
+    for position, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'path': item}
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise BatchError(f'Sub-request {position} needs a path')
+
+        path, _, query_string = item['path'].partition('?')
+        query_params = parse_qs(query_string)
+        for key, values in _normalize_params(item.get('params')).items():
+            query_params.setdefault(key, []).extend(values)
+
+        if normalize_path(path) in EXCLUDED_PATHS:
+            raise BatchError(f'{path} is not allowed in a batch')
+
+        request_id = str(item.get('id', position))
+        if request_id in seen_ids:
+            raise BatchError(f'Duplicate sub-request id: {request_id}')
+        seen_ids.add(request_id)
+
+        requests.append((request_id, path, query_params, item.get('etag')))
+    return requests
+
+
+def run_batch(requests, execute, max_workers=BATCH_MAX_WORKERS):
+    """
+    Ejecuta execute(path, query_params, etag) una vez por sub-petición única.
+    Devuelve ({id: response}, stats).
+    """
+    unique = {}
+    assignments = []
+    for request_id, path, query_params, etag in requests:
+        key = (cache_key(path, query_params), etag)
+        if key not in unique:
+            unique[key] = (path, query_params, etag)
+        assignments.append((request_id, key))
+
+    started = time.perf_counter()
+    workers = max(1, min(max_workers, len(unique)))
+    if workers == 1:
+        results = {key: execute(*args) for key, args in unique.items()}
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {key: executor.submit(execute, *args) for key, args in unique.items()}
+            results = {key: future.result() for key, future in futures.items()}
+
+    stats = {
+        'requests': len(requests),
+        'executed': len(unique),
+        'deduplicated': len(requests) - len(unique),
+        'workers': workers,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
+    return {request_id: results[key] for request_id, key in assignments}, stats
+
+
+def build_batch_body(responses, stats):
+    """
+    JSON del lote. Los cuerpos de las sub-respuestas ya están serializados,
+    así que se insertan tal cual en lugar de volver a parsearlos.
+    """
+    parts = []
+    for request_id, response in responses.items():
+        headers = response.get('headers') or {}
+        forwarded = {name: headers[name] for name in FORWARDED_HEADERS if name in headers}
+        body = response.get('body') or 'null'
+        parts.append(
+            f'{dumps(request_id)}: {{"status": {int(response.get("statusCode", 500))}, '
+            f'"headers": {dumps(forwarded)}, "body": {body}}}'
+        )
+    return '{"responses": {' + ', '.join(parts) + '}, "batch": ' + dumps(stats) + '}'
@@ -0,0 +1,137 @@
+"""
+Micro-benchmark de serialización de /query-logs
+Compara el camino anterior (dict por fila desde RealDictCursor + reconstrucción
+de 26 claves + json.dumps(default=str)) con el encoder compilado sobre tuplas.
+
+Uso: python benchmarks/bench_serialization.py [--rows 5000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import lambda_function  # noqa: E402
+import serialization  # noqa: E402
+
+
+def synthetic_rows(count, encoder):
+    """Filas sintéticas como tuplas (orden del encoder) y como dicts (RealDictCursor)"""
+    base = datetime(2025, 1, 1)
+    tuples, dicts = [], []
+    for i in range(count):
+        created = base + timedelta(seconds=i * 37)
+        values = {
+            'query_id': i,
+            'user_id': f'user{i % 50}',
+            'request_timestamp': created,
+            'response_timestamp': created + timedelta(seconds=3),
+            'person': f'Person {i % 50}',
+            'person_name': f'Person {i % 50}',
+            'team': f'team-{i % 8}',
+            'iam_group': f'team-{i % 8}',
+            'user_name': f'user{i % 50}',
+            'session_token': f'sess-{i // 10}',
+            'conversation_id_bedrock': f'conv-{i // 5}',
+            'user_query': 'x' * 200,
+            'user_query_truncated': True,
+            'llm_response': 'y' * 200,
+            'status': 'completed',
+            'processing_time_ms': Decimal(random.randint(200, 9000)),
+            'tokens_input': random.randint(100, 2000),
+            'tokens_output': random.randint(100, 2000),
+            'tokens_total': random.randint(200, 4000),
+            'tokens_used': random.randint(200, 4000),
+            'model_id': 'claude-3-haiku',
+            'knowledge_base_id': f'team-{i % 8}',
+            'llm_trust': Decimal(str(round(random.random(), 4))),
+            'confidence_score': Decimal(str(round(random.random(), 4))),
+            'llm_trust_category': random.choice(['ALTO', 'MEDIO', 'BAJO']),
+            'tools_used': ['search'],
+            'tool_results': {'docs': 3}
+        }
+        dicts.append(values)
+        tuples.append(tuple(values[field] for field, _ in encoder.columns))
+    return tuples, dicts
+
+
+def legacy_encode(rows):
+    """Camino anterior: dict de 26 claves por fila + json.dumps(default=str)"""
+    data = []
+    for row in rows:
+        data.append({
+            'query_id': str(row['query_id']),
+            'user_id': row['user_id'],
+            'request_timestamp': row['request_timestamp'].isoformat() if row['request_timestamp'] else None,
+            'response_timestamp': row['response_timestamp'].isoformat() if row['response_timestamp'] else None,
+            'person': row['person'],
+            'person_name': row['person'],
+            'team': row['team'],
+            'iam_group': row['iam_group'],
+            'user_name': row['user_name'],
+            'session_token': row['session_token'],
+            'conversation_id_bedrock': row['conversation_id_bedrock'],
+            'user_query': row['user_query'],
+            'llm_response': row['llm_response'],
+            'status': row['status'],
+            'processing_time_ms': float(row['processing_time_ms']) if row['processing_time_ms'] else 0,
+            'tokens_input': row['tokens_input'],
+            'tokens_output': row['tokens_output'],
+            'tokens_total': row['tokens_total'],
+            'tokens_used': row['tokens_used'],
+            'model_id': row['model_id'],
+            'knowledge_base_id': row['knowledge_base_id'],
+            'llm_trust': float(row['llm_trust']) if row['llm_trust'] else 0,
+            'confidence_score': float(row['confidence_score']) if row['confidence_score'] else 0,
+            'llm_trust_category': row['llm_trust_category'],
+            'tools_used': row['tools_used'],
+            'tool_results': row['tool_results']
+        })
+    return json.dumps({'data': data}, default=str)
+
+
+def encoder_encode(rows, encoder):
+    """Camino nuevo: encoder compilado sobre tuplas + serialization.dumps"""
+    return serialization.dumps({'data': encoder.encode_all(rows)})
+
+
+def measure(label, func, rows_count, repeat):
+    best = float('inf')
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = func()
+        best = min(best, time.perf_counter() - started)
+        size = len(body)
+    rate = rows_count / best
+    print(f"{label:<40} {rate:>12,.0f} rows/s   {best * 1000:>8.1f} ms   {size / 1024:>8.1f} KiB")
+    return {'rows_per_sec': rate, 'seconds': best, 'bytes': size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    full_encoder = lambda_function.query_log_encoder(lambda_function.resolve_query_log_fields({'view': ['full']}))
+    summary_encoder = lambda_function.query_log_encoder(lambda_function.resolve_query_log_fields({}), 200)
+
+    full_tuples, dicts = synthetic_rows(args.rows, full_encoder)
+    summary_tuples, _ = synthetic_rows(args.rows, summary_encoder)
+
+    print(f"JSON backend: {serialization.JSON_BACKEND} | rows: {args.rows}")
+    before = measure("before (dict rows + json default=str)", lambda: legacy_encode(dicts), args.rows, args.repeat)
+    after = measure("after (encoder, view=full)", lambda: encoder_encode(full_tuples, full_encoder), args.rows, args.repeat)
+    measure("after (encoder, view=summary)", lambda: encoder_encode(summary_tuples, summary_encoder), args.rows, args.repeat)
+    print(f"speedup (full view): {after['rows_per_sec'] / before['rows_per_sec']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
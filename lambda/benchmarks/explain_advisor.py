@@ -0,0 +1,231 @@
+"""
+Asesor de índices: EXPLAIN (ANALYZE, BUFFERS) de cada consulta de los handlers
+Ejecuta los handlers reales contra un PostgreSQL (local o de staging) con una
+conexión que antepone EXPLAIN a cada SELECT, así se analiza exactamente el SQL
+que lanza la Lambda. Marca los Seq Scan sobre web_queries (o sus particiones);
+sale con código 1 si encuentra alguno (útil en CI tras aplicar migrations.py).
+Con web_queries particionada muestra también cuántas particiones lee cada
+sentencia, para comprobar el partition pruning.
+
+Uso: python benchmarks/explain_advisor.py --dsn postgresql://localhost/ragdb [--rollup] [--json plans.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import psycopg2  # noqa: E402
+from psycopg2.extras import RealDictCursor  # noqa: E402
+
+import db  # noqa: E402
+import lambda_function  # noqa: E402
+import migrations  # noqa: E402
+import partitions  # noqa: E402
+import rollup  # noqa: E402
+
+# Tabla vigilada: en el resto (rollup, catálogos) un Seq Scan es aceptable
+WATCHED_TABLE = 'web_queries'
+EXPLAIN_PREFIX = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+
+class PlanRecorder:
+    """Acumula los planes por ruta"""
+
+    def __init__(self):
+        self.route = None
+        self.statements = []
+
+    def record(self, query, plan):
+        self.statements.append({'route': self.route, 'query': query, 'plan': plan})
+
+
+class _ExplainingCursor:
+    """Proxy de cursor: antes de cada SELECT/WITH ejecuta su EXPLAIN con los mismos parámetros"""
+
+    def __init__(self, cursor, conn, recorder):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_recorder', recorder)
+
+    def execute(self, query, params=None):
+        text = query if isinstance(query, str) else query.as_string(self._conn)
+        if text.lstrip().upper().startswith(('SELECT', 'WITH')):
+            with psycopg2.extensions.cursor(self._conn) as explain_cursor:
+                explain_cursor.execute(EXPLAIN_PREFIX + text, params)
+                plan = explain_cursor.fetchone()[0][0]
+            self._recorder.record(' '.join(text.split()), plan)
+        return self._cursor.execute(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+
+def make_connection_factory(recorder):
+    class ExplainConnection(psycopg2.extensions.connection):
+        def cursor(self, *args, **kwargs):
+            return _ExplainingCursor(super().cursor(*args, **kwargs), self, recorder)
+    return ExplainConnection
+
+
+def walk_plan(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk_plan(child)
+
+
+def is_watched(relation):
+    """web_queries o una de sus particiones (partitions.py), no el rollup ni los catálogos"""
+    return relation is not None and (
+        relation == WATCHED_TABLE
+        or relation == partitions.DEFAULT_PARTITION
+        or relation.startswith(f"{WATCHED_TABLE}_p")
+    )
+
+
+def analyze_statement(statement):
+    """Nodos de acceso a web_queries, buffers y tiempo de un plan"""
+    plan = statement['plan']
+    scans = []
+    for node in walk_plan(plan['Plan']):
+        if is_watched(node.get('Relation Name')):
+            scans.append({
+                'relation': node['Relation Name'],
+                'node': node['Node Type'],
+                'index': node.get('Index Name'),
+                'rows': node.get('Actual Rows'),
+                'heap_fetches': node.get('Heap Fetches')
+            })
+    root = plan['Plan']
+    return {
+        'route': statement['route'],
+        'query': statement['query'][:160],
+        'execution_ms': plan.get('Execution Time'),
+        'shared_hit': root.get('Shared Hit Blocks'),
+        'shared_read': root.get('Shared Read Blocks'),
+        'scans': scans,
+        'partitions': len({scan['relation'] for scan in scans}),
+        'seq_scan': any(scan['node'] == 'Seq Scan' for scan in scans)
+    }
+
+
+def sample_routes(conn):
+    """Rutas y parámetros representativos de lo que pide el dashboard"""
+    with psycopg2.extensions.cursor(conn) as cursor:
+        cursor.execute("SELECT id, person_name, app_name, created_at, conversation_id_bedrock FROM web_queries "
+                       "WHERE person_name IS NOT NULL AND app_name IS NOT NULL ORDER BY created_at DESC LIMIT 1")
+        row = cursor.fetchone()
+    conn.rollback()
+    query_id, person, team, created_at, conversation_id = row if row else ('0', 'nobody', 'none', None, None)
+    at = {'at': [created_at.isoformat()]} if created_at else {}
+
+    return [
+        ('/analytics', {}),
+        ('/filters', {}),
+        ('/query-logs', {'limit': ['1000']}),
+        ('/query-logs', {'limit': ['100'], 'pagination': ['cursor']}),
+        ('/query-logs', {'limit': ['100'], 'person': [person]}),
+        ('/query-logs', {'limit': ['100'], 'team': [team]}),
+        (f'/query-logs/{query_id}', at),
+        ('/user-metrics', {'days': ['30']}),
+        ('/team-metrics', {'days': ['30']}),
+        ('/trust-analytics', {'days': ['7']}),
+        ('/conversations', {'limit': ['50']}),
+        ('/conversations', {'limit': ['50'], 'person': [person]}),
+        (f'/conversations/{conversation_id or "none"}', {}),
+    ]
+
+
+def run(dsn, use_rollup):
+    recorder = PlanRecorder()
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor,
+                            connection_factory=make_connection_factory(recorder))
+
+    @contextmanager
+    def explain_connection():
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+    # Una sola conexión instrumentada: las consultas en paralelo pasan a secuenciales
+    lambda_function.db_connection = explain_connection
+    db.db_connection = explain_connection
+    db.QUERY_CONCURRENCY = 1
+    if not use_rollup:
+        rollup.ROLLUP_MODE = 'off'
+
+    try:
+        routes = sample_routes(conn)
+        for path, params in routes:
+            recorder.route = f"{path}?{'&'.join(f'{k}={v[0]}' for k, v in params.items())}".rstrip('?')
+            response = lambda_function.route_request(path, params)
+            if response['statusCode'] != 200:
+                print(f"⚠️ {recorder.route} -> {response['statusCode']}: {response['body'][:200]}")
+
+            # Segunda página en modo cursor: el keyset también debe ir por índice
+            if params.get('pagination') == ['cursor']:
+                body = json.loads(response['body'])
+                if body.get('next_cursor'):
+                    recorder.route += ' (page 2)'
+                    lambda_function.route_request(path, {**params, 'after': [body['next_cursor']]})
+    finally:
+        conn.close()
+
+    return [analyze_statement(statement) for statement in recorder.statements]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dsn', default=os.environ.get('EXPLAIN_DSN'),
+                        help="DSN de PostgreSQL (o EXPLAIN_DSN)")
+    parser.add_argument('--rollup', action='store_true', help="Usar web_queries_daily si existe")
+    parser.add_argument('--json', help="Guardar los planes analizados en este fichero")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn o EXPLAIN_DSN es obligatorio")
+
+    results = run(args.dsn, args.rollup)
+
+    flagged = 0
+    for result in results:
+        accesses = ', '.join(
+            f"{scan['node']}" + (f" [{scan['index']}]" if scan['index'] else '')
+            for scan in result['scans']
+        ) or '-'
+        mark = '❌' if result['seq_scan'] else '✅'
+        flagged += result['seq_scan']
+        print(f"{mark} {result['route']:<45} {result['execution_ms'] or 0:>9.1f} ms  "
+              f"hit={result['shared_hit']} read={result['shared_read']}  "
+              f"partitions={result['partitions']}  {accesses}")
+        if result['seq_scan']:
+            print(f"     {result['query']}")
+
+    print(f"\n{len(results)} statements, {flagged} with Seq Scan on {WATCHED_TABLE}")
+    if flagged:
+        print(f"💡 Apply the indexes: python migrations.py apply  ({len(migrations.INDEXES)} defined)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+
+    return 1 if flagged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Precisión de los sketches de cuantiles frente al cálculo exacto
+Genera latencias (lognormal) y confianzas (beta) repartidas por día y equipo,
+construye un sketch por (día, equipo), lo serializa como en web_queries_daily,
+y combina rangos de días y subconjuntos de equipos al azar. Compara
+p50/p80/p95/p99 con el valor exacto de la muestra ordenada y falla (código 1)
+si algún error relativo supera la precisión del sketch.
+
+Uso: python benchmarks/sketch_accuracy.py [--rows 200000] [--days 30] [--teams 8] [--trials 200]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sketches import DEFAULT_QUANTILES, DEFAULT_RELATIVE_ACCURACY, QuantileSketch, merge_sketches  # noqa: E402
+
+METRICS = ('latency', 'confidence')
+
+
+def generate(rows, days, teams, seed):
+    """{(day, team): {'latency': [...], 'confidence': [...]}}"""
+    rng = random.Random(seed)
+    data = {}
+    for _ in range(rows):
+        key = (rng.randrange(days), rng.randrange(teams))
+        entry = data.setdefault(key, {'latency': [], 'confidence': []})
+        entry['latency'].append(rng.lognormvariate(7.5, 0.8))      # ~1.8 s de mediana, cola larga
+        entry['confidence'].append(round(rng.betavariate(5, 2), 4))  # sesgada hacia confianza alta
+        if rng.random() < 0.01:
+            entry['confidence'][-1] = 0.0                              # puntuaciones nulas
+    return data
+
+
+def build_sketches(data):
+    """Un sketch por (día, equipo) y métrica, pasando por JSON como en el rollup"""
+    stored = {}
+    for key, entry in data.items():
+        stored[key] = {}
+        for metric in METRICS:
+            sketch = QuantileSketch()
+            for value in entry[metric]:
+                sketch.add(value)
+            stored[key][metric] = json.dumps(sketch.to_dict())
+    return stored
+
+
+def exact_quantile(sorted_values, q):
+    """Mismo rango que QuantileSketch.quantile: elemento floor(q * (n - 1))"""
+    return sorted_values[int(q * (len(sorted_values) - 1))]
+
+
+def relative_error(estimate, exact):
+    if exact == 0:
+        return abs(estimate)
+    return abs(estimate - exact) / abs(exact)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--teams', type=int, default=8)
+    parser.add_argument('--trials', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    data = generate(args.rows, args.days, args.teams, args.seed)
+    stored = build_sketches(data)
+    rng = random.Random(args.seed + 1)
+
+    # Margen para el redondeo en coma flotante de los límites de bucket
+    bound = DEFAULT_RELATIVE_ACCURACY * (1 + 1e-9)
+    worst = {metric: {q: 0.0 for q in DEFAULT_QUANTILES} for metric in METRICS}
+    merge_seconds = exact_seconds = 0.0
+
+    for _ in range(args.trials):
+        start = rng.randrange(args.days)
+        end = rng.randrange(start, args.days)
+        teams = set(rng.sample(range(args.teams), rng.randint(1, args.teams)))
+        keys = [key for key in stored if start <= key[0] <= end and key[1] in teams]
+        if not keys:
+            continue
+
+        for metric in METRICS:
+            started = time.perf_counter()
+            merged = merge_sketches(stored[key][metric] for key in keys)
+            estimates = {q: merged.quantile(q) for q in DEFAULT_QUANTILES}
+            merge_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            values = sorted(value for key in keys for value in data[key][metric])
+            exact = {q: exact_quantile(values, q) for q in DEFAULT_QUANTILES}
+            exact_seconds += time.perf_counter() - started
+
+            for q in DEFAULT_QUANTILES:
+                error = relative_error(estimates[q], exact[q])
+                worst[metric][q] = max(worst[metric][q], error)
+
+    failed = False
+    print(f"rows: {args.rows} | (day, team) sketches: {len(stored)} | trials: {args.trials} "
+          f"| bound: {DEFAULT_RELATIVE_ACCURACY:.2%}")
+    for metric in METRICS:
+        for q, error in worst[metric].items():
+            ok = error <= bound
+            failed |= not ok
+            print(f"{'✅' if ok else '❌'} {metric:<10} p{q * 100:g}: worst relative error {error:.4%}")
+    print(f"merge + quantiles: {merge_seconds * 1000:.1f} ms total | exact sort: {exact_seconds * 1000:.1f} ms total")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Perfil del cold start: tiempo de init de lambda_function por import
+Lanza N intérpretes nuevos con -X importtime, importa lambda_function y
+atiende un /health (la primera invocación, sin base de datos). Informa la
+mediana del init, el coste acumulado de cada import directo del módulo y los
+imports con más tiempo propio. Guarda el JSON en benchmarks/results/ para
+seguir el cold start entre versiones; con --compare falla (código 1) si el
+init empeora más que --threshold, y con --budget-ms si supera ese valor.
+
+Uso:
+    python benchmarks/startup_profile.py [--runs 15] [--top 15]
+    python benchmarks/startup_profile.py --compare benchmarks/results/startup-abc1234.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+TARGET = 'lambda_function'
+
+# Se ejecuta en cada intérprete nuevo; la última línea de stdout es el resultado
+PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import {TARGET}
+imported = time.perf_counter()
+{TARGET}.lambda_handler({{'rawPath': '/health', 'requestContext': {{'http': {{'method': 'GET'}}}}, 'headers': {{}}}}, None)
+handled = time.perf_counter()
+sys.stdout.write('\\n' + json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'init_ms': {TARGET}.INIT_MS,
+    'first_request_ms': (handled - imported) * 1000,
+    'modules': sorted(sys.modules)
+}}))
+"""
+
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def parse_importtime(stderr):
+    """[(módulo, profundidad, self_us, cumulative_us)] en el orden de -X importtime"""
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, len(indent) // 2, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def target_subtree(entries):
+    """
+    Imports de TARGET (él incluido): -X importtime escribe cada módulo después
+    de sus dependencias, así que son las líneas más indentadas justo antes de la suya
+    """
+    end = next(i for i, (name, depth, _, _) in enumerate(entries) if name == TARGET and depth == 0)
+    start = end
+    while start > 0 and entries[start - 1][1] > 0:
+        start -= 1
+    return entries[start:end + 1]
+
+
+def run_once():
+    env = {**os.environ, 'METRICS_FORMAT': 'off', 'LOG_LEVEL': 'WARNING', 'PYTHONDONTWRITEBYTECODE': '1'}
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=LAMBDA_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(proc.stderr)
+    return result
+
+
+def summarize(runs, top):
+    """Medianas por run: init, primera petición, imports directos de TARGET y mayores tiempos propios"""
+    direct, own = {}, {}
+    for run in runs:
+        for name, depth, self_us, cumulative_us in target_subtree(run['imports']):
+            if depth == 1:
+                direct.setdefault(name, []).append(cumulative_us / 1000)
+            own.setdefault(name, []).append(self_us / 1000)
+
+    median = lambda values: round(statistics.median(values), 2)  # noqa: E731
+    return {
+        'import_ms': median([run['import_ms'] for run in runs]),
+        'init_ms': median([run['init_ms'] for run in runs]),
+        'first_request_ms': median([run['first_request_ms'] for run in runs]),
+        'modules_loaded': len(runs[-1]['modules']),
+        'direct_imports': dict(sorted(
+            ((name, median(values)) for name, values in direct.items()),
+            key=lambda item: item[1], reverse=True
+        )),
+        'top_self': dict(sorted(
+            ((name, median(values)) for name, values in own.items()),
+            key=lambda item: item[1], reverse=True
+        )[:top])
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=LAMBDA_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--top', type=int, default=15, help="Imports con más tiempo propio a mostrar")
+    parser.add_argument('--output', help="Fichero JSON de resultados (por defecto benchmarks/results/)")
+    parser.add_argument('--compare', help="JSON de una ejecución anterior para comparar")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Empeoramiento del init que cuenta como regresión")
+    parser.add_argument('--budget-ms', type=float, help="Falla si la mediana del init supera este valor")
+    args = parser.parse_args()
+
+    summary = summarize([run_once() for _ in range(args.runs)], args.top)
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'runs': args.runs,
+            'python': platform.python_version()
+        },
+        **summary
+    }
+
+    print(f"init {results['init_ms']:.1f} ms | import {results['import_ms']:.1f} ms | "
+          f"first /health {results['first_request_ms']:.1f} ms | {results['modules_loaded']} modules")
+    print(f"\nImports directos de {TARGET} (acumulado, ms):")
+    for name, ms in results['direct_imports'].items():
+        print(f"  {name:<32} {ms:>8.2f}")
+    print("\nMás tiempo propio (ms):")
+    for name, ms in results['top_self'].items():
+        print(f"  {name:<32} {ms:>8.2f}")
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results', f"startup-{results['meta']['revision']}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results saved to {output}")
+
+    failed = False
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        change = (results['init_ms'] - baseline['init_ms']) / baseline['init_ms']
+        failed |= change > args.threshold
+        print(f"{'❌' if change > args.threshold else '✅'} init vs {baseline['meta'].get('revision')}: "
+              f"{baseline['init_ms']:.1f} -> {results['init_ms']:.1f} ms ({change:+.0%})")
+        for name, ms in results['direct_imports'].items():
+            before = baseline['direct_imports'].get(name)
+            if before is None:
+                print(f"  + {name:<30} {ms:>8.2f} ms (new import)")
+    if args.budget_ms is not None and results['init_ms'] > args.budget_ms:
+        failed = True
+        print(f"❌ init {results['init_ms']:.1f} ms over budget {args.budget_ms:.1f} ms")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
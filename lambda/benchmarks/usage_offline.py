@@ -0,0 +1,108 @@
+"""
+Modo offline de /usage: group-bys de NumPy frente a la agregación fila a fila
+Genera un export NDJSON sintético (mismos campos que /query-logs/export),
+calcula consultas y tokens por cada combinación de group_by con
+usage.offline_groups y con usage.merge_rows sobre filas agrupadas en Python,
+y falla (código 1) si alguna cifra difiere. Informa el tiempo de cada group-by.
+
+Uso: python benchmarks/usage_offline.py [--rows 500000] [--days 90] [--teams 12] [--persons 400]
+"""
+
+import argparse
+import gzip
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import usage  # noqa: E402
+
+
+def generate(path, rows, days, teams, persons, seed):
+    """NDJSON gzip con request_timestamp, team, person, model_id y tokens (~1% nulos)"""
+    rng = random.Random(seed)
+    first_day = date.today() - timedelta(days=days - 1)
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for i in range(rows):
+            person = min(int(rng.paretovariate(1.2)), persons) - 1
+            tokens_input = rng.randint(200, 4000)
+            tokens_output = rng.randint(50, 1500)
+            record = {
+                'query_id': str(i),
+                'request_timestamp': f"{first_day + timedelta(days=rng.randrange(days))}T{rng.randrange(24):02d}:00:00",
+                'person': f'Person {person}' if rng.random() > 0.01 else None,
+                'team': f'team-{person % teams}',
+                'model_id': 'claude-3-haiku',
+                'tokens_input': tokens_input,
+                'tokens_output': tokens_output if rng.random() > 0.01 else None,
+                'tokens_total': tokens_input + tokens_output
+            }
+            f.write(json.dumps(record) + '\n')
+    return first_day
+
+
+def reference_groups(columns, group_by, start_day, end_day):
+    """Agrupa en Python y pasa por merge_rows, como las filas de SQL del endpoint"""
+    sums = {}
+    for i, day in enumerate(columns['day']):
+        if not start_day.isoformat() <= day <= end_day.isoformat():
+            continue
+        key = tuple(date.fromisoformat(day) if name == 'day' else columns[name][i] for name in group_by)
+        entry = sums.setdefault(key, [0, 0, 0, 0])
+        entry[0] += 1
+        for j, measure in enumerate(usage.MEASURES[1:], start=1):
+            entry[j] += columns[measure][i]
+    sql_like_rows = [
+        {**{name: (value if value is not None else '') for name, value in zip(group_by, key)},
+         **dict(zip(usage.MEASURES, values))}
+        for key, values in sums.items()
+    ]
+    return usage.merge_rows([sql_like_rows], group_by)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--teams', type=int, default=12)
+    parser.add_argument('--persons', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.ndjson.gz')
+        first_day = generate(path, args.rows, args.days, args.teams, args.persons, args.seed)
+        started = time.perf_counter()
+        columns = usage.load_ndjson(path)
+        frame = usage.offline_frame(columns)
+        load_ms = (time.perf_counter() - started) * 1000
+
+    # Ventana que deja fuera el primer y el último día para probar el filtro de fechas
+    start_day = first_day + timedelta(days=1)
+    end_day = first_day + timedelta(days=args.days - 2)
+    print(f"rows: {args.rows} | days: {args.days} | teams: {args.teams} | load: {load_ms:.0f} ms")
+
+    failed = False
+    dimensions = usage.GROUP_DIMENSIONS
+    for size in range(len(dimensions) + 1):
+        for group_by in itertools.combinations(dimensions, size):
+            started = time.perf_counter()
+            offline = usage.offline_groups(frame, group_by, start_day, end_day)
+            offline_ms = (time.perf_counter() - started) * 1000
+            expected = reference_groups(columns, group_by, start_day, end_day)
+            ok = offline == expected
+            failed |= not ok
+            label = ','.join(group_by) or '(total)'
+            print(f"{'✅' if ok else '❌'} {label:<24} {len(offline):>7} groups | numpy {offline_ms:8.1f} ms")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
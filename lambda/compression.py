@@ -0,0 +1,106 @@
+"""
+Dashboard Lambda - Compresión de respuestas
+Negocia gzip/br con Accept-Encoding y comprime los cuerpos por encima de un
+umbral. Lambda URL exige el cuerpo binario en base64 con isBase64Encoded.
+"""
+
+import base64
+import os
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+# Límite de Lambda: 6 MB de payload; dejamos margen para cabeceras
+MAX_RESPONSE_BYTES = int(os.environ.get('MAX_RESPONSE_BYTES', str(5 * 1024 * 1024)))
+
+_brotli = None
+
+
+def _get_brotli():
+    """brotli es opcional: solo se importa si el cliente lo acepta"""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli or None
+
+
+def parse_accept_encoding(header):
+    """'gzip;q=0.8, br' -> {'gzip': 0.8, 'br': 1.0}"""
+    encodings = {}
+    for part in (header or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+
+def choose_encoding(header):
+    """Mejor codificación soportada: br > gzip (None si ninguna)"""
+    accepted = parse_accept_encoding(header)
+    candidates = []
+    if _get_brotli() is not None:
+        candidates.append('br')
+    candidates.append('gzip')
+
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = accepted.get(name, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return _get_brotli().compress(data, quality=BROTLI_QUALITY)
+    import gzip  # solo cuando hay algo que comprimir
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response, accept_encoding):
+    """Comprime el cuerpo de response si el cliente lo acepta y supera el umbral"""
+    if response.get('isBase64Encoded') or response.get('statusCode') == 304:
+        return response
+    headers = response.get('headers') or {}
+    if 'Content-Encoding' in headers:
+        return response
+
+    body = response.get('body') or ''
+    raw = body.encode('utf-8')
+    if len(raw) < COMPRESSION_MIN_BYTES:
+        return response
+
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+
+    compressed = compress(raw, encoding)
+    return {
+        **response,
+        'headers': {
+            **headers,
+            'Content-Encoding': encoding,
+            'Vary': 'Accept-Encoding',
+            'X-Uncompressed-Length': str(len(raw))
+        },
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+
+def response_size(response):
+    """Bytes del cuerpo tal como viaja en la respuesta de Lambda"""
+    return len((response.get('body') or '').encode('utf-8'))
@@ -0,0 +1,356 @@
+"""
+Dashboard Lambda - Resumen incremental por conversación
+Mantiene web_queries_conversations: una fila por conversation_id_bedrock con
+turnos, tokens, primer y último turno, confianza media y herramientas usadas.
+El refresco programado suma las filas posteriores a su watermark (mismo
+esquema de lotes que el rollup diario); las lecturas combinan el resumen con
+las filas en bruto posteriores al watermark, así que nunca recorren el log entero.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+
+import rollup
+
+CONVERSATIONS_TABLE = 'web_queries_conversations'
+CONVERSATIONS_NAME = 'web_queries_conversations'
+
+# Presupuesto del refresco dentro del evento programado (después del rollup diario)
+CONVERSATIONS_MAX_SECONDS = float(os.environ.get('CONVERSATIONS_MAX_SECONDS', '60'))
+# Sin resumen (ROLLUP_MODE=off o aún no creado) se agregan los últimos N días en bruto
+CONVERSATIONS_FALLBACK_DAYS = int(os.environ.get('CONVERSATIONS_FALLBACK_DAYS', '30'))
+
+SCHEMA_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {CONVERSATIONS_TABLE} (
+        conversation_id text PRIMARY KEY,
+        session_token text,
+        person_name text,
+        app_name text,
+        turn_count bigint NOT NULL DEFAULT 0,
+        tokens_input bigint NOT NULL DEFAULT 0,
+        tokens_output bigint NOT NULL DEFAULT 0,
+        tokens_total bigint NOT NULL DEFAULT 0,
+        scored_count bigint NOT NULL DEFAULT 0,
+        confidence_sum double precision NOT NULL DEFAULT 0,
+        first_at timestamp NOT NULL,
+        last_at timestamp NOT NULL,
+        tools text[] NOT NULL DEFAULT '{{}}',
+        updated_at timestamptz NOT NULL DEFAULT now()
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_{CONVERSATIONS_TABLE}_recent
+        ON {CONVERSATIONS_TABLE} (last_at DESC, conversation_id DESC);
+    CREATE INDEX IF NOT EXISTS idx_{CONVERSATIONS_TABLE}_person
+        ON {CONVERSATIONS_TABLE} (person_name, last_at DESC, conversation_id DESC);
+    CREATE INDEX IF NOT EXISTS idx_{CONVERSATIONS_TABLE}_team
+        ON {CONVERSATIONS_TABLE} (app_name, last_at DESC, conversation_id DESC);
+"""
+
+SUMMARY_COLUMNS = (
+    'conversation_id', 'session_token', 'person_name', 'app_name',
+    'turn_count', 'tokens_input', 'tokens_output', 'tokens_total',
+    'scored_count', 'confidence_sum', 'first_at', 'last_at', 'tools'
+)
+ADDITIVE_COLUMNS = ('turn_count', 'tokens_input', 'tokens_output', 'tokens_total', 'scored_count')
+
+
+def ensure_schema(conn):
+    """Crea la tabla del resumen (y la de watermarks del rollup) si no existen"""
+    rollup.ensure_schema(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(SCHEMA_SQL)
+    conn.commit()
+
+
+def delta_query(start, end=None, conversation_id=None, person=None, team=None):
+    """
+    SQL + parámetros del resumen por conversación de las filas con created_at
+    en (start, end]. tools_used es un array JSON de nombres u objetos con 'name'.
+    """
+    clauses = ["created_at > %(start)s", "conversation_id_bedrock IS NOT NULL"]
+    params = {'start': start}
+    if end is not None:
+        clauses.append("created_at <= %(end)s")
+        params['end'] = end
+    if conversation_id is not None:
+        clauses.append("conversation_id_bedrock = %(conversation_id)s")
+        params['conversation_id'] = conversation_id
+    if person:
+        clauses.append("person_name = %(person)s")
+        params['person'] = person
+    if team:
+        clauses.append("app_name = %(team)s")
+        params['team'] = team
+
+    sql = f"""
+        WITH turns AS (
+            SELECT conversation_id_bedrock, session_token, person_name, app_name, created_at,
+                tokens_input, tokens_output, tokens_total, confidence_score, tools_used
+            FROM web_queries
+            WHERE {" AND ".join(clauses)}
+        ),
+        tools AS (
+            SELECT conversation_id_bedrock,
+                array_agg(DISTINCT tool ORDER BY tool) FILTER (WHERE tool IS NOT NULL) as tools
+            FROM turns
+            CROSS JOIN LATERAL jsonb_array_elements(
+                CASE WHEN jsonb_typeof(tools_used) = 'array' THEN tools_used ELSE '[]'::jsonb END
+            ) as item
+            CROSS JOIN LATERAL (SELECT COALESCE(item ->> 'name', item #>> '{{}}') as tool) named
+            GROUP BY conversation_id_bedrock
+        )
+        SELECT
+            turns.conversation_id_bedrock as conversation_id,
+            MAX(session_token) as session_token,
+            MAX(person_name) as person_name,
+            MAX(app_name) as app_name,
+            COUNT(*) as turn_count,
+            COALESCE(SUM(tokens_input), 0) as tokens_input,
+            COALESCE(SUM(tokens_output), 0) as tokens_output,
+            COALESCE(SUM(tokens_total), 0) as tokens_total,
+            COUNT(confidence_score) as scored_count,
+            COALESCE(SUM(confidence_score), 0)::double precision as confidence_sum,
+            MIN(created_at) as first_at,
+            MAX(created_at) as last_at,
+            COALESCE(tools.tools, '{{}}') as tools
+        FROM turns
+        LEFT JOIN tools ON tools.conversation_id_bedrock = turns.conversation_id_bedrock
+        GROUP BY turns.conversation_id_bedrock, tools.tools
+    """
+    return sql, params
+
+
+def merge(stored, delta):
+    """Combina una fila del resumen con el delta de la misma conversación (igual que el upsert)"""
+    if stored is None:
+        return dict(delta)
+    if delta is None:
+        return dict(stored)
+    merged = dict(stored)
+    for column in ('session_token', 'person_name', 'app_name'):
+        merged[column] = stored[column] if stored[column] is not None else delta[column]
+    for column in ADDITIVE_COLUMNS:
+        merged[column] = int(stored[column]) + int(delta[column])
+    merged['confidence_sum'] = float(stored['confidence_sum']) + float(delta['confidence_sum'])
+    merged['first_at'] = min(stored['first_at'], delta['first_at'])
+    merged['last_at'] = max(stored['last_at'], delta['last_at'])
+    merged['tools'] = sorted(set(stored['tools'] or ()) | set(delta['tools'] or ()))
+    return merged
+
+
+def to_response(summary):
+    """Fila del resumen -> objeto de la API"""
+    scored = int(summary['scored_count'])
+    return {
+        'conversation_id': summary['conversation_id'],
+        'session_token': summary['session_token'],
+        'person': summary['person_name'],
+        'team': summary['app_name'],
+        'turn_count': int(summary['turn_count']),
+        'tokens_input': int(summary['tokens_input']),
+        'tokens_output': int(summary['tokens_output']),
+        'tokens_total': int(summary['tokens_total']),
+        'avg_trust': float(summary['confidence_sum']) / scored if scored else None,
+        'scored_turns': scored,
+        'first_at': summary['first_at'],
+        'last_at': summary['last_at'],
+        'duration_seconds': (summary['last_at'] - summary['first_at']).total_seconds(),
+        'tools': list(summary['tools'] or ())
+    }
+
+
+# --- Refresco incremental -------------------------------------------------
+
+def _read_watermark(cursor):
+    cursor.execute(
+        "SELECT watermark FROM rollup_watermarks WHERE name = %s FOR UPDATE",
+        [CONVERSATIONS_NAME]
+    )
+    row = cursor.fetchone()
+    if row:
+        return row['watermark']
+
+    # Primera ejecución: empezamos justo antes de la fila más antigua
+    cursor.execute("SELECT (MIN(created_at) - interval '1 microsecond')::timestamptz as watermark FROM web_queries")
+    return cursor.fetchone()['watermark']
+
+
+def _upsert_delta(cursor, start, end):
+    """Suma al resumen las filas de (start, end] en una sola sentencia"""
+    sql, params = delta_query(start, end)
+    columns = ", ".join(SUMMARY_COLUMNS)
+    additive = ", ".join(f"{col} = t.{col} + EXCLUDED.{col}" for col in ADDITIVE_COLUMNS + ('confidence_sum',))
+    cursor.execute(f"""
+        INSERT INTO {CONVERSATIONS_TABLE} AS t ({columns})
+        SELECT {columns} FROM ({sql}) delta
+        ON CONFLICT (conversation_id) DO UPDATE SET
+            session_token = COALESCE(t.session_token, EXCLUDED.session_token),
+            person_name = COALESCE(t.person_name, EXCLUDED.person_name),
+            app_name = COALESCE(t.app_name, EXCLUDED.app_name),
+            {additive},
+            first_at = LEAST(t.first_at, EXCLUDED.first_at),
+            last_at = GREATEST(t.last_at, EXCLUDED.last_at),
+            tools = ARRAY(SELECT DISTINCT tool FROM unnest(t.tools || EXCLUDED.tools) as tool ORDER BY tool),
+            updated_at = now()
+    """, params)
+    return cursor.rowcount
+
+
+def refresh_conversations(conn, max_seconds=CONVERSATIONS_MAX_SECONDS):
+    """
+    Procesa las filas posteriores al watermark en lotes de ROLLUP_BATCH_HOURS,
+    con el mismo retraso que el rollup para no contar inserciones en vuelo.
+    Cada lote es una transacción (resumen + watermark se confirman juntos).
+    """
+    ensure_schema(conn)
+    started = time.monotonic()
+    summary = {'batches': 0, 'conversations': 0, 'watermark': None, 'caught_up': False}
+
+    while time.monotonic() - started < max_seconds:
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s)) as locked", [CONVERSATIONS_NAME])
+        if not cursor.fetchone()['locked']:
+            conn.rollback()
+            summary['skipped'] = 'locked'
+            break
+
+        watermark = _read_watermark(cursor)
+        if watermark is None:
+            conn.rollback()
+            summary['caught_up'] = True
+            break
+
+        cursor.execute("SELECT now() - %s * interval '1 second' as upper", [rollup.ROLLUP_LAG_SECONDS])
+        upper = cursor.fetchone()['upper']
+        batch_upper = min(upper, watermark + timedelta(hours=rollup.ROLLUP_BATCH_HOURS))
+        if batch_upper <= watermark:
+            conn.rollback()
+            summary['caught_up'] = True
+            break
+
+        upserted = _upsert_delta(cursor, watermark, batch_upper)
+        cursor.execute("""
+            INSERT INTO rollup_watermarks (name, watermark, updated_at)
+            VALUES (%s, %s, now())
+            ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = now()
+        """, [CONVERSATIONS_NAME, batch_upper])
+        conn.commit()
+
+        summary['batches'] += 1
+        summary['conversations'] += upserted
+        summary['watermark'] = batch_upper
+        if batch_upper >= upper:
+            summary['caught_up'] = True
+            break
+
+    return summary
+
+
+# --- Lecturas ---------------------------------------------------------------
+
+def summary_watermark(cursor):
+    """
+    Hasta dónde está sumado el resumen; None si está desactivado o aún no
+    existe (entonces las lecturas agregan CONVERSATIONS_FALLBACK_DAYS en bruto)
+    """
+    if rollup.ROLLUP_MODE == 'off':
+        return None
+    try:
+        cursor.execute("SELECT watermark FROM rollup_watermarks WHERE name = %s", [CONVERSATIONS_NAME])
+        row = cursor.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        cursor.connection.rollback()
+        return None
+    return row['watermark'] if row else None
+
+
+def _tail_start(watermark):
+    if watermark is not None:
+        return watermark
+    return datetime.now() - timedelta(days=CONVERSATIONS_FALLBACK_DAYS)
+
+
+def _stored_rows(cursor, conversation_ids):
+    if not conversation_ids:
+        return {}
+    cursor.execute(f"""
+        SELECT {", ".join(SUMMARY_COLUMNS)} FROM {CONVERSATIONS_TABLE}
+        WHERE conversation_id = ANY(%s)
+    """, [list(conversation_ids)])
+    return {row['conversation_id']: row for row in cursor.fetchall()}
+
+
+def get_conversation(conn, conversation_id):
+    """
+    (resumen, watermark) de una conversación: su fila del resumen (PK) más
+    sus turnos posteriores al watermark (índice por conversación). None si no existe.
+    """
+    cursor = conn.cursor()
+    watermark = summary_watermark(cursor)
+    stored = _stored_rows(cursor, [conversation_id]).get(conversation_id) if watermark is not None else None
+
+    sql, params = delta_query(_tail_start(watermark), conversation_id=conversation_id)
+    cursor.execute(sql, params)
+    delta = cursor.fetchone()
+
+    if stored is None and delta is None:
+        return None, watermark
+    return merge(stored, delta), watermark
+
+
+def list_conversations(conn, person=None, team=None, start=None, end=None, after=None, limit=50):
+    """
+    Conversaciones por last_at DESC, conversation_id DESC (keyset con after).
+    start / end: activas en [start, end) (last_at >= start, first_at < end).
+
+    Las conversaciones con turnos posteriores al watermark tienen last_at > watermark
+    y todas las demás last_at <= watermark: primero van las del delta (combinadas
+    con su fila del resumen) y después las del resumen, con un único orden.
+    Devuelve (filas, hay_más, watermark).
+    """
+    cursor = conn.cursor()
+    watermark = summary_watermark(cursor)
+
+    def visible(row):
+        return ((start is None or row['last_at'] >= start)
+                and (end is None or row['first_at'] < end)
+                and (after is None or (row['last_at'], row['conversation_id']) < after))
+
+    sql, params = delta_query(_tail_start(watermark), person=person, team=team)
+    cursor.execute(sql, params)
+    tail = {row['conversation_id']: row for row in cursor.fetchall()}
+    stored = _stored_rows(cursor, tail) if watermark is not None else {}
+    rows = [merge(stored.get(key), delta) for key, delta in tail.items()]
+    rows = sorted((row for row in rows if visible(row)),
+                  key=lambda row: (row['last_at'], row['conversation_id']), reverse=True)[:limit + 1]
+
+    if watermark is not None and len(rows) <= limit:
+        clauses = ["NOT (conversation_id = ANY(%s))"]
+        params = [list(tail)]
+        for column, value in (('person_name', person), ('app_name', team)):
+            if value:
+                clauses.append(f"{column} = %s")
+                params.append(value)
+        if start is not None:
+            clauses.append("last_at >= %s")
+            params.append(start)
+        if end is not None:
+            clauses.append("first_at < %s")
+            params.append(end)
+        if after is not None:
+            clauses.append("(last_at, conversation_id) < (%s, %s)")
+            params.extend(after)
+        params.append(limit + 1 - len(rows))
+        cursor.execute(f"""
+            SELECT {", ".join(SUMMARY_COLUMNS)} FROM {CONVERSATIONS_TABLE}
+            WHERE {" AND ".join(clauses)}
+            ORDER BY last_at DESC, conversation_id DESC
+            LIMIT %s
+        """, params)
+        rows.extend(cursor.fetchall())
+
+    return rows[:limit], len(rows) > limit, watermark
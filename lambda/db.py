@@ -0,0 +1,463 @@
+"""
+Dashboard Lambda - Pool de conexiones PostgreSQL
+Mantiene las conexiones a RDS a nivel de módulo para reutilizarlas entre
+invocaciones "warm" del mismo contenedor Lambda.
+Las peticiones del dashboard se ejecutan dentro de una sesión (db_session):
+transacciones de solo lectura, statement_timeout por endpoint y, si hay
+réplica configurada (DB_REPLICA_HOST), conexiones a la réplica con
+failover al primario. Fuera de una sesión (rollup, migraciones) se usa el
+primario en lectura/escritura y sin límite de tiempo.
+"""
+
+import json
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+import instrumentation
+from instrumentation import TimedCursor, TimedRealDictCursor
+
+# Configuración de base de datos desde variables de entorno
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'rag-postgres.czuimyk2qu10.eu-west-1.rds.amazonaws.com'),
+    'database': os.environ.get('DB_NAME', 'ragdb'),
+    'user': os.environ.get('DB_USER', 'raguser'),
+    'password': os.environ.get('DB_PASSWORD', 'RAGSystem2025!'),
+    'port': int(os.environ.get('DB_PORT', '5432'))
+}
+
+# Réplica de lectura para los handlers del dashboard; sin DB_REPLICA_HOST todo va al primario
+REPLICA_CONFIG = {
+    **DB_CONFIG,
+    'host': os.environ['DB_REPLICA_HOST'],
+    'port': int(os.environ.get('DB_REPLICA_PORT', DB_CONFIG['port']))
+} if os.environ.get('DB_REPLICA_HOST') else None
+# Tras un fallo de conexión a la réplica, segundos que se usa el primario antes de reintentarla
+REPLICA_RETRY_SECONDS = float(os.environ.get('DB_REPLICA_RETRY_SECONDS', '30'))
+
+# statement_timeout (ms) por endpoint normalizado; el resto usa STATEMENT_TIMEOUT_MS
+DEFAULT_STATEMENT_TIMEOUTS_MS = {
+    '/analytics': 10000,
+    '/filters': 5000,
+    '/query-logs': 5000,
+    '/query-logs/{id}': 3000,
+    '/query-logs/export': 60000,
+    '/user-metrics': 10000,
+    '/team-metrics': 10000,
+    '/trust-analytics': 15000,
+    '/percentiles': 10000,
+    '/conversations': 5000,
+    '/conversations/{id}': 3000,
+    '/usage': 10000
+}
+STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '10000'))
+# JSON opcional que sustituye valores de DEFAULT_STATEMENT_TIMEOUTS_MS, p.ej. {"/trust-analytics": 20000}
+STATEMENT_TIMEOUTS_MS = {
+    **DEFAULT_STATEMENT_TIMEOUTS_MS,
+    **json.loads(os.environ.get('DB_STATEMENT_TIMEOUTS_MS', '{}'))
+}
+# Margen que se deja antes del timeout de la Lambda para responder (caché o parcial)
+DEADLINE_MARGIN_MS = int(os.environ.get('DB_DEADLINE_MARGIN_MS', '1500'))
+
+# Configuración del pool
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_MAX_IDLE_SECONDS = float(os.environ.get('DB_POOL_MAX_IDLE_SECONDS', '300'))
+POOL_MAX_LIFETIME_SECONDS = float(os.environ.get('DB_POOL_MAX_LIFETIME_SECONDS', '3600'))
+# Conexiones ociosas más tiempo que esto se validan con SELECT 1 antes de reutilizarse
+POOL_PING_AFTER_SECONDS = float(os.environ.get('DB_POOL_PING_AFTER_SECONDS', '30'))
+CONNECT_TIMEOUT_SECONDS = int(os.environ.get('DB_CONNECT_TIMEOUT_SECONDS', '5'))
+# Consultas simultáneas por contenedor (protege a RDS cuando /batch y los handlers se combinan)
+QUERY_CONCURRENCY = int(os.environ.get('DB_QUERY_CONCURRENCY', '3'))
+
+
+class _PooledConnection:
+    """Conexión del pool con sus marcas de tiempo"""
+
+    __slots__ = ('conn', 'created_at', 'last_used_at', 'statement_timeout')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used_at = now
+        # Valor de statement_timeout (ms) fijado en la sesión; 0 = sin límite (el del servidor)
+        self.statement_timeout = 0
+
+
+class ConnectionPool:
+    """
+    Pool LIFO de conexiones psycopg2 creado de forma perezosa.
+    - Descarta conexiones cerradas, rotas o que superan el idle/lifetime máximo
+    - Valida con SELECT 1 las conexiones que llevan un rato ociosas
+    - Lleva contadores de hits/misses para /health
+    """
+
+    def __init__(self, config, max_size=POOL_MAX_SIZE,
+                 max_idle=POOL_MAX_IDLE_SECONDS,
+                 max_lifetime=POOL_MAX_LIFETIME_SECONDS,
+                 ping_after=POOL_PING_AFTER_SECONDS):
+        self.config = config
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._idle = []
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'reconnects': 0,
+            'discarded': 0
+        }
+
+    def _connect(self):
+        conn = psycopg2.connect(
+            **self.config,
+            cursor_factory=TimedRealDictCursor,
+            connect_timeout=CONNECT_TIMEOUT_SECONDS
+        )
+        return _PooledConnection(conn)
+
+    def _is_usable(self, pooled):
+        """Comprueba si una conexión ociosa puede reutilizarse"""
+        conn = pooled.conn
+        if conn.closed:
+            return False
+
+        now = time.monotonic()
+        if now - pooled.last_used_at > self.max_idle:
+            return False
+        if now - pooled.created_at > self.max_lifetime:
+            return False
+
+        if now - pooled.last_used_at > self.ping_after:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+
+        return True
+
+    def _discard(self, pooled):
+        with self._lock:
+            self.stats['discarded'] += 1
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Obtiene una conexión del pool (o abre una nueva)"""
+        while True:
+            with self._lock:
+                pooled = self._idle.pop() if self._idle else None
+                self._in_use += 1
+
+            if pooled is None:
+                break
+
+            if self._is_usable(pooled):
+                with self._lock:
+                    self.stats['hits'] += 1
+                return pooled
+
+            # Conexión caducada o rota: la descartamos y probamos la siguiente
+            self._discard(pooled)
+            with self._lock:
+                self.stats['reconnects'] += 1
+                self._in_use -= 1
+
+        with self._lock:
+            self.stats['misses'] += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            raise
+
+    def release(self, pooled, broken=False):
+        """Devuelve una conexión al pool dejando la sesión limpia"""
+        conn = pooled.conn
+
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        with self._lock:
+            self._in_use -= 1
+            keep = not broken and not conn.closed and len(self._idle) < self.max_size
+            if keep:
+                pooled.last_used_at = time.monotonic()
+                self._idle.append(pooled)
+
+        if not keep:
+            self._discard(pooled)
+
+    def close_all(self):
+        """Cierra todas las conexiones ociosas"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled)
+
+    def get_stats(self):
+        """Estadísticas del pool para /health"""
+        # Contadores y ocupación leídos juntos bajo el lock (los threads de run_concurrently los actualizan)
+        with self._lock:
+            idle = len(self._idle)
+            in_use = self._in_use
+            stats = dict(self.stats)
+        requests = stats['hits'] + stats['misses']
+        return {
+            **stats,
+            'idle': idle,
+            'in_use': in_use,
+            'max_size': self.max_size,
+            'hit_ratio': round(stats['hits'] / requests, 4) if requests else 0.0
+        }
+
+
+# Pools a nivel de módulo: sobreviven entre invocaciones warm
+_pools = {}
+_pool_lock = threading.Lock()
+_replica_down_until = 0.0
+
+
+def get_pool(target='primary'):
+    """Devuelve el pool del contenedor para 'primary' o 'replica', creándolo en el primer uso"""
+    pool = _pools.get(target)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(target)
+            if pool is None:
+                pool = _pools[target] = ConnectionPool(REPLICA_CONFIG if target == 'replica' else DB_CONFIG)
+    return pool
+
+
+# --- Sesión de la petición (por hilo) ---------------------------------------
+
+_local = threading.local()
+
+
+class Session:
+    """Cómo se conecta una petición: solo lectura, timeout y límite de tiempo de la invocación"""
+
+    __slots__ = ('endpoint', 'read_only', 'timeout_ms', 'deadline')
+
+    def __init__(self, endpoint=None, read_only=False, timeout_ms=0, deadline=None):
+        self.endpoint = endpoint
+        self.read_only = read_only
+        self.timeout_ms = timeout_ms
+        self.deadline = deadline
+
+    def effective_timeout_ms(self):
+        """timeout del endpoint, recortado para terminar antes que la invocación"""
+        if self.deadline is None:
+            return self.timeout_ms
+        remaining = int((self.deadline - time.monotonic()) * 1000) - DEADLINE_MARGIN_MS
+        remaining = max(remaining, 100)
+        return min(self.timeout_ms, remaining) if self.timeout_ms else remaining
+
+
+_DEFAULT_SESSION = Session()
+
+
+def current_session():
+    return getattr(_local, 'session', None) or _DEFAULT_SESSION
+
+
+@contextmanager
+def db_session(endpoint=None, read_only=True, remaining_ms=None, deadline=None, session=None):
+    """
+    Las conexiones del bloque son de solo lectura, con el statement_timeout del
+    endpoint y, si hay réplica, contra la réplica. remaining_ms (tiempo restante
+    de la Lambda) o deadline (time.monotonic()) acotan el timeout. Los hilos de
+    trabajo reciben la sesión con session=current_session().
+    """
+    if session is None:
+        if remaining_ms:
+            deadline = time.monotonic() + remaining_ms / 1000
+        session = Session(
+            endpoint=endpoint,
+            read_only=read_only,
+            timeout_ms=STATEMENT_TIMEOUTS_MS.get(endpoint, STATEMENT_TIMEOUT_MS),
+            deadline=deadline
+        )
+    previous = getattr(_local, 'session', None)
+    _local.session = session
+    try:
+        yield session
+    finally:
+        _local.session = previous
+
+
+def _prepare(pooled, session):
+    """Aplica la sesión a la conexión: solo lectura (sin round-trip) y statement_timeout si cambia"""
+    conn = pooled.conn
+    if conn.readonly != session.read_only:
+        conn.readonly = session.read_only
+    timeout_ms = session.effective_timeout_ms()
+    if pooled.statement_timeout != timeout_ms:
+        with conn.cursor() as cursor:
+            cursor.execute("SET statement_timeout = %s", [timeout_ms])
+        # Se confirma para que el SET sobreviva al rollback con el que se devuelve la conexión
+        conn.commit()
+        pooled.statement_timeout = timeout_ms
+
+
+def _acquire(session):
+    """(pool, conexión, target): réplica para las sesiones de solo lectura si está disponible"""
+    global _replica_down_until
+    if session.read_only and REPLICA_CONFIG and time.monotonic() >= _replica_down_until:
+        pool = get_pool('replica')
+        try:
+            return pool, pool.acquire(), 'replica'
+        except psycopg2.OperationalError as e:
+            _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+            print(f"⚠️ Replica unavailable, using primary for {REPLICA_RETRY_SECONDS:.0f}s: {e}")
+    pool = get_pool('primary')
+    return pool, pool.acquire(), 'primary'
+
+
+@contextmanager
+def db_connection():
+    """
+    Context manager que presta una conexión del pool según la sesión actual.
+    Si el bloque falla por un error de conexión, la conexión se descarta
+    (y si era de la réplica, las siguientes van al primario un tiempo).
+    """
+    global _replica_down_until
+    session = current_session()
+    started = time.perf_counter()
+    pool, pooled, target = _acquire(session)
+    broken = False
+    try:
+        _prepare(pooled, session)
+    except psycopg2.Error:
+        pool.release(pooled, broken=True)
+        raise
+    instrumentation.record_acquire((time.perf_counter() - started) * 1000, target)
+    try:
+        yield pooled.conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        # QueryCanceled (statement_timeout) también es OperationalError pero la conexión sigue sana
+        if not isinstance(e, psycopg2.errors.QueryCanceled):
+            broken = True
+            if target == 'replica':
+                _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+        raise
+    finally:
+        pool.release(pooled, broken=broken)
+
+
+def is_timeout(error):
+    """True si la consulta se canceló por statement_timeout"""
+    return isinstance(error, psycopg2.errors.QueryCanceled)
+
+
+def get_pool_stats():
+    """Estadísticas del pool primario (vacías si aún no se ha creado), con las de la réplica si la hay"""
+    pool = _pools.get('primary')
+    if pool is None:
+        stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'discarded': 0,
+                 'idle': 0, 'in_use': 0, 'max_size': POOL_MAX_SIZE, 'hit_ratio': 0.0}
+    else:
+        stats = pool.get_stats()
+    if REPLICA_CONFIG:
+        replica = _pools.get('replica')
+        stats['replica'] = {
+            **(replica.get_stats() if replica else {}),
+            'available': time.monotonic() >= _replica_down_until
+        }
+    return stats
+
+
+def tuple_cursor(conn, name=None):
+    """Cursor que devuelve tuplas (sin el coste de RealDictCursor) para los encoders de filas"""
+    if name is not None:
+        return conn.cursor(name=name, cursor_factory=TimedCursor)
+    return conn.cursor(cursor_factory=TimedCursor)
+
+
+_query_slots = threading.BoundedSemaphore(max(1, QUERY_CONCURRENCY))
+
+
+def query_task(sql, params=None):
+    """Tarea para run_concurrently: ejecuta sql y devuelve todas las filas"""
+    def task(cursor):
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    return task
+
+
+def run_concurrently(tasks, label='queries', max_workers=None, allow_partial=False):
+    """
+    Ejecuta consultas independientes en paralelo, cada una con su propia
+    conexión del pool (psycopg2 no admite dos consultas a la vez en una conexión).
+    tasks: {nombre: función(cursor) -> resultado}. Devuelve {nombre: resultado}.
+    El semáforo global limita las consultas simultáneas del contenedor a QUERY_CONCURRENCY.
+    Con allow_partial, una tarea cancelada por statement_timeout devuelve None
+    en lugar de hacer fallar a las demás.
+    """
+    workers = max(1, min(max_workers or QUERY_CONCURRENCY, len(tasks)))
+    timings = {}
+    started = time.perf_counter()
+
+    # Las sentencias de cada tarea se etiquetan con el handler que llama y el nombre de la tarea
+    handler, _ = instrumentation.current_tags()
+    statement_prefix = f"{label}." if label else ''
+    session = current_session()
+
+    def cancelled(name, error, conn):
+        if not (allow_partial and is_timeout(error)):
+            raise error
+        print(f"⚠️ {label}.{name} cancelled by statement_timeout, returning partial results")
+        conn.rollback()
+        return None
+
+    if workers == 1:
+        # Sin paralelismo: todas las consultas en la misma conexión
+        results = {}
+        with _query_slots, db_connection() as conn:
+            cursor = conn.cursor()
+            for name, task in tasks.items():
+                task_started = time.perf_counter()
+                with instrumentation.tags(handler, statement_prefix + name):
+                    try:
+                        results[name] = task(cursor)
+                    except psycopg2.Error as e:
+                        results[name] = cancelled(name, e, conn)
+                timings[name] = round((time.perf_counter() - task_started) * 1000, 2)
+    else:
+        # concurrent.futures (y logging) solo en las rutas que paralelizan
+        from concurrent.futures import ThreadPoolExecutor
+
+        def run(name, task):
+            with _query_slots, db_session(session=session), instrumentation.tags(handler, statement_prefix + name):
+                task_started = time.perf_counter()
+                with db_connection() as conn:
+                    try:
+                        result = task(conn.cursor())
+                    except psycopg2.Error as e:
+                        result = cancelled(name, e, conn)
+                timings[name] = round((time.perf_counter() - task_started) * 1000, 2)
+            return result
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(run, name, task) for name, task in tasks.items()}
+            results = {name: future.result() for name, future in futures.items()}
+
+    wall_ms = round((time.perf_counter() - started) * 1000, 2)
+    instrumentation.log('DEBUG', f"⏱️ {label}: {timings} (wall {wall_ms} ms, workers={workers})")
+    return results
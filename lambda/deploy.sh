@@ -10,6 +10,12 @@ echo "🚀 Desplegando Lambda con conexión directa a RDS..."
 # Variables
 LAMBDA_FUNCTION_NAME="dashboard-proxy-rag"
 REGION="eu-west-1"
+# Runtime de la función: las dependencias se descargan para esta versión y plataforma
+PYTHON_VERSION="${PYTHON_VERSION:-3.11}"
+PLATFORM="${PLATFORM:-manylinux2014_x86_64}"
+# SKIP_DEPS=1: solo el código (dependencias desde una Lambda layer)
+SKIP_DEPS="${SKIP_DEPS:-0}"
+BUILD_DIR="build"
 
 # Colores
 GREEN='\033[0;32m'
@@ -17,8 +23,37 @@ YELLOW='\033[1;33m'
 NC='\033[0m'
 
 echo -e "${YELLOW}📦 Paso 1: Creando archivo ZIP...${NC}"
-rm -f lambda-deployment.zip
-zip lambda-deployment.zip lambda_function.py
+rm -rf "$BUILD_DIR" lambda-deployment.zip
+mkdir -p "$BUILD_DIR"
+
+# Solo los módulos de la Lambda (benchmarks/ y los scripts no se despliegan)
+cp *.py "$BUILD_DIR"/
+
+if [ "$SKIP_DEPS" != "1" ]; then
+    # Wheels binarios para el runtime de Lambda, sin compilar nada en local
+    pip install -q -r requirements.txt --target "$BUILD_DIR" \
+        --only-binary=:all: --platform "$PLATFORM" \
+        --python-version "$PYTHON_VERSION" --implementation cp --no-compile
+
+    # Fuera lo que no se usa en ejecución: metadatos, tests, stubs y cachés
+    find "$BUILD_DIR" -type d \( -name '*.dist-info' -o -name 'tests' -o -name '__pycache__' \) -prune -exec rm -rf {} +
+    find "$BUILD_DIR" -type f \( -name '*.pyi' -o -name '*.c' -o -name '*.h' -o -name '*.md' \) -delete
+    # Símbolos de depuración de las extensiones nativas (psycopg2, libpq, libssl)
+    if command -v strip >/dev/null; then
+        find "$BUILD_DIR" -name '*.so*' -type f -exec strip --strip-unneeded {} + 2>/dev/null || true
+    fi
+fi
+
+# Bytecode precompilado: /var/task es de solo lectura y sin .pyc cada cold start compila los .py.
+# Solo sirve si la versión local coincide con la del runtime.
+if [ "$(python3 -c 'import sys; print(f"{sys.version_info[0]}.{sys.version_info[1]}")')" = "$PYTHON_VERSION" ]; then
+    python3 -m compileall -q -j 0 --invalidation-mode unchecked-hash "$BUILD_DIR"
+else
+    echo -e "${YELLOW}⚠️ python3 local != $PYTHON_VERSION: se despliega sin .pyc${NC}"
+fi
+
+(cd "$BUILD_DIR" && zip -q -r -9 ../lambda-deployment.zip .)
+echo "📏 Paquete: $(du -h lambda-deployment.zip | cut -f1)"
 
 echo -e "${YELLOW}📦 Paso 2: Actualizando función Lambda...${NC}"
 aws lambda update-function-code \
@@ -43,6 +78,6 @@ echo -e "\n${GREEN}✅ Despliegue completado!${NC}"
 echo -e "${GREEN}🌐 Lambda URL: $LAMBDA_URL${NC}"
 
 echo -e "\n${YELLOW}🧹 Limpiando...${NC}"
-rm lambda-deployment.zip
+rm -rf lambda-deployment.zip "$BUILD_DIR"
 
 echo -e "${GREEN}✨ ¡Listo!${NC}"
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""
+Dashboard Lambda - Catálogo de valores de filtro (personas y equipos)
+- web_queries_dimensions: tabla pequeña (dimension, value) mantenida por el
+  refresco programado con un upsert de las filas posteriores a su último last_seen
+- En memoria: el contenedor carga el catálogo una vez y después solo consulta
+  las filas con created_at posterior a su watermark (un rango del índice)
+Así /filters no recorre web_queries entera aunque la tabla crezca.
+"""
+
+import bisect
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+
+DIMENSIONS_TABLE = 'web_queries_dimensions'
+# Columnas de web_queries que se catalogan
+DIMENSIONS = ('person_name', 'app_name')
+# Cada cuánto se consulta el delta desde el watermark (segundos)
+DIMENSIONS_MEMO_SECONDS = float(os.environ.get('DIMENSIONS_MEMO_SECONDS', '60'))
+# Solape al releer desde el watermark: cubre inserciones que confirman tarde
+DIMENSIONS_OVERLAP_SECONDS = int(os.environ.get('DIMENSIONS_OVERLAP_SECONDS', '300'))
+OVERLAP = timedelta(seconds=DIMENSIONS_OVERLAP_SECONDS)
+
+SCHEMA_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {DIMENSIONS_TABLE} (
+        dimension text NOT NULL,
+        value text NOT NULL,
+        first_seen timestamp NOT NULL,
+        last_seen timestamp NOT NULL,
+        PRIMARY KEY (dimension, value)
+    );
+"""
+
+# Valores distintos por dimensión con created_at > %(since)s (usa el índice de created_at)
+DELTA_SQL = " UNION ALL ".join(
+    f"""
+    SELECT '{column}' as dimension, {column} as value,
+        MIN(created_at) as first_seen, MAX(created_at) as last_seen
+    FROM web_queries
+    WHERE created_at > %(since)s AND {column} IS NOT NULL
+    GROUP BY {column}
+    """
+    for column in DIMENSIONS
+)
+
+
+def ensure_schema(conn):
+    """Crea la tabla del catálogo si no existe"""
+    with conn.cursor() as cursor:
+        cursor.execute(SCHEMA_SQL)
+    conn.commit()
+
+
+def refresh_dimensions(conn):
+    """
+    Upsert de los valores vistos desde el último last_seen (menos el solape).
+    La primera ejecución recorre web_queries completa una sola vez.
+    """
+    ensure_schema(conn)
+    started = time.monotonic()
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT MAX(last_seen) as last_seen FROM {DIMENSIONS_TABLE}")
+        last_seen = cursor.fetchone()['last_seen']
+        since = last_seen - OVERLAP if last_seen else datetime.min
+        cursor.execute(f"""
+            INSERT INTO {DIMENSIONS_TABLE} (dimension, value, first_seen, last_seen)
+            SELECT dimension, value, first_seen, last_seen FROM ({DELTA_SQL}) delta
+            ON CONFLICT (dimension, value) DO UPDATE SET
+                first_seen = LEAST({DIMENSIONS_TABLE}.first_seen, EXCLUDED.first_seen),
+                last_seen = GREATEST({DIMENSIONS_TABLE}.last_seen, EXCLUDED.last_seen)
+        """, {'since': since})
+        upserted = cursor.rowcount
+    conn.commit()
+    return {'upserted': upserted, 'since': since, 'seconds': round(time.monotonic() - started, 2)}
+
+
+class DimensionValues:
+    """Valores ordenados sin distinguir mayúsculas, con búsqueda por prefijo en O(log n + k)"""
+
+    def __init__(self, values=()):
+        self._keys = []
+        self._values = []
+        self._seen = set()
+        self.update(values)
+
+    def update(self, values):
+        new = [value for value in values if value not in self._seen]
+        if not new:
+            return
+        self._seen.update(new)
+        pairs = sorted(zip(self._keys + [v.casefold() for v in new], self._values + new))
+        self._keys = [key for key, _ in pairs]
+        self._values = [value for _, value in pairs]
+
+    def search(self, prefix='', limit=None):
+        if not prefix:
+            return self._values[:limit] if limit else list(self._values)
+        key = prefix.casefold()
+        start = bisect.bisect_left(self._keys, key)
+        result = []
+        for i in range(start, len(self._keys)):
+            if not self._keys[i].startswith(key) or (limit and len(result) >= limit):
+                break
+            result.append(self._values[i])
+        return result
+
+    def __len__(self):
+        return len(self._values)
+
+
+class DimensionCatalog:
+    """Catálogo en memoria del contenedor, al día desde el watermark de created_at"""
+
+    def __init__(self):
+        self.values = {column: DimensionValues() for column in DIMENSIONS}
+        self.watermark = None
+        self.checked_at = None
+        self._lock = threading.Lock()
+
+    def _add_rows(self, rows):
+        grouped = {column: [] for column in DIMENSIONS}
+        for row in rows:
+            grouped[row['dimension']].append(row['value'])
+            if self.watermark is None or row['last_seen'] > self.watermark:
+                self.watermark = row['last_seen']
+        for column, values in grouped.items():
+            self.values[column].update(values)
+
+    def refresh(self, cursor):
+        """
+        Primera vez: carga la tabla del catálogo completa. Después: solo el delta
+        desde el watermark. Devuelve False si la tabla aún no existe o está vacía.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.checked_at is not None and now - self.checked_at < DIMENSIONS_MEMO_SECONDS:
+                return True
+
+            if self.watermark is None:
+                try:
+                    cursor.execute(f"SELECT dimension, value, last_seen FROM {DIMENSIONS_TABLE}")
+                except psycopg2.errors.UndefinedTable:
+                    cursor.connection.rollback()
+                    return False
+                self._add_rows(cursor.fetchall())
+                if self.watermark is None:
+                    return False
+
+            cursor.execute(f"SELECT * FROM ({DELTA_SQL}) delta", {
+                'since': self.watermark - OVERLAP
+            })
+            self._add_rows(cursor.fetchall())
+            self.checked_at = now
+            return True
+
+    def search(self, column, prefix='', limit=None):
+        return self.values[column].search(prefix, limit)
+
+
+# Catálogo a nivel de módulo: sobrevive entre invocaciones warm
+_catalog = DimensionCatalog()
+
+
+def get_catalog():
+    return _catalog
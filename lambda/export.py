@@ -0,0 +1,113 @@
+"""
+Dashboard Lambda - Exportación masiva de query logs
+Lee web_queries con un cursor de servidor (named cursor + itersize) y genera
+NDJSON o CSV por trozos, opcionalmente comprimidos con gzip, sin cargar el
+resultado completo en memoria.
+"""
+
+import csv
+import io
+import os
+import zlib
+from datetime import date, datetime
+
+from compression import MAX_RESPONSE_BYTES
+from db import tuple_cursor
+from serialization import dumps
+
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '2000'))
+# Margen para lo que llega después de comprobar el tope: la última fila y el
+# flush del compresor gzip (que retiene datos hasta completar un bloque)
+EXPORT_MARGIN_BYTES = int(os.environ.get('EXPORT_MARGIN_BYTES', str(256 * 1024)))
+# Tope de bytes (ya comprimidos) por respuesta. El cuerpo gzip viaja en base64
+# (4/3 del tamaño), así que el tope se deriva de MAX_RESPONSE_BYTES en base64
+EXPORT_MAX_BYTES = int(os.environ.get(
+    'EXPORT_MAX_BYTES', str(MAX_RESPONSE_BYTES * 3 // 4 - EXPORT_MARGIN_BYTES)
+))
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+# listed: las mismas filas que /query-logs | all: también las que no tienen persona, equipo o categoría
+EXPORT_SCOPES = ('listed', 'all')
+
+
+def iter_rows(conn, query, params, itersize=EXPORT_ITERSIZE):
+    """Itera las filas (tuplas) de query con un cursor de servidor"""
+    cursor = tuple_cursor(conn, name='query_logs_export')
+    cursor.itersize = itersize
+    try:
+        cursor.execute(query, params)
+        for row in cursor:
+            yield row
+    finally:
+        cursor.close()
+
+
+def ndjson_chunks(items):
+    """Una línea JSON por fila"""
+    for item in items:
+        yield dumps(item) + '\n'
+
+
+def csv_value(value):
+    """JSON para objetos/listas, ISO 8601 para fechas, el valor tal cual para el resto"""
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(items, columns):
+    """Cabecera + una línea CSV por fila"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    yield buffer.getvalue()
+
+    for item in items:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([csv_value(item.get(column)) for column in columns])
+        yield buffer.getvalue()
+
+
+def encode_chunks(chunks, compress=False, level=6):
+    """Codifica a UTF-8 y, si se pide, comprime en gzip de forma incremental"""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> cabecera gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class ExportBuffer:
+    """
+    Acumula trozos codificados hasta max_bytes.
+    Si se supera el tope, la exportación se corta y se devuelve un cursor de continuación.
+    """
+
+    def __init__(self, max_bytes=EXPORT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.size += len(data)
+
+    @property
+    def full(self):
+        return self.size >= self.max_bytes
+
+    def getvalue(self):
+        return b''.join(self.parts)
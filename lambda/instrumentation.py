@@ -0,0 +1,329 @@
+"""
+Dashboard Lambda - Instrumentación
+- Traza por invocación: adquisición de conexión, cada sentencia SQL (con su
+  handler y nombre), fetch de filas, serialización y tamaño de respuesta
+- Una línea JSON por petición al terminar (o CloudWatch EMF con METRICS_FORMAT=emf)
+- Ventanas deslizantes por endpoint y por sentencia para /metrics (p50/p95 del
+  contenedor warm)
+- LOG_LEVEL controla los logs verbosos (p.ej. el evento completo solo en DEBUG)
+- La primera petición de cada contenedor se marca como cold_start con el init_ms del módulo
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+
+LOG_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_LEVEL = LOG_LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), 20)
+# json: una línea JSON por petición | emf: CloudWatch Embedded Metric Format | off
+METRICS_FORMAT = os.environ.get('METRICS_FORMAT', 'json')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'RagDashboard')
+# Muestras que se conservan por endpoint / sentencia para los percentiles de /metrics
+METRICS_WINDOW = int(os.environ.get('METRICS_WINDOW', '500'))
+# Sentencias distintas con ventana propia; al pasarse se descarta la menos usada
+METRICS_MAX_STATEMENTS = int(os.environ.get('METRICS_MAX_STATEMENTS', '200'))
+
+
+def log_enabled(level):
+    return LOG_LEVELS[level] >= LOG_LEVEL
+
+
+def log(level, message):
+    """print() condicionado por LOG_LEVEL"""
+    if LOG_LEVELS[level] >= LOG_LEVEL:
+        print(message)
+
+
+# --- Etiquetas de contexto (por hilo) -------------------------------------
+
+_local = threading.local()
+
+
+def current_tags():
+    """(handler, statement) activos en este hilo"""
+    return getattr(_local, 'handler', None), getattr(_local, 'statement', None)
+
+
+@contextmanager
+def tags(handler=None, statement=None):
+    """
+    Etiqueta las sentencias SQL ejecutadas dentro del bloque.
+    Los hilos de trabajo no heredan las etiquetas: se pasan con current_tags().
+    """
+    previous = current_tags()
+    _local.handler = handler if handler is not None else previous[0]
+    _local.statement = statement if statement is not None else previous[1]
+    try:
+        yield
+    finally:
+        _local.handler, _local.statement = previous
+
+
+_TABLE_RE = re.compile(r'\bFROM\s+([A-Za-z_][\w.]*)', re.IGNORECASE)
+
+
+def statement_name(sql):
+    """
+    Nombre estable para sentencias sin etiqueta: verbo + primera tabla + hash corto.
+    El SQL dinámico debe llevar etiqueta (tags(statement=...)): cada variante tendría su hash.
+    """
+    text = ' '.join(sql.split())
+    verb = text.split(' ', 1)[0].lower() if text else 'sql'
+    match = _TABLE_RE.search(text)
+    table = match.group(1) if match else '-'
+    return f"{verb}:{table}#{hashlib.sha1(text.encode('utf-8')).hexdigest()[:6]}"
+
+
+# --- Traza de la invocación -----------------------------------------------
+
+class Trace:
+    """Tiempos de una petición; los hilos de run_concurrently/batch escriben con lock"""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.acquire_ms = 0.0
+        self.acquire_count = 0
+        self.targets = {}
+        self.serialize_ms = 0.0
+        self.cold_start = False
+        self.statements = []
+        self._lock = threading.Lock()
+
+    def add_acquire(self, ms, target=None):
+        with self._lock:
+            self.acquire_ms += ms
+            self.acquire_count += 1
+            if target:
+                self.targets[target] = self.targets.get(target, 0) + 1
+
+    def add_serialize(self, ms):
+        with self._lock:
+            self.serialize_ms += ms
+
+    def add_statement(self, entry):
+        with self._lock:
+            self.statements.append(entry)
+            return len(self.statements) - 1
+
+    def add_fetch(self, index, ms, rows):
+        with self._lock:
+            entry = self.statements[index]
+            entry['fetch_ms'] = round(entry.get('fetch_ms', 0) + ms, 3)
+            entry['rows'] = entry.get('rows', 0) + rows
+
+
+_trace = None
+_cold_start = True
+_init_ms = None
+
+
+def record_init(ms):
+    """Duración del init del módulo de la Lambda (se emite con la primera traza)"""
+    global _init_ms
+    _init_ms = ms
+
+
+def start_trace(method, path):
+    global _trace, _cold_start
+    _trace = Trace(method, path)
+    _trace.cold_start, _cold_start = _cold_start, False
+    return _trace
+
+
+def current_trace():
+    return _trace
+
+
+def record_acquire(ms, target=None):
+    trace = _trace
+    if trace is not None:
+        trace.add_acquire(ms, target)
+
+
+def record_serialize(ms):
+    trace = _trace
+    if trace is not None:
+        trace.add_serialize(ms)
+
+
+# --- Cursores instrumentados ----------------------------------------------
+
+class _TimedCursorMixin:
+    """Mide execute() y fetch*() y los anota en la traza y en la ventana de la sentencia"""
+
+    _trace_index = None
+
+    def execute(self, query, vars=None):
+        handler, name = current_tags()
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            sql = query if isinstance(query, str) else str(query)
+            name = name or statement_name(sql)
+            _statement_window(name).append(ms)
+            trace = _trace
+            if trace is not None:
+                self._trace_index = trace.add_statement({
+                    'handler': handler,
+                    'statement': name,
+                    'execute_ms': round(ms, 3)
+                })
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        rows = fetch(*args)
+        trace = _trace
+        if trace is not None and self._trace_index is not None:
+            count = len(rows) if isinstance(rows, list) else int(rows is not None)
+            trace.add_fetch(self._trace_index, (time.perf_counter() - started) * 1000, count)
+        return rows
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+
+class TimedRealDictCursor(_TimedCursorMixin, RealDictCursor):
+    pass
+
+
+class TimedCursor(_TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+# --- Ventanas deslizantes para /metrics -----------------------------------
+
+_windows_lock = threading.Lock()
+_endpoint_windows = {}
+_statement_windows = OrderedDict()
+_started_at = time.time()
+
+
+def _window(store, key):
+    window = store.get(key)
+    if window is None:
+        with _windows_lock:
+            window = store.setdefault(key, deque(maxlen=METRICS_WINDOW))
+    return window
+
+
+def _statement_window(name):
+    """Ventana de la sentencia; LRU de METRICS_MAX_STATEMENTS para que el SQL sin etiqueta no crezca sin límite"""
+    with _windows_lock:
+        window = _statement_windows.get(name)
+        if window is None:
+            window = _statement_windows[name] = deque(maxlen=METRICS_WINDOW)
+            if len(_statement_windows) > METRICS_MAX_STATEMENTS:
+                _statement_windows.popitem(last=False)
+        else:
+            _statement_windows.move_to_end(name)
+        return window
+
+
+def _percentiles(samples):
+    values = sorted(samples)
+    if not values:
+        return {'count': 0}
+    pick = lambda q: round(values[int(q * (len(values) - 1))], 2)  # noqa: E731
+    return {
+        'count': len(values),
+        'p50_ms': pick(0.5),
+        'p95_ms': pick(0.95),
+        'max_ms': round(values[-1], 2),
+        'mean_ms': round(sum(values) / len(values), 2)
+    }
+
+
+def get_metrics():
+    """Percentiles por endpoint y por sentencia de las últimas METRICS_WINDOW muestras"""
+    with _windows_lock:
+        endpoints = {key: list(window) for key, window in _endpoint_windows.items()}
+        statements = {key: list(window) for key, window in _statement_windows.items()}
+    return {
+        'window': METRICS_WINDOW,
+        'container_uptime_s': round(time.time() - _started_at, 1),
+        'endpoints': {key: _percentiles(values) for key, values in sorted(endpoints.items())},
+        'statements': {key: _percentiles(values) for key, values in sorted(statements.items())}
+    }
+
+
+# --- Emisión ---------------------------------------------------------------
+
+def finish_trace(trace, response, endpoint=None):
+    """Cierra la traza: actualiza las ventanas y emite una línea estructurada"""
+    global _trace
+    if _trace is trace:
+        _trace = None
+
+    duration_ms = (time.perf_counter() - trace.started) * 1000
+    endpoint = endpoint or trace.path
+    _window(_endpoint_windows, endpoint).append(duration_ms)
+
+    if METRICS_FORMAT == 'off':
+        return
+
+    headers = response.get('headers') or {}
+    # Bytes del cuerpo tal como viaja (base64 o UTF-8), no caracteres
+    body = (response.get('body') or '').encode('utf-8')
+    db_ms = sum(s['execute_ms'] + s.get('fetch_ms', 0) for s in trace.statements)
+    record = {
+        'type': 'request',
+        'method': trace.method,
+        'path': trace.path,
+        'endpoint': endpoint,
+        'status': response.get('statusCode'),
+        'duration_ms': round(duration_ms, 2),
+        'acquire_ms': round(trace.acquire_ms, 2),
+        'connections': trace.acquire_count,
+        'db_targets': trace.targets,
+        'db_ms': round(db_ms, 2),
+        'serialize_ms': round(trace.serialize_ms, 2),
+        'response_bytes': len(body),
+        'uncompressed_bytes': int(headers.get('X-Uncompressed-Length', len(body))),
+        'content_encoding': headers.get('Content-Encoding'),
+        'cache': headers.get('X-Cache'),
+        'cold_start': trace.cold_start,
+        'statements': trace.statements
+    }
+    if trace.cold_start and _init_ms is not None:
+        record['init_ms'] = _init_ms
+
+    if METRICS_FORMAT == 'emf':
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['endpoint']],
+                    'Metrics': [
+                        {'Name': 'duration_ms', 'Unit': 'Milliseconds'},
+                        {'Name': 'acquire_ms', 'Unit': 'Milliseconds'},
+                        {'Name': 'db_ms', 'Unit': 'Milliseconds'},
+                        {'Name': 'serialize_ms', 'Unit': 'Milliseconds'},
+                        {'Name': 'response_bytes', 'Unit': 'Bytes'},
+                        *([{'Name': 'init_ms', 'Unit': 'Milliseconds'}] if 'init_ms' in record else [])
+                    ]
+                }]
+            },
+            **record
+        }
+
+    sys.stdout.write(json.dumps(record, default=str, separators=(',', ':')) + '\n')
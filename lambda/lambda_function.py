@@ -2,508 +2,1719 @@
 Dashboard Lambda Function - Direct RDS Connection
 Versión: 3.0.0
 Conecta directamente a PostgreSQL RDS sin Flask intermedio
+
+Cold start: aquí solo se importa lo que usan todas las peticiones. Los módulos
+de rutas o eventos concretos (batch, compression, conversations, dimensions, export,
+migrations, partitions, rollup, sketches, usage, urllib.parse) se importan dentro de su handler.
 """
 
-import json
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime, timedelta
-from urllib.parse import parse_qs
-
-# Configuración de base de datos desde variables de entorno
-DB_CONFIG = {
-    'host': os.environ.get('DB_HOST', 'rag-postgres.czuimyk2qu10.eu-west-1.rds.amazonaws.com'),
-    'database': os.environ.get('DB_NAME', 'ragdb'),
-    'user': os.environ.get('DB_USER', 'raguser'),
-    'password': os.environ.get('DB_PASSWORD', 'RAGSystem2025!'),
-    'port': int(os.environ.get('DB_PORT', '5432'))
-}
+import time
+
+# Inicio de la carga del módulo: el init se informa en la primera invocación
+_INIT_STARTED = time.perf_counter()
+
+import base64  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import re  # noqa: E402
+from datetime import datetime, timedelta, timezone  # noqa: E402
 
-def get_db_connection():
-    """Obtiene conexión a PostgreSQL RDS"""
-    return psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
+import instrumentation  # noqa: E402
+import response_cache  # noqa: E402
+import serialization  # noqa: E402
+from db import (  # noqa: E402
+    db_connection, db_session, get_pool_stats, is_timeout, query_task, run_concurrently, tuple_cursor
+)
+
+# Retry-After de las respuestas 503 por statement_timeout
+RETRY_AFTER_SECONDS = int(os.environ.get('RETRY_AFTER_SECONDS', '30'))
 
 def create_response(status_code, body, origin=None):
     """Crea respuesta HTTP estándar - CORS manejado por Lambda URL"""
+    started = time.perf_counter()
+    payload = serialization.dumps(body)
+    instrumentation.record_serialize((time.perf_counter() - started) * 1000)
     return {
         'statusCode': status_code,
         'headers': {
             'Content-Type': 'application/json'
         },
-        'body': json.dumps(body, default=str)
+        'body': payload
     }
 
+def error_response(error, origin=None):
+    """500, o 503 con Retry-After si la consulta se canceló por statement_timeout"""
+    if is_timeout(error):
+        response = create_response(503, {'error': 'Query timed out', 'timeout': True}, origin)
+        response['headers']['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return response
+    return create_response(500, {'error': str(error)}, origin)
+
+def with_partial(response, cancelled):
+    """Marca una respuesta a la que le faltan partes canceladas por statement_timeout (no se cachea)"""
+    if cancelled:
+        response['headers']['X-Partial-Result'] = ','.join(cancelled)
+    return response
+
+def with_server_timing(response, timings):
+    """Tiempos por fase ({'scan_ms': 1.2}) en Server-Timing: fuera del cuerpo, que es lo que fija la ETag"""
+    if timings:
+        response['headers']['Server-Timing'] = ', '.join(
+            f"{name.removesuffix('_ms')};dur={ms}" for name, ms in timings.items()
+        )
+    return response
+
+# Ventana por defecto de /analytics: acota el escaneo a las particiones recientes
+ANALYTICS_DEFAULT_DAYS = int(os.environ.get('ANALYTICS_DEFAULT_DAYS', '90'))
+
+def parse_day_range(query_params, default_days):
+    """
+    Días [start_day, end_day] de start_date / end_date (YYYY-MM-DD) o days=N;
+    por defecto los últimos default_days días incluyendo hoy. ValueError si no son válidos.
+    """
+    end_day = datetime.strptime(query_params['end_date'][0][:10], '%Y-%m-%d').date() \
+        if query_params.get('end_date') else datetime.now().date()
+    if query_params.get('start_date'):
+        start_day = datetime.strptime(query_params['start_date'][0][:10], '%Y-%m-%d').date()
+    else:
+        days = int(query_params.get('days', [str(default_days)])[0])
+        if days < 1:
+            raise ValueError('days must be a positive integer')
+        start_day = end_day - timedelta(days=days - 1)
+    if start_day > end_day:
+        raise ValueError('start_date must not be after end_date')
+    return start_day, end_day
+
 def handle_analytics(query_params, origin=None):
-    """Endpoint: /analytics"""
+    """
+    Endpoint: /analytics
+    Parámetros: start_date, end_date (YYYY-MM-DD) o days; por defecto los
+    últimos ANALYTICS_DEFAULT_DAYS días
+    """
+    import rollup
+    
     print("📊 Handling /analytics request")
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        start_day, end_day = parse_day_range(query_params, ANALYTICS_DEFAULT_DAYS)
+    except ValueError as e:
+        return create_response(400, {'error': str(e)}, origin)
+    # created_at >= start AND created_at < end: solo las particiones del rango
+    range_start = datetime.combine(start_day, datetime.min.time())
+    range_end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    
+    try:
+        with db_connection() as conn:
+            boundary = rollup.rollup_boundary(conn.cursor())
+        
+        # Las tres agregaciones son independientes: se lanzan en paralelo.
+        # Si alguna supera el statement_timeout se responde con las demás
+        if boundary is not None:
+            # Días completos desde web_queries_daily + filas del día en curso
+            results = run_concurrently({
+                'person_totals': lambda cursor: rollup.entity_totals(cursor, 'person_name', boundary, start_day, end_day),
+                'team_totals': lambda cursor: rollup.entity_totals(cursor, 'app_name', boundary, start_day, end_day),
+                'model_stats': query_task(f"""
+                    SELECT 
+                        'claude-3-haiku' as model_id,
+                        (SELECT COALESCE(SUM(query_count), 0) FROM {rollup.ROLLUP_TABLE}
+                            WHERE day >= %s AND day <= %s AND day < %s)
+                        + (SELECT COUNT(*) FROM web_queries
+                            WHERE created_at >= %s AND created_at < %s) as count
+                """, [start_day, end_day, boundary.date(), max(boundary, range_start), range_end])
+            }, label='analytics', allow_partial=True)
+            cancelled = [name for name, result in results.items() if result is None]
+            person_stats = [
+                {'person': person, 'count': t['count'], 'avg_response_time': t['avg_response_time']}
+                for person, t in (results['person_totals'] or {}).items()
+            ]
+            team_stats = [
+                {'team': team, 'count': t['count'], 'avg_response_time': t['avg_response_time']}
+                for team, t in (results['team_totals'] or {}).items()
+            ]
+            person_stats.sort(key=lambda r: r['count'], reverse=True)
+            team_stats.sort(key=lambda r: r['count'], reverse=True)
+            model_stats = results['model_stats'] or []
         
-        # Get person stats
-        cursor.execute("""
+        else:
+            window = [range_start, range_end]
+            results = run_concurrently({
+                # Get person stats
+                'person_stats': query_task("""
+                    SELECT 
+                        person_name as person,
+                        COUNT(*) as count,
+                        AVG(response_time_ms) as avg_response_time
+                    FROM web_queries
+                    WHERE created_at >= %s AND created_at < %s
+                        AND person_name IS NOT NULL
+                    GROUP BY person_name
+                    ORDER BY count DESC
+                """, window),
+                # Get team stats
+                'team_stats': query_task("""
+                    SELECT 
+                        app_name as team,
+                        COUNT(*) as count,
+                        AVG(response_time_ms) as avg_response_time
+                    FROM web_queries
+                    WHERE created_at >= %s AND created_at < %s
+                        AND app_name IS NOT NULL
+                    GROUP BY app_name
+                    ORDER BY count DESC
+                """, window),
+                # Get model stats
+                'model_stats': query_task("""
+                    SELECT 
+                        'claude-3-haiku' as model_id,
+                        COUNT(*) as count
+                    FROM web_queries
+                    WHERE created_at >= %s AND created_at < %s
+                """, window)
+            }, label='analytics', allow_partial=True)
+            cancelled = [name for name, result in results.items() if result is None]
+            person_stats = results['person_stats'] or []
+            team_stats = results['team_stats'] or []
+            model_stats = results['model_stats'] or []
+        
+        body = {
+            'startDate': start_day,
+            'endDate': end_day,
+            'personStats': [dict(row) for row in person_stats],
+            'teamStats': [dict(row) for row in team_stats],
+            'modelStats': [dict(row) for row in model_stats]
+        }
+        if cancelled:
+            body['partial'] = cancelled
+        return with_partial(create_response(200, body, origin), cancelled)
+        
+    except Exception as e:
+        print(f"❌ Error in analytics: {e}")
+        return error_response(e, origin)
+
+def parse_timestamp_param(query_params, name, end=False):
+    """
+    Fecha YYYY-MM-DD o timestamp ISO de un parámetro (None si no viene).
+    Con end=True una fecha sin hora es el límite exclusivo del día siguiente
+    (created_at < end), para no perder el último día. ValueError si no es válida.
+    """
+    value = (query_params.get(name, [''])[0] or '').strip()
+    if not value:
+        return None
+    try:
+        if len(value) == 10:
+            parsed = datetime.strptime(value, '%Y-%m-%d')
+            return parsed + timedelta(days=1) if end else parsed
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"{name} must be a date (YYYY-MM-DD) or an ISO timestamp") from None
+    # created_at se guarda sin zona (UTC): así los límites se pueden comparar entre sí
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_date_range(query_params, default_days=30):
+    """
+    Rango [start_date, end_date) de los parámetros, por defecto los últimos N días;
+    end_date es exclusivo (ver parse_timestamp_param). ValueError si no son válidos.
+    """
+    end_date = parse_timestamp_param(query_params, 'end_date', end=True) or datetime.now()
+    start_date = parse_timestamp_param(query_params, 'start_date')
+    if start_date is None:
+        try:
+            days = int(query_params.get('days', [str(default_days)])[0])
+        except ValueError:
+            raise ValueError('days must be a positive integer') from None
+        if days < 1:
+            raise ValueError('days must be a positive integer')
+        start_date = end_date - timedelta(days=days)
+    if start_date >= end_date:
+        raise ValueError('start_date must be before end_date')
+    return start_date, end_date
+
+def entity_metrics_tasks(column, start_date, end_date):
+    """
+    Consultas independientes de las métricas por entidad (person_name o app_name),
+    para lanzarlas con run_concurrently junto a las del propio handler
+    """
+    return {
+        # Daily counts and sums per entity
+        'daily': query_task(f"""
             SELECT 
-                person_name as person,
+                {column} as entity,
+                DATE(created_at) as date,
                 COUNT(*) as count,
-                AVG(response_time_ms) as avg_response_time
+                SUM(tokens_input) as tokens_input,
+                SUM(tokens_output) as tokens_output,
+                SUM(tokens_total) as tokens_total
             FROM web_queries
-            WHERE person_name IS NOT NULL
-            GROUP BY person_name
-            ORDER BY count DESC
-        """)
-        person_stats = cursor.fetchall()
-        
-        # Get team stats
-        cursor.execute("""
+            WHERE created_at >= %s
+                AND created_at < %s
+                AND {column} IS NOT NULL
+            GROUP BY {column}, DATE(created_at)
+            ORDER BY {column}, date
+        """, [start_date, end_date]),
+        # Latency over the whole range per entity
+        'latency': query_task(f"""
             SELECT 
-                app_name as team,
+                {column} as entity,
+                MIN(app_name) as team,
                 COUNT(*) as count,
-                AVG(response_time_ms) as avg_response_time
-            FROM web_queries
-            WHERE app_name IS NOT NULL
-            GROUP BY app_name
-            ORDER BY count DESC
-        """)
-        team_stats = cursor.fetchall()
-        
-        # Get model stats
-        cursor.execute("""
-            SELECT 
-                'claude-3-haiku' as model_id,
-                COUNT(*) as count
+                AVG(response_time_ms) as avg_response_time_ms,
+                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY response_time_ms) as p50_response_time_ms,
+                PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY response_time_ms) as p95_response_time_ms
             FROM web_queries
-        """)
-        model_stats = cursor.fetchall()
+            WHERE created_at >= %s
+                AND created_at < %s
+                AND {column} IS NOT NULL
+            GROUP BY {column}
+        """, [start_date, end_date])
+    }
+
+def aggregate_entity_metrics(daily_rows, latency_rows):
+    """
+    Combina los resultados de entity_metrics_tasks: conteos diarios/mensuales,
+    latencia media/percentiles y tokens por entidad
+    """
+    metrics = {}
+    for row in latency_rows:
+        metrics[row['entity']] = {
+            'team': row['team'],
+            'total': row['count'],
+            'daily': {},
+            'monthly': {},
+            'avg_response_time_ms': float(row['avg_response_time_ms'] or 0),
+            'p50_response_time_ms': float(row['p50_response_time_ms'] or 0),
+            'p95_response_time_ms': float(row['p95_response_time_ms'] or 0),
+            'tokens_input': 0,
+            'tokens_output': 0,
+            'tokens_total': 0
+        }
+    
+    # Monthly counts are derived from the daily buckets instead of a third scan
+    for row in daily_rows:
+        entry = metrics.get(row['entity'])
+        if entry is None:
+            continue
+        day = row['date'].isoformat()
+        entry['daily'][day] = row['count']
+        entry['monthly'][day[:7]] = entry['monthly'].get(day[:7], 0) + row['count']
+        entry['tokens_input'] += int(row['tokens_input'] or 0)
+        entry['tokens_output'] += int(row['tokens_output'] or 0)
+        entry['tokens_total'] += int(row['tokens_total'] or 0)
+    
+    return metrics
+
+def handle_user_metrics(query_params, origin=None):
+    """Endpoint: /user-metrics"""
+    print("📊 Handling /user-metrics request")
+    
+    try:
+        start_date, end_date = parse_date_range(query_params)
+    except ValueError as e:
+        return create_response(400, {'error': str(e)}, origin)
+    
+    try:
+        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         
-        conn.close()
+        results = run_concurrently({
+            **entity_metrics_tasks('person_name', start_date, end_date),
+            # Hourly distribution for today
+            'hourly': query_task("""
+                SELECT 
+                    EXTRACT(HOUR FROM created_at)::int as hour,
+                    COUNT(*) as count
+                FROM web_queries
+                WHERE created_at >= %s
+                    AND person_name IS NOT NULL
+                GROUP BY 1
+            """, [today_start])
+        }, label='user-metrics', allow_partial=True)
+        cancelled = [name for name, result in results.items() if result is None]
         
-        return create_response(200, {
-            'personStats': [dict(row) for row in person_stats],
-            'teamStats': [dict(row) for row in team_stats],
-            'modelStats': [dict(row) for row in model_stats]
-        }, origin)
+        users = aggregate_entity_metrics(results['daily'] or [], results['latency'] or [])
+        hourly_today = [0] * 24
+        for row in results['hourly'] or []:
+            hourly_today[row['hour']] = row['count']
+        
+        body = {
+            'startDate': start_date,
+            'endDate': end_date,
+            'users': users,
+            'hourlyToday': hourly_today
+        }
+        if cancelled:
+            body['partial'] = cancelled
+        return with_partial(create_response(200, body, origin), cancelled)
         
     except Exception as e:
-        print(f"❌ Error in analytics: {e}")
-        return create_response(500, {'error': str(e)}, origin)
+        print(f"❌ Error in user-metrics: {e}")
+        return error_response(e, origin)
+
+def handle_team_metrics(query_params, origin=None):
+    """Endpoint: /team-metrics"""
+    print("📊 Handling /team-metrics request")
+    
+    try:
+        start_date, end_date = parse_date_range(query_params)
+    except ValueError as e:
+        return create_response(400, {'error': str(e)}, origin)
+    
+    try:
+        
+        results = run_concurrently(entity_metrics_tasks('app_name', start_date, end_date),
+                                   label='team-metrics', allow_partial=True)
+        cancelled = [name for name, result in results.items() if result is None]
+        teams = aggregate_entity_metrics(results['daily'] or [], results['latency'] or [])
+        
+        for entry in teams.values():
+            entry.pop('team', None)
+        
+        body = {
+            'startDate': start_date,
+            'endDate': end_date,
+            'teams': teams
+        }
+        if cancelled:
+            body['partial'] = cancelled
+        return with_partial(create_response(200, body, origin), cancelled)
+        
+    except Exception as e:
+        print(f"❌ Error in team-metrics: {e}")
+        return error_response(e, origin)
+
+# Parámetro dimension= de /filters -> columna de web_queries
+FILTER_DIMENSIONS = {'persons': 'person_name', 'teams': 'app_name'}
+# Sin catálogo ni rollup, los valores de filtro salen de las particiones de este último periodo
+FILTERS_FALLBACK_DAYS = int(os.environ.get('FILTERS_FALLBACK_DAYS', '365'))
+
+def distinct_filter_values():
+    """Fallback sin catálogo: valores distintos del rollup + día en curso, o de web_queries reciente"""
+    import dimensions
+    import rollup
+    
+    with db_connection() as conn:
+        boundary = rollup.rollup_boundary(conn.cursor())
+    
+    if boundary is not None:
+        # Valores distintos del rollup + filas del día en curso
+        results = run_concurrently({
+            'persons': query_task(f"""
+                SELECT person_name FROM {rollup.ROLLUP_TABLE} WHERE day < %s AND person_name <> ''
+                UNION
+                SELECT person_name FROM web_queries WHERE created_at >= %s AND person_name IS NOT NULL
+                ORDER BY person_name
+            """, [boundary.date(), boundary]),
+            'teams': query_task(f"""
+                SELECT app_name FROM {rollup.ROLLUP_TABLE} WHERE day < %s AND app_name <> ''
+                UNION
+                SELECT app_name FROM web_queries WHERE created_at >= %s AND app_name IS NOT NULL
+                ORDER BY app_name
+            """, [boundary.date(), boundary])
+        }, label='filters')
+    
+    else:
+        since = [datetime.now() - timedelta(days=FILTERS_FALLBACK_DAYS)]
+        results = run_concurrently({
+            # Get unique persons
+            'persons': query_task("""
+                SELECT DISTINCT person_name 
+                FROM web_queries 
+                WHERE created_at >= %s AND person_name IS NOT NULL 
+                ORDER BY person_name
+            """, since),
+            # Get unique teams
+            'teams': query_task("""
+                SELECT DISTINCT app_name 
+                FROM web_queries 
+                WHERE created_at >= %s AND app_name IS NOT NULL 
+                ORDER BY app_name
+            """, since)
+        }, label='filters')
+    
+    return {
+        'person_name': dimensions.DimensionValues(row['person_name'] for row in results['persons']),
+        'app_name': dimensions.DimensionValues(row['app_name'] for row in results['teams'])
+    }
 
 def handle_filters(query_params, origin=None):
-    """Endpoint: /filters"""
+    """
+    Endpoint: /filters
+    Parámetros opcionales para type-ahead: prefix, limit y dimension (persons|teams)
+    """
+    import dimensions
+    
     print("📊 Handling /filters request")
     
+    prefix = query_params.get('prefix', [''])[0].strip()
+    dimension = query_params.get('dimension', [None])[0]
+    try:
+        # limit=0 (o ausente): todos los valores
+        limit = parse_int_param(query_params, 'limit', 0) or None
+    except ValueError as e:
+        return create_response(400, {'error': str(e)}, origin)
+    if dimension is not None and dimension not in FILTER_DIMENSIONS:
+        return create_response(400, {'error': f"dimension must be one of {', '.join(FILTER_DIMENSIONS)}"}, origin)
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get unique persons
-        cursor.execute("""
-            SELECT DISTINCT person_name 
-            FROM web_queries 
-            WHERE person_name IS NOT NULL 
-            ORDER BY person_name
-        """)
-        persons = [row['person_name'] for row in cursor.fetchall()]
-        
-        # Get unique teams
-        cursor.execute("""
-            SELECT DISTINCT app_name 
-            FROM web_queries 
-            WHERE app_name IS NOT NULL 
-            ORDER BY app_name
-        """)
-        teams = [row['app_name'] for row in cursor.fetchall()]
+        # Catálogo en memoria (tabla de dimensiones + delta desde el watermark)
+        catalog = dimensions.get_catalog()
+        with db_connection() as conn:
+            ready = catalog.refresh(conn.cursor())
+        values = catalog.values if ready else distinct_filter_values()
         
-        # Models (hardcoded for now)
-        models = ['claude-3-haiku']
+        response = {}
+        for name, column in FILTER_DIMENSIONS.items():
+            if dimension is None or dimension == name:
+                response[name] = values[column].search(prefix, limit)
         
-        conn.close()
+        # Models (hardcoded for now)
+        response['models'] = ['claude-3-haiku']
         
-        return create_response(200, {
-            'persons': persons,
-            'teams': teams,
-            'models': models
-        }, origin)
+        return create_response(200, response, origin)
         
     except Exception as e:
         print(f"❌ Error in filters: {e}")
-        return create_response(500, {'error': str(e)}, origin)
+        return error_response(e, origin)
+
+def build_query_logs_filters(query_params, base=True):
+    """
+    Construye el WHERE de /query-logs a partir de los filtros person/team/fechas.
+    base=False omite el predicado del listado (person/team/categoría no nulos)
+    """
+    where_clauses = [
+        "person_name IS NOT NULL",
+        "app_name IS NOT NULL",
+        "llm_trust_category IS NOT NULL"
+    ] if base else []
+    params = []
+    
+    # Add optional filters
+    if 'person' in query_params:
+        where_clauses.append("person_name = %s")
+        params.append(query_params['person'][0])
+    
+    if 'team' in query_params:
+        where_clauses.append("app_name = %s")
+        params.append(query_params['team'][0])
+    
+    # Búsqueda en el texto completo (el listado solo devuelve un preview), session y conversación
+    if query_params.get('search', [''])[0].strip():
+        term = query_params['search'][0].strip()
+        pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        where_clauses.append("(query_text ILIKE %s OR session_token ILIKE %s OR conversation_id_bedrock ILIKE %s)")
+        params.extend([pattern, pattern, pattern])
+
+    # end_date=YYYY-MM-DD incluye ese día entero (created_at < día siguiente)
+    start_date = parse_timestamp_param(query_params, 'start_date')
+    if start_date is not None:
+        where_clauses.append("created_at >= %s")
+        params.append(start_date)
+    
+    end_date = parse_timestamp_param(query_params, 'end_date', end=True)
+    if end_date is not None:
+        where_clauses.append("created_at < %s")
+        params.append(end_date)
+    
+    return where_clauses, params
+
+def encode_cursor(created_at, row_id):
+    """Codifica (created_at, id) de la última fila en un cursor opaco"""
+    ts = created_at.isoformat() if hasattr(created_at, 'isoformat') else str(created_at)
+    raw = json.dumps([ts, str(row_id)], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor_value):
+    """Decodifica un cursor generado por encode_cursor -> (created_at, id)"""
+    try:
+        padded = cursor_value + '=' * (-len(cursor_value) % 4)
+        ts, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(ts), row_id
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor_value}") from e
+
+def estimate_row_count(cursor, where_clause, params):
+    """Estimación de filas a partir de las estadísticas del planner (EXPLAIN, sin ejecutar)"""
+    cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM web_queries WHERE {where_clause}", params)
+    plan = cursor.fetchone()
+    plan = plan['QUERY PLAN'] if isinstance(plan, dict) else plan[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+# Columnas disponibles en el listado de /query-logs: nombre -> expresión SQL
+QUERY_LOG_COLUMNS = {
+    'query_id': "id",
+    'user_id': "user_name",
+    'request_timestamp': "created_at",
+    'response_timestamp': "response_timestamp",
+    'person': "person_name",
+    'person_name': "person_name",
+    'team': "app_name",
+    'iam_group': "app_name",
+    'user_name': "user_name",
+    'session_token': "session_token",
+    'conversation_id_bedrock': "conversation_id_bedrock",
+    'user_query': "query_text",
+    'llm_response': "llm_response",
+    'status': "COALESCE(status, 'completed')",
+    'processing_time_ms': "COALESCE(response_time_ms, 0)",
+    'tokens_input': "tokens_input",
+    'tokens_output': "tokens_output",
+    'tokens_total': "tokens_total",
+    'tokens_used': "tokens_total",
+    'model_id': "'claude-3-haiku'",
+    'knowledge_base_id': "COALESCE(app_name, 'general-kb')",
+    'llm_trust': "COALESCE(confidence_score, 0)",
+    'confidence_score': "COALESCE(confidence_score, 0)",
+    'llm_trust_category': """CASE 
+                        WHEN llm_trust_category = 'high' THEN 'ALTO'
+                        WHEN llm_trust_category = 'medium' THEN 'MEDIO'
+                        WHEN llm_trust_category = 'low' THEN 'BAJO'
+                        ELSE 'MEDIO'
+                    END""",
+    'tools_used': "tools_used"
+}
+
+# Textos largos: en el listado solo se devuelve un preview; el cuerpo completo va por /query-logs/{id}
+QUERY_LOG_PREVIEW_COLUMNS = ('user_query', 'llm_response')
+QUERY_LOG_TIMESTAMP_COLUMNS = ('request_timestamp', 'response_timestamp')
+QUERY_LOG_FLOAT_COLUMNS = ('processing_time_ms', 'llm_trust', 'confidence_score')
+# Necesarias siempre para el cursor y para abrir el detalle
+QUERY_LOG_REQUIRED_COLUMNS = ('query_id', 'request_timestamp')
+
+QUERY_LOG_VIEWS = {
+    'summary': [name for name in QUERY_LOG_COLUMNS if name not in ('llm_response', 'tools_used')],
+    'full': list(QUERY_LOG_COLUMNS)
+}
+
+QUERY_LOGS_PREVIEW_LENGTH = int(os.environ.get('QUERY_LOGS_PREVIEW_LENGTH', '200'))
+QUERY_LOGS_MAX_PREVIEW_LENGTH = int(os.environ.get('QUERY_LOGS_MAX_PREVIEW_LENGTH', '2000'))
+# Cómo se calcula el total del listado: COUNT(*) exacto, estimación del planner o ninguno
+QUERY_LOGS_TOTAL_MODES = ('exact', 'estimate', 'none')
+
+def resolve_query_log_fields(query_params, default_view='summary'):
+    """Columnas a devolver según fields=a,b,c o view=summary|full (por defecto default_view)"""
+    if 'fields' in query_params:
+        requested = [f.strip() for f in query_params['fields'][0].split(',') if f.strip()]
+        unknown = [f for f in requested if f not in QUERY_LOG_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)} (tool_results is only available via /query-logs/{{id}})")
+    else:
+        view = query_params.get('view', [default_view])[0]
+        if view not in QUERY_LOG_VIEWS:
+            raise ValueError(f"Unknown view: {view} (expected one of {', '.join(QUERY_LOG_VIEWS)})")
+        requested = QUERY_LOG_VIEWS[view]
+    
+    fields = [f for f in QUERY_LOG_REQUIRED_COLUMNS if f not in requested]
+    fields.extend(dict.fromkeys(requested))
+    return fields
+
+QUERY_LOG_CONVERTERS = {
+    'query_id': 'str',
+    'request_timestamp': 'iso',
+    'response_timestamp': 'iso',
+    'processing_time_ms': 'float0',
+    'response_time_ms': 'float0',
+    'llm_trust': 'float0',
+    'confidence_score': 'float0',
+    **{f"{name}_truncated": 'bool' for name in QUERY_LOG_PREVIEW_COLUMNS}
+}
+
+def query_log_encoder(fields, preview_length=None):
+    """
+    Encoder compilado para el listado: los textos largos se recortan en SQL
+    (salvo preview_length=None) y se añade el flag <campo>_truncated
+    """
+    expressions = dict(QUERY_LOG_COLUMNS)
+    output_fields = list(fields)
+    if preview_length is not None:
+        for name in QUERY_LOG_PREVIEW_COLUMNS:
+            if name in fields:
+                expr = QUERY_LOG_COLUMNS[name]
+                expressions[name] = f"LEFT({expr}, {int(preview_length)})"
+                expressions[f"{name}_truncated"] = f"(char_length({expr}) > {int(preview_length)})"
+                output_fields.append(f"{name}_truncated")
+    return serialization.get_row_encoder(
+        f"query-logs:{preview_length}", output_fields, expressions, QUERY_LOG_CONVERTERS
+    )
+
+def parse_int_param(query_params, name, default, minimum=0):
+    """Entero >= minimum de un parámetro (default si no viene); ValueError si no es válido"""
+    value = (query_params.get(name, [''])[0] or '').strip()
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer") from None
+    if number < minimum:
+        raise ValueError(f"{name} must be >= {minimum}")
+    return number
 
 def handle_query_logs(query_params, origin=None):
     """Endpoint: /query-logs"""
     print("📊 Handling /query-logs request")
     
     try:
-        # Parse query parameters
-        limit = int(query_params.get('limit', ['100'])[0])
-        offset = int(query_params.get('offset', ['0'])[0])
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Build WHERE clause based on filters
-        where_clauses = [
-            "person_name IS NOT NULL",
-            "app_name IS NOT NULL",
-            "llm_trust_category IS NOT NULL"
-        ]
-        params = []
-        
-        # Add optional filters
-        if 'person' in query_params:
-            where_clauses.append("person_name = %s")
-            params.append(query_params['person'][0])
-        
-        if 'team' in query_params:
-            where_clauses.append("app_name = %s")
-            params.append(query_params['team'][0])
-        
-        if 'start_date' in query_params:
-            where_clauses.append("created_at >= %s")
-            params.append(query_params['start_date'][0])
-        
-        if 'end_date' in query_params:
-            where_clauses.append("created_at <= %s")
-            params.append(query_params['end_date'][0])
+        limit = parse_int_param(query_params, 'limit', 100)
+        offset = parse_int_param(query_params, 'offset', 0)
+        preview_length = min(parse_int_param(query_params, 'preview_length', QUERY_LOGS_PREVIEW_LENGTH),
+                             QUERY_LOGS_MAX_PREVIEW_LENGTH)
+    except ValueError as e:
+        return create_response(400, {'error': str(e)}, origin)
+    
+    try:
+        after = query_params.get('after', [None])[0]
+        # Cursor mode: se activa con after= o con pagination=cursor
+        use_cursor = after is not None or query_params.get('pagination', [''])[0] == 'cursor'
+        # total=exact|estimate|none (por defecto estimate en modo offset, none en modo cursor).
+        # exact es un COUNT(*) sin acotar sobre todo el filtro: solo si el cliente lo pide
+        total_mode = query_params.get('total', ['none' if use_cursor else 'estimate'])[0]
+        if total_mode not in QUERY_LOGS_TOTAL_MODES:
+            return create_response(400, {'error': f"total must be one of {', '.join(QUERY_LOGS_TOTAL_MODES)}"}, origin)
         
+        try:
+            where_clauses, params = build_query_logs_filters(query_params)
+        except ValueError as e:
+            return create_response(400, {'error': str(e)}, origin)
         where_clause = " AND ".join(where_clauses)
         
-        # Main query
-        query = f"""
-            SELECT 
-                id as query_id,
-                user_name as user_id,
-                created_at as request_timestamp,
-                response_timestamp,
-                person_name as person,
-                app_name as team,
-                app_name as iam_group,
-                user_name,
-                session_token,
-                conversation_id_bedrock,
-                query_text as user_query,
-                llm_response,
-                COALESCE(status, 'completed') as status,
-                COALESCE(response_time_ms, 0) as processing_time_ms,
-                tokens_input,
-                tokens_output,
-                tokens_total,
-                tokens_total as tokens_used,
-                'claude-3-haiku' as model_id,
-                COALESCE(app_name, 'general-kb') as knowledge_base_id,
-                COALESCE(confidence_score, 0) as llm_trust,
-                COALESCE(confidence_score, 0) as confidence_score,
-                CASE 
-                    WHEN llm_trust_category = 'high' THEN 'ALTO'
-                    WHEN llm_trust_category = 'medium' THEN 'MEDIO'
-                    WHEN llm_trust_category = 'low' THEN 'BAJO'
-                    ELSE 'MEDIO'
-                END as llm_trust_category,
-                tools_used,
-                tool_results
-            FROM web_queries
-            WHERE {where_clause}
-            ORDER BY created_at DESC
-            LIMIT %s OFFSET %s
-        """
+        page_clauses = list(where_clauses)
+        page_params = list(params)
+        if after:
+            try:
+                cursor_ts, cursor_id = decode_cursor(after)
+            except ValueError as e:
+                return create_response(400, {'error': str(e)}, origin)
+            # created_at <= %s explícito: la comparación de filas sola no permite descartar particiones
+            page_clauses.append("created_at <= %s AND (created_at, id) < (%s, %s)")
+            page_params.extend([cursor_ts, cursor_ts, cursor_id])
         
-        params.extend([limit, offset])
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        try:
+            fields = resolve_query_log_fields(query_params)
+        except ValueError as e:
+            return create_response(400, {'error': str(e)}, origin)
         
-        # Count total
-        count_query = f"SELECT COUNT(*) as total FROM web_queries WHERE {where_clause}"
-        cursor.execute(count_query, params[:-2])  # Exclude limit and offset
-        total = cursor.fetchone()['total']
+        encoder = query_log_encoder(fields, preview_length)
         
-        conn.close()
+        with db_connection() as conn:
+            cursor = tuple_cursor(conn)
         
-        # Format data
-        data = []
-        for row in rows:
-            data.append({
-                'query_id': str(row['query_id']),
-                'user_id': row['user_id'],
-                'request_timestamp': row['request_timestamp'].isoformat() if row['request_timestamp'] else None,
-                'response_timestamp': row['response_timestamp'].isoformat() if row['response_timestamp'] else None,
-                'person': row['person'],
-                'person_name': row['person'],
-                'team': row['team'],
-                'iam_group': row['iam_group'],
-                'user_name': row['user_name'],
-                'session_token': row['session_token'],
-                'conversation_id_bedrock': row['conversation_id_bedrock'],
-                'user_query': row['user_query'],
-                'llm_response': row['llm_response'],
-                'status': row['status'],
-                'processing_time_ms': float(row['processing_time_ms']) if row['processing_time_ms'] else 0,
-                'tokens_input': row['tokens_input'],
-                'tokens_output': row['tokens_output'],
-                'tokens_total': row['tokens_total'],
-                'tokens_used': row['tokens_used'],
-                'model_id': row['model_id'],
-                'knowledge_base_id': row['knowledge_base_id'],
-                'llm_trust': float(row['llm_trust']) if row['llm_trust'] else 0,
-                'confidence_score': float(row['confidence_score']) if row['confidence_score'] else 0,
-                'llm_trust_category': row['llm_trust_category'],
-                'tools_used': row['tools_used'],
-                'tool_results': row['tool_results']
-            })
+            if use_cursor:
+                # Pedimos una fila extra para saber si hay página siguiente
+                page_sql = "LIMIT %s"
+                page_params.append(limit + 1)
+            else:
+                page_sql = "LIMIT %s OFFSET %s"
+                page_params.extend([limit, offset])
         
-        return create_response(200, {
+            # Main query: solo las columnas pedidas, textos largos recortados en SQL
+            query = f"""
+                SELECT 
+                    {encoder.select_sql}
+                FROM web_queries
+                WHERE {" AND ".join(page_clauses)}
+                ORDER BY created_at DESC, id DESC
+                {page_sql}
+            """
+        
+            # Etiquetas fijas: el SQL cambia con fields y filtros y cada variante sería una sentencia
+            with instrumentation.tags(statement='query-logs:list'):
+                cursor.execute(query, page_params)
+                rows = cursor.fetchall()
+        
+            # La fila extra indica que hay más; con limit=0 no hay última fila y se sigue desde after
+            has_more = use_cursor and len(rows) > limit
+            rows = rows[:limit]
+            next_cursor = after if has_more else None
+            if has_more and rows:
+                last = rows[-1]
+                next_cursor = encode_cursor(last[encoder.index_of('request_timestamp')],
+                                            last[encoder.index_of('query_id')])
+        
+            # Count total (solo si se pide; en modo cursor el cliente lo pide en la primera página)
+            if total_mode == 'exact':
+                count_query = f"SELECT COUNT(*) as total FROM web_queries WHERE {where_clause}"
+                with instrumentation.tags(statement='query-logs:count'):
+                    cursor.execute(count_query, params)
+                    total = cursor.fetchone()[0]
+            elif total_mode == 'estimate':
+                with instrumentation.tags(statement='query-logs:estimate'):
+                    total = estimate_row_count(cursor, where_clause, params)
+            else:
+                total = None
+        
+        # Format data: una sola función compilada convierte las tuplas del cursor
+        data = encoder.encode_all(rows)
+        
+        response = {
             'data': data,
             'total': total,
             'limit': limit,
-            'offset': offset
-        }, origin)
+            'fields': fields,
+            'preview_length': preview_length
+        }
+        response['total_mode'] = total_mode
+        if use_cursor:
+            response['next_cursor'] = next_cursor
+            response['has_more'] = has_more
+        else:
+            response['offset'] = offset
+        
+        return create_response(200, response, origin)
         
     except Exception as e:
         print(f"❌ Error in query-logs: {e}")
         import traceback
         traceback.print_exc()
-        return create_response(500, {'error': str(e)}, origin)
+        return error_response(e, origin)
 
-def handle_trust_analytics(query_params, origin=None):
-    """Endpoint: /trust-analytics"""
-    print("📊 Handling /trust-analytics request")
+def handle_query_logs_export(query_params, origin=None):
+    """
+    Endpoint: /query-logs/export (NDJSON o CSV, opcionalmente gzip)
+    Por defecto vista full (textos completos, llm_response y tools_used incluidos).
+    Con gzip=1 el cuerpo es un fichero .gz (application/gzip), no un Content-Encoding
+    que el navegador descomprimiría al guardarlo.
+    scope=all incluye las filas sin persona, equipo o categoría que el listado omite
+    (las que cuentan /usage y el rollup; es lo que necesita el modo offline de usage.py).
+    """
+    import export
+    
+    print("📊 Handling /query-logs/export request")
     
     try:
-        # Get days parameter (default: 7)
-        days = int(query_params.get('days', ['7'])[0])
+        export_format = query_params.get('format', ['ndjson'])[0]
+        if export_format not in export.EXPORT_FORMATS:
+            return create_response(400, {'error': f"Unsupported format: {export_format}"}, origin)
+        compress = query_params.get('gzip', ['0'])[0] in ('1', 'true')
+        scope = query_params.get('scope', ['listed'])[0]
+        if scope not in export.EXPORT_SCOPES:
+            return create_response(400, {'error': f"scope must be one of {', '.join(export.EXPORT_SCOPES)}"}, origin)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Calculate date range
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
-        
-        # 1. INDICATORS - Trust metrics for today and period
-        # Today's metrics
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            max_rows = parse_int_param(query_params, 'max_rows', None, minimum=1)
+            fields = resolve_query_log_fields(query_params, default_view='full')
+        except ValueError as e:
+            return create_response(400, {'error': str(e)}, origin)
         
-        cursor.execute("""
-            SELECT 
-                AVG(confidence_score) as avg_trust,
-                PERCENTILE_CONT(0.8) WITHIN GROUP (ORDER BY confidence_score) as p80_trust,
-                COUNT(CASE WHEN llm_trust_category = 'high' THEN 1 END) * 100.0 / COUNT(*) as high_rate
-            FROM web_queries
-            WHERE created_at >= %s
-                AND confidence_score IS NOT NULL
-        """, [today_start])
-        today_metrics = cursor.fetchone()
+        # Mismos filtros que /query-logs; after= continúa una exportación cortada
+        try:
+            where_clauses, params = build_query_logs_filters(query_params, base=(scope == 'listed'))
+        except ValueError as e:
+            return create_response(400, {'error': str(e)}, origin)
+        after = query_params.get('after', [None])[0]
+        if after:
+            try:
+                cursor_ts, cursor_id = decode_cursor(after)
+            except ValueError as e:
+                return create_response(400, {'error': str(e)}, origin)
+            where_clauses.append("created_at <= %s AND (created_at, id) < (%s, %s)")
+            params.extend([cursor_ts, cursor_ts, cursor_id])
         
-        # Period metrics
-        cursor.execute("""
+        # La exportación devuelve los textos completos
+        encoder = query_log_encoder(fields)
+        query = f"""
             SELECT 
-                AVG(confidence_score) as avg_trust,
-                PERCENTILE_CONT(0.8) WITHIN GROUP (ORDER BY confidence_score) as p80_trust,
-                COUNT(CASE WHEN llm_trust_category = 'high' THEN 1 END) * 100.0 / COUNT(*) as high_rate
+                {encoder.select_sql}
             FROM web_queries
-            WHERE created_at >= %s
-                AND confidence_score IS NOT NULL
-        """, [start_date])
-        period_metrics = cursor.fetchone()
+            WHERE {" AND ".join(where_clauses) or "TRUE"}
+            ORDER BY created_at DESC, id DESC
+        """
         
-        # 2. TABLES - Trust by team and day
-        cursor.execute("""
-            SELECT 
-                app_name as team,
-                DATE(created_at) as date,
-                AVG(confidence_score) as avg_trust
-            FROM web_queries
-            WHERE created_at >= %s
-                AND app_name IS NOT NULL
-                AND confidence_score IS NOT NULL
-            GROUP BY app_name, DATE(created_at)
-            ORDER BY app_name, date
-        """, [start_date])
-        trust_by_team_day = cursor.fetchall()
-        
-        # Trust by typology (strategy_type)
-        cursor.execute("""
-            SELECT 
-                COALESCE(llm_trust_category, 'unknown') as strategy_type,
-                AVG(confidence_score) as avg_trust,
-                COUNT(*) as query_count,
-                MIN(confidence_score) as min_trust,
-                MAX(confidence_score) as max_trust
-            FROM web_queries
-            WHERE created_at >= %s
-                AND confidence_score IS NOT NULL
-            GROUP BY llm_trust_category
-            ORDER BY avg_trust DESC
-        """, [start_date])
-        trust_by_typology = cursor.fetchall()
-        
-        # 3. CHARTS - Trust distribution
-        cursor.execute("""
-            SELECT 
-                llm_trust_category as category,
-                COUNT(*) as count
-            FROM web_queries
-            WHERE created_at >= %s
-                AND llm_trust_category IS NOT NULL
-            GROUP BY llm_trust_category
-        """, [start_date])
-        trust_distribution = cursor.fetchall()
+        buffer = export.ExportBuffer()
+        state = {'rows': 0, 'last': None, 'truncated': False}
         
-        # Trust evolution by team (last N days)
-        cursor.execute("""
-            SELECT 
-                app_name as team,
-                DATE(created_at) as date,
-                AVG(confidence_score) as avg_trust
-            FROM web_queries
-            WHERE created_at >= %s
-                AND app_name IS NOT NULL
-                AND confidence_score IS NOT NULL
-            GROUP BY app_name, DATE(created_at)
-            ORDER BY date, app_name
-        """, [start_date])
-        trust_evolution = cursor.fetchall()
-        
-        # Trust levels evolution (high/medium/low counts by day)
-        cursor.execute("""
-            SELECT 
-                DATE(created_at) as date,
-                COUNT(CASE WHEN llm_trust_category = 'low' THEN 1 END) as low_count,
-                COUNT(CASE WHEN llm_trust_category = 'medium' THEN 1 END) as medium_count,
-                COUNT(CASE WHEN llm_trust_category = 'high' THEN 1 END) as high_count
-            FROM web_queries
-            WHERE created_at >= %s
-                AND llm_trust_category IS NOT NULL
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        """, [start_date])
-        trust_levels = cursor.fetchall()
+        with db_connection() as conn, instrumentation.tags(statement='query-logs:export'):
+            def items():
+                for row in export.iter_rows(conn, query, params):
+                    if buffer.full or (max_rows is not None and state['rows'] >= max_rows):
+                        state['truncated'] = True
+                        return
+                    state['rows'] += 1
+                    state['last'] = row
+                    yield encoder.encode(row)
+            
+            if export_format == 'csv':
+                chunks = export.csv_chunks(items(), fields)
+            else:
+                chunks = export.ndjson_chunks(items())
+            
+            for data in export.encode_chunks(chunks, compress=compress):
+                buffer.write(data)
         
-        conn.close()
+        headers = {
+            'Content-Type': export.EXPORT_FORMATS[export_format],
+            'Content-Disposition': f'attachment; filename="query-logs.{export_format}{".gz" if compress else ""}"',
+            'X-Export-Rows': str(state['rows'])
+        }
+        if state['truncated'] and state['last'] is not None:
+            last = state['last']
+            headers['X-Next-Cursor'] = encode_cursor(last[encoder.index_of('request_timestamp')],
+                                                     last[encoder.index_of('query_id')])
         
-        # Format response
-        response = {
-            'indicators': {
-                'avgTrustToday': float(today_metrics['avg_trust'] or 0),
-                'avgTrustPeriod': float(period_metrics['avg_trust'] or 0),
-                'percentile80Today': float(today_metrics['p80_trust'] or 0),
-                'percentile80Period': float(period_metrics['p80_trust'] or 0),
-                'highConfidenceRateToday': float(today_metrics['high_rate'] or 0),
-                'highConfidenceRatePeriod': float(period_metrics['high_rate'] or 0)
-            },
-            'tables': {
-                'trustByTeamDay': [dict(row) for row in trust_by_team_day],
-                'trustByTypology': [dict(row) for row in trust_by_typology]
-            },
-            'charts': {
-                'trustDistribution': {row['category']: row['count'] for row in trust_distribution},
-                'trustEvolutionByTeam': [dict(row) for row in trust_evolution],
-                'trustLevelsEvolution': [dict(row) for row in trust_levels]
+        body = buffer.getvalue()
+        if compress:
+            return {
+                'statusCode': 200,
+                'headers': {**headers, 'Content-Type': 'application/gzip'},
+                'body': base64.b64encode(body).decode('ascii'),
+                'isBase64Encoded': True
             }
+        return {'statusCode': 200, 'headers': headers, 'body': body.decode('utf-8')}
+        
+    except Exception as e:
+        print(f"❌ Error in query-logs-export: {e}")
+        import traceback
+        traceback.print_exc()
+        return error_response(e, origin)
+
+# Bits de GROUPING(in_period, is_today, team, day, category) para cada grouping set
+TRUST_GSET_PERIOD = 0b01111      # (in_period)
+TRUST_GSET_TODAY = 0b10111       # (is_today)
+TRUST_GSET_TEAM_DAY = 0b01001    # (in_period, team, day)
+TRUST_GSET_CATEGORY = 0b01110    # (in_period, category)
+TRUST_GSET_DAY = 0b01101         # (in_period, day)
+
+TRUST_ANALYTICS_SQL = """
+    WITH window_rows AS (
+        SELECT 
+            created_at >= %(start_date)s as in_period,
+            created_at >= %(today_start)s as is_today,
+            app_name as team,
+            DATE(created_at) as day,
+            llm_trust_category as category,
+            confidence_score
+        FROM web_queries
+        WHERE created_at >= %(scan_start)s
+    )
+    SELECT 
+        GROUPING(in_period, is_today, team, day, category) as gset,
+        in_period,
+        is_today,
+        team,
+        day,
+        category,
+        COUNT(*) as row_count,
+        COUNT(confidence_score) as scored_count,
+        AVG(confidence_score) as avg_trust,
+        MIN(confidence_score) as min_trust,
+        MAX(confidence_score) as max_trust,
+        COUNT(*) FILTER (WHERE category = 'high' AND confidence_score IS NOT NULL) as high_scored,
+        COUNT(*) FILTER (WHERE category = 'low') as low_count,
+        COUNT(*) FILTER (WHERE category = 'medium') as medium_count,
+        COUNT(*) FILTER (WHERE category = 'high') as high_count
+    FROM window_rows
+    GROUP BY GROUPING SETS (
+        (in_period),
+        (is_today),
+        (in_period, team, day),
+        (in_period, category),
+        (in_period, day)
+    )
+"""
+
+# p80 solo de los indicadores (periodo y hoy): en TRUST_ANALYTICS_SQL se ordenaría
+# cada grupo de los cinco grouping sets para usar solo dos
+TRUST_P80_SQL = """
+    SELECT 
+        PERCENTILE_CONT(0.8) WITHIN GROUP (ORDER BY confidence_score)
+            FILTER (WHERE created_at >= %(start_date)s) as p80_period,
+        PERCENTILE_CONT(0.8) WITHIN GROUP (ORDER BY confidence_score)
+            FILTER (WHERE created_at >= %(today_start)s) as p80_today
+    FROM web_queries
+    WHERE created_at >= %(scan_start)s
+"""
+
+def trust_indicators(row):
+    """avg / p80 / % de confianza alta de un grouping set de indicadores"""
+    if not row or not row['scored_count']:
+        return {'avg_trust': 0.0, 'p80_trust': 0.0, 'high_rate': 0.0}
+    return {
+        'avg_trust': float(row['avg_trust'] or 0),
+        'p80_trust': float(row.get('p80_trust') or 0),
+        'high_rate': row['high_scored'] * 100.0 / row['scored_count']
+    }
+
+def build_trust_analytics(rows):
+    """Reparte las filas del GROUPING SETS en las secciones de /trust-analytics"""
+    today_row = None
+    period_row = None
+    trust_by_team_day = []
+    trust_by_typology = []
+    trust_distribution = {}
+    trust_levels = []
+    
+    for row in rows:
+        gset = row['gset']
+        
+        if gset == TRUST_GSET_TODAY:
+            if row['is_today']:
+                today_row = row
+            continue
+        
+        # El resto de grouping sets incluye in_period: descartamos filas previas al periodo
+        if not row['in_period']:
+            continue
+        
+        if gset == TRUST_GSET_PERIOD:
+            period_row = row
+        
+        elif gset == TRUST_GSET_TEAM_DAY:
+            if row['team'] is not None and row['scored_count']:
+                trust_by_team_day.append({
+                    'team': row['team'],
+                    'date': row['day'],
+                    'avg_trust': row['avg_trust']
+                })
+        
+        elif gset == TRUST_GSET_CATEGORY:
+            if row['scored_count']:
+                trust_by_typology.append({
+                    'strategy_type': row['category'] or 'unknown',
+                    'avg_trust': row['avg_trust'],
+                    'query_count': row['scored_count'],
+                    'min_trust': row['min_trust'],
+                    'max_trust': row['max_trust']
+                })
+            if row['category'] is not None:
+                trust_distribution[row['category']] = row['row_count']
+        
+        elif gset == TRUST_GSET_DAY:
+            if row['low_count'] or row['medium_count'] or row['high_count']:
+                trust_levels.append({
+                    'date': row['day'],
+                    'low_count': row['low_count'],
+                    'medium_count': row['medium_count'],
+                    'high_count': row['high_count']
+                })
+    
+    trust_by_team_day.sort(key=lambda r: (r['team'], r['date']))
+    # trustEvolutionByTeam es la misma agregación team×day con otro orden
+    trust_evolution = sorted(trust_by_team_day, key=lambda r: (r['date'], r['team']))
+    trust_by_typology.sort(key=lambda r: r['avg_trust'], reverse=True)
+    trust_levels.sort(key=lambda r: r['date'])
+    
+    today_metrics = trust_indicators(today_row)
+    period_metrics = trust_indicators(period_row)
+    
+    return {
+        'indicators': {
+            'avgTrustToday': today_metrics['avg_trust'],
+            'avgTrustPeriod': period_metrics['avg_trust'],
+            'percentile80Today': today_metrics['p80_trust'],
+            'percentile80Period': period_metrics['p80_trust'],
+            'highConfidenceRateToday': today_metrics['high_rate'],
+            'highConfidenceRatePeriod': period_metrics['high_rate']
+        },
+        'tables': {
+            'trustByTeamDay': trust_by_team_day,
+            'trustByTypology': trust_by_typology
+        },
+        'charts': {
+            'trustDistribution': trust_distribution,
+            'trustEvolutionByTeam': trust_evolution,
+            'trustLevelsEvolution': trust_levels
         }
+    }
+
+def trust_rows_from_rollup(buckets, today):
+    """
+    Convierte acumuladores del rollup {(day, app_name, trust_category): DailyBucket}
+    en filas con la misma forma que TRUST_ANALYTICS_SQL para build_trust_analytics
+    """
+    import rollup
+    
+    groups = {}
+    
+    def add(gset, keys, category, bucket):
+        group = groups.get((gset, keys))
+        if group is None:
+            group = groups[(gset, keys)] = {'bucket': rollup.DailyBucket(), 'by_category': {}}
+        group['bucket'].merge(bucket)
+        counts = group['by_category'].setdefault(category, [0, 0])
+        counts[0] += bucket.query_count
+        counts[1] += bucket.scored_count
+    
+    for (day, team, category), bucket in buckets.items():
+        team = team or None
+        category = category or None
+        add(TRUST_GSET_PERIOD, (True, None, None, None, None), category, bucket)
+        if day == today:
+            add(TRUST_GSET_TODAY, (None, True, None, None, None), category, bucket)
+        add(TRUST_GSET_TEAM_DAY, (True, None, team, day, None), category, bucket)
+        add(TRUST_GSET_CATEGORY, (True, None, None, None, category), category, bucket)
+        add(TRUST_GSET_DAY, (True, None, None, day, None), category, bucket)
+    
+    rows = []
+    for (gset, (in_period, is_today, team, day, category)), group in groups.items():
+        bucket = group['bucket']
+        by_category = group['by_category']
+        rows.append({
+            'gset': gset,
+            'in_period': in_period,
+            'is_today': is_today,
+            'team': team,
+            'day': day,
+            'category': category,
+            'row_count': bucket.query_count,
+            'scored_count': bucket.scored_count,
+            'avg_trust': bucket.confidence_sum / bucket.scored_count if bucket.scored_count else None,
+            'min_trust': bucket.confidence_min,
+            'max_trust': bucket.confidence_max,
+            # El p80 solo se muestra en los indicadores de periodo y hoy
+            'p80_trust': bucket.confidence_sketch.quantile(0.8)
+            if gset in (TRUST_GSET_PERIOD, TRUST_GSET_TODAY) else None,
+            'high_scored': by_category.get('high', [0, 0])[1],
+            'low_count': by_category.get('low', [0, 0])[0],
+            'medium_count': by_category.get('medium', [0, 0])[0],
+            'high_count': by_category.get('high', [0, 0])[0]
+        })
+    return rows
+
+def handle_trust_analytics(query_params, origin=None):
+    """Endpoint: /trust-analytics"""
+    import rollup
+    
+    print("📊 Handling /trust-analytics request")
+    
+    try:
+        days = parse_int_param(query_params, 'days', 7, minimum=1)
+    except ValueError as e:
+        return create_response(400, {'error': str(e)}, origin)
+    
+    try:
+        # Calculate date range
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+        today_start = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
         
-        return create_response(200, response, origin)
+        timings = {}
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            boundary = rollup.rollup_boundary(cursor)
+            
+            started = time.perf_counter()
+            if boundary is not None:
+                # Días completos (desde el día de start_date) del rollup + filas del día en curso
+                buckets = rollup.load_daily_buckets(cursor, boundary, start_day=start_date.date())
+                timings['rollup_ms'] = round((time.perf_counter() - started) * 1000, 2)
+                rows = trust_rows_from_rollup(buckets, today_start.date())
+            else:
+                # Una sola pasada sobre la ventana: indicadores, team×day, categorías y niveles por día
+                sql_params = {
+                    'start_date': start_date,
+                    'today_start': today_start,
+                    'scan_start': min(start_date, today_start)
+                }
+                cursor.execute(TRUST_ANALYTICS_SQL, sql_params)
+                timings['scan_ms'] = round((time.perf_counter() - started) * 1000, 2)
+                
+                started = time.perf_counter()
+                rows = cursor.fetchall()
+                timings['fetch_ms'] = round((time.perf_counter() - started) * 1000, 2)
+                
+                started = time.perf_counter()
+                cursor.execute(TRUST_P80_SQL, sql_params)
+                p80 = cursor.fetchone()
+                timings['p80_ms'] = round((time.perf_counter() - started) * 1000, 2)
+                p80_by_gset = {TRUST_GSET_PERIOD: p80['p80_period'], TRUST_GSET_TODAY: p80['p80_today']}
+                for row in rows:
+                    row['p80_trust'] = p80_by_gset.get(row['gset'])
+        
+        started = time.perf_counter()
+        response = build_trust_analytics(rows)
+        timings['build_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        
+        print(f"⏱️ trust-analytics timings: {timings}")
+        
+        return with_server_timing(create_response(200, response, origin), timings)
         
     except Exception as e:
         print(f"❌ Error in trust-analytics: {e}")
         import traceback
         traceback.print_exc()
-        return create_response(500, {'error': str(e)}, origin)
+        return error_response(e, origin)
 
-def handle_query_log_detail(query_id, origin=None):
-    """Endpoint: /query-logs/{id}"""
-    print(f"📊 Handling /query-logs/{query_id} request")
+# Columnas con sketch en el rollup -> columna de web_queries para el cálculo exacto
+PERCENTILE_METRICS = {'confidence': 'confidence_score', 'latency': 'response_time_ms'}
+
+def exact_percentiles(cursor, start_date, end_date, teams, quantiles):
+    """Sin rollup: PERCENTILE_CONT exacto por equipo y total en una pasada (GROUPING SETS)"""
+    import sketches
+    
+    clauses = ["created_at >= %(start)s", "created_at < %(end)s"]
+    params = {'start': start_date, 'end': end_date + timedelta(days=1), 'quantiles': list(quantiles)}
+    if teams:
+        clauses.append("app_name = ANY(%(teams)s)")
+        params['teams'] = list(teams)
+    
+    metric_sql = ",\n".join(
+        f"""
+            COUNT({column}) as {metric}_count,
+            AVG({column}) as {metric}_mean,
+            MIN({column}) as {metric}_min,
+            MAX({column}) as {metric}_max,
+            PERCENTILE_CONT(%(quantiles)s::float8[]) WITHIN GROUP (ORDER BY {column}) as {metric}_quantiles"""
+        for metric, column in PERCENTILE_METRICS.items()
+    )
+    cursor.execute(f"""
+        SELECT 
+            GROUPING(app_name) as is_total,
+            COALESCE(app_name, '') as team,
+            {metric_sql}
+        FROM web_queries
+        WHERE {" AND ".join(clauses)}
+        GROUP BY GROUPING SETS ((app_name), ())
+    """, params)
+    
+    overall, by_team = None, {}
+    for row in cursor.fetchall():
+        entry = {}
+        for metric in PERCENTILE_METRICS:
+            values = row[f'{metric}_quantiles'] or [None] * len(quantiles)
+            entry[metric] = {
+                'count': row[f'{metric}_count'],
+                'mean': float(row[f'{metric}_mean']) if row[f'{metric}_mean'] is not None else None,
+                'min': float(row[f'{metric}_min']) if row[f'{metric}_min'] is not None else None,
+                'max': float(row[f'{metric}_max']) if row[f'{metric}_max'] is not None else None,
+                **{sketches.quantile_label(q): value for q, value in zip(quantiles, values)}
+            }
+        if row['is_total']:
+            overall = entry
+        else:
+            by_team[row['team']] = entry
+    return overall, by_team
+
+def handle_percentiles(query_params, origin=None):
+    """
+    Endpoint: /percentiles
+    Cuantiles de confianza y latencia para un rango de días y un subconjunto de equipos,
+    combinando los sketches diarios del rollup (sin ordenar filas en bruto).
+    Parámetros: start_date, end_date (YYYY-MM-DD; por defecto últimos 7 días),
+    teams (separados por comas), quantiles (por defecto 0.5,0.8,0.95,0.99)
+    """
+    import rollup
+    import sketches
+    
+    print("📊 Handling /percentiles request")
+    
+    try:
+        start_date, end_date = parse_day_range(query_params, 7)
+        quantiles = sketches.parse_quantiles(query_params.get('quantiles', [''])[0]) \
+            if query_params.get('quantiles') else sketches.DEFAULT_QUANTILES
+    except ValueError as e:
+        return create_response(400, {'error': str(e)}, origin)
+    
+    teams = [team.strip() for value in query_params.get('teams', []) for team in value.split(',') if team.strip()]
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        started = time.perf_counter()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            boundary = rollup.rollup_boundary(cursor)
+            
+            if boundary is not None:
+                source = 'sketch'
+                by_team_sketches = rollup.load_sketches(cursor, boundary, start_date, end_date, teams or None)
+                by_team = {
+                    team: {metric: entry[metric].summary(quantiles) for metric in PERCENTILE_METRICS}
+                    for team, entry in by_team_sketches.items()
+                }
+                overall = {
+                    metric: sketches.merge_sketches(entry[metric] for entry in by_team_sketches.values()).summary(quantiles)
+                    for metric in PERCENTILE_METRICS
+                }
+            else:
+                source = 'exact'
+                overall, by_team = exact_percentiles(cursor, start_date, end_date, teams, quantiles)
         
-        # Get query log
-        cursor.execute("""
-            SELECT 
-                id as query_id,
-                user_name as user_id,
-                created_at as request_timestamp,
-                response_timestamp,
-                person_name as person,
-                person_name as person_name,
-                app_name as team,
-                app_name as iam_group,
-                user_name,
-                session_token,
-                conversation_id_bedrock,
-                query_text as user_query,
-                llm_response,
-                COALESCE(status, 'completed') as status,
-                COALESCE(response_time_ms, 0) as processing_time_ms,
-                COALESCE(response_time_ms, 0) as response_time_ms,
-                tokens_input,
-                tokens_output,
-                tokens_total,
-                tokens_total as tokens_used,
-                'claude-3-haiku' as model_id,
-                COALESCE(app_name, 'general-kb') as knowledge_base_id,
-                COALESCE(confidence_score, 0) as llm_trust,
-                COALESCE(confidence_score, 0) as confidence_score,
-                llm_trust_category,
-                tools_used,
-                tool_results,
-                retrieved_docs_count
-            FROM web_queries
-            WHERE id = %s
-        """, [query_id])
+        timings = {'query_ms': round((time.perf_counter() - started) * 1000, 2)}
+        
+        return with_server_timing(create_response(200, {
+            'startDate': start_date,
+            'endDate': end_date,
+            'teams': teams,
+            'quantiles': [sketches.quantile_label(q) for q in quantiles],
+            'source': source,
+            'relativeAccuracy': sketches.DEFAULT_RELATIVE_ACCURACY if source == 'sketch' else 0,
+            'overall': overall or {metric: {'count': 0} for metric in PERCENTILE_METRICS},
+            'byTeam': by_team
+        }, origin), timings)
+        
+    except Exception as e:
+        print(f"❌ Error in percentiles: {e}")
+        return error_response(e, origin)
+
+# Ventana por defecto de /usage
+USAGE_DEFAULT_DAYS = int(os.environ.get('USAGE_DEFAULT_DAYS', '30'))
+
+def handle_usage(query_params, origin=None):
+    """
+    Endpoint: /usage
+    Consultas, tokens y coste por team / person / day / model. Los días completos
+    se suman en web_queries_daily y el resto se agrupa en SQL, en paralelo.
+    Parámetros: start_date, end_date (YYYY-MM-DD) o days (por defecto
+    USAGE_DEFAULT_DAYS), group_by (p.ej. team,day; por defecto team),
+    teams (separados por comas), person
+    """
+    import rollup
+    import usage
+    
+    print("📊 Handling /usage request")
+    
+    try:
+        start_day, end_day = parse_day_range(query_params, USAGE_DEFAULT_DAYS)
+        group_by = usage.parse_group_by(query_params.get('group_by', ['team'])[0])
+    except ValueError as e:
+        return create_response(400, {'error': str(e)}, origin)
+    
+    teams = [team.strip() for value in query_params.get('teams', []) for team in value.split(',') if team.strip()]
+    person = query_params.get('person', [None])[0]
+    
+    try:
+        started = time.perf_counter()
+        with db_connection() as conn:
+            boundary = rollup.rollup_boundary(conn.cursor())
+        
+        results = run_concurrently(
+            usage.usage_tasks(boundary, start_day, end_day, group_by, teams, person),
+            label='usage'
+        )
+        groups = usage.merge_rows(results.values(), group_by)
+        timings = {'query_ms': round((time.perf_counter() - started) * 1000, 2)}
+        
+        return with_server_timing(create_response(200, {
+            'startDate': start_day,
+            'endDate': end_day,
+            'groupBy': list(group_by),
+            'teams': teams,
+            'person': person,
+            'source': 'rollup' if boundary is not None else 'raw',
+            **usage.build_usage(groups, group_by)
+        }, origin), timings)
+        
+    except Exception as e:
+        print(f"❌ Error in usage: {e}")
+        return error_response(e, origin)
+
+# El detalle devuelve los cuerpos completos y la categoría de confianza sin traducir
+QUERY_LOG_DETAIL_FIELDS = [
+    'query_id', 'user_id', 'request_timestamp', 'response_timestamp', 'person', 'person_name',
+    'team', 'iam_group', 'user_name', 'session_token', 'conversation_id_bedrock',
+    'user_query', 'llm_response', 'status', 'processing_time_ms', 'response_time_ms',
+    'tokens_input', 'tokens_output', 'tokens_total', 'tokens_used', 'retrieved_docs_count',
+    'model_id', 'knowledge_base_id', 'llm_trust', 'confidence_score', 'llm_trust_category',
+    'tools_used', 'tool_results'
+]
+QUERY_LOG_DETAIL_COLUMNS = {
+    **QUERY_LOG_COLUMNS,
+    'response_time_ms': "COALESCE(response_time_ms, 0)",
+    'retrieved_docs_count': "retrieved_docs_count",
+    'llm_trust_category': "llm_trust_category",
+    'tool_results': "tool_results"
+}
+
+def query_log_detail_encoder():
+    """Encoder del detalle: se compila en la primera petición de detalle, no en el init"""
+    return serialization.get_row_encoder('query-log-detail', QUERY_LOG_DETAIL_FIELDS,
+                                         QUERY_LOG_DETAIL_COLUMNS, QUERY_LOG_CONVERTERS)
+
+def handle_query_log_detail(query_id, query_params=None, origin=None):
+    """
+    Endpoint: /query-logs/{id}
+    Parámetro opcional at (created_at de la fila, p.ej. el timestamp del listado):
+    con él la búsqueda solo lee la partición de ese instante
+    """
+    print(f"📊 Handling /query-logs/{query_id} request")
+    
+    where_clauses = ["id = %s"]
+    params = [query_id]
+    at = (query_params or {}).get('at', [None])[0]
+    if at:
+        try:
+            at = datetime.fromisoformat(at.replace('Z', '+00:00'))
+        except ValueError:
+            return create_response(400, {'error': 'at must be an ISO timestamp'}, origin)
+        # Margen de un día: tolera redondeos y desfases de zona horaria y sigue
+        # limitando la búsqueda a una o dos particiones
+        at = at.replace(tzinfo=None)
+        where_clauses.append("created_at >= %s AND created_at < %s")
+        params.extend([at - timedelta(days=1), at + timedelta(days=1)])
+    
+    encoder = query_log_detail_encoder()
+    try:
+        with db_connection() as conn:
+            cursor = tuple_cursor(conn)
         
-        row = cursor.fetchone()
+            # Get query log
+            cursor.execute(f"""
+                SELECT 
+                    {encoder.select_sql}
+                FROM web_queries
+                WHERE {" AND ".join(where_clauses)}
+            """, params)
         
-        if not row:
-            conn.close()
-            return create_response(404, {'error': 'Query log not found'}, origin)
+            row = cursor.fetchone()
         
-        conn.close()
+            if not row:
+                return create_response(404, {'error': 'Query log not found'}, origin)
         
         # Format data
-        data = {
-            'query_id': str(row['query_id']),
-            'user_id': row['user_id'],
-            'request_timestamp': row['request_timestamp'].isoformat() if row['request_timestamp'] else None,
-            'response_timestamp': row['response_timestamp'].isoformat() if row['response_timestamp'] else None,
-            'person': row['person'],
-            'person_name': row['person_name'],
-            'team': row['team'],
-            'iam_group': row['iam_group'],
-            'user_name': row['user_name'],
-            'session_token': row['session_token'],
-            'conversation_id_bedrock': row['conversation_id_bedrock'],
-            'user_query': row['user_query'],
-            'llm_response': row['llm_response'],
-            'status': row['status'],
-            'processing_time_ms': float(row['processing_time_ms']) if row['processing_time_ms'] else 0,
-            'response_time_ms': float(row['response_time_ms']) if row['response_time_ms'] else 0,
-            'tokens_input': row['tokens_input'],
-            'tokens_output': row['tokens_output'],
-            'tokens_total': row['tokens_total'],
-            'tokens_used': row['tokens_used'],
-            'retrieved_docs_count': row['retrieved_docs_count'],
-            'model_id': row['model_id'],
-            'knowledge_base_id': row['knowledge_base_id'],
-            'llm_trust': float(row['llm_trust']) if row['llm_trust'] else 0,
-            'confidence_score': float(row['confidence_score']) if row['confidence_score'] else 0,
-            'llm_trust_category': row['llm_trust_category'],
-            'tools_used': row['tools_used'],
-            'tool_results': row['tool_results']
-        }
+        data = encoder.encode(row)
         
         return create_response(200, data, origin)
         
     except Exception as e:
         print(f"❌ Error in query-log-detail: {e}")
-        return create_response(500, {'error': str(e)}, origin)
+        return error_response(e, origin)
+
+# Conversaciones por página en /conversations y turnos como máximo en /conversations/{id}
+CONVERSATIONS_MAX_LIMIT = int(os.environ.get('CONVERSATIONS_MAX_LIMIT', '500'))
+CONVERSATION_MAX_TURNS = int(os.environ.get('CONVERSATION_MAX_TURNS', '500'))
+
+def handle_conversations(query_params, origin=None):
+    """
+    Endpoint: /conversations
+    Resúmenes por conversación (turnos, tokens, primer/último turno, confianza
+    media, herramientas) por last_at DESC con paginación keyset (after=).
+    Parámetros: person, team, start_date / end_date (YYYY-MM-DD, conversaciones
+    activas en el rango), limit
+    """
+    import conversations
+    
+    print("📊 Handling /conversations request")
+    
+    try:
+        limit = min(parse_int_param(query_params, 'limit', 50, minimum=1), CONVERSATIONS_MAX_LIMIT)
+        start = parse_timestamp_param(query_params, 'start_date')
+        end = parse_timestamp_param(query_params, 'end_date', end=True)
+        after = None
+        if query_params.get('after'):
+            after = decode_cursor(query_params['after'][0])
+    except ValueError as e:
+        return create_response(400, {'error': str(e)}, origin)
+    
+    try:
+        with db_connection() as conn:
+            rows, has_more, watermark = conversations.list_conversations(
+                conn,
+                person=query_params.get('person', [None])[0],
+                team=query_params.get('team', [None])[0],
+                start=start, end=end, after=after, limit=limit
+            )
+        
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor(rows[-1]['last_at'], rows[-1]['conversation_id'])
+        
+        return create_response(200, {
+            'data': [conversations.to_response(row) for row in rows],
+            'limit': limit,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'summary_watermark': watermark
+        }, origin)
+        
+    except Exception as e:
+        print(f"❌ Error in conversations: {e}")
+        return error_response(e, origin)
+
+def handle_conversation_detail(conversation_id, query_params=None, origin=None):
+    """
+    Endpoint: /conversations/{id}
+    Resumen de la conversación y sus turnos en orden, en una sola consulta por
+    el índice (conversation_id_bedrock, created_at, id) desde su primer turno.
+    Los turnos aceptan fields / view / preview_length como /query-logs
+    """
+    import conversations
+    
+    print(f"📊 Handling /conversations/{conversation_id} request")
+    
+    query_params = query_params or {}
+    try:
+        fields = resolve_query_log_fields(query_params)
+        preview_length = min(parse_int_param(query_params, 'preview_length', QUERY_LOGS_PREVIEW_LENGTH),
+                             QUERY_LOGS_MAX_PREVIEW_LENGTH)
+    except ValueError as e:
+        return create_response(400, {'error': str(e)}, origin)
+    encoder = query_log_encoder(fields, preview_length)
+    
+    try:
+        with db_connection() as conn:
+            summary, watermark = conversations.get_conversation(conn, conversation_id)
+            if summary is None:
+                return create_response(404, {'error': 'Conversation not found'}, origin)
+        
+            # created_at >= primer turno: solo las particiones de la conversación
+            cursor = tuple_cursor(conn)
+            cursor.execute(f"""
+                SELECT 
+                    {encoder.select_sql}
+                FROM web_queries
+                WHERE conversation_id_bedrock = %s AND created_at >= %s
+                ORDER BY created_at, id
+                LIMIT %s
+            """, [conversation_id, summary['first_at'], CONVERSATION_MAX_TURNS + 1])
+            rows = cursor.fetchall()
+        
+        return create_response(200, {
+            'conversation': conversations.to_response(summary),
+            'turns': encoder.encode_all(rows[:CONVERSATION_MAX_TURNS]),
+            'truncated': len(rows) > CONVERSATION_MAX_TURNS,
+            'fields': fields,
+            'preview_length': preview_length,
+            'summary_watermark': watermark
+        }, origin)
+        
+    except Exception as e:
+        print(f"❌ Error in conversation-detail: {e}")
+        return error_response(e, origin)
+
+def handle_rollup_refresh(event):
+    """
+    Scheduled event: procesa las filas nuevas de web_queries en web_queries_daily,
+    el resumen por conversación y el catálogo de filtros
+    """
+    import conversations
+    import dimensions
+    import partitions
+    import rollup
+    
+    print("📊 Handling rollup refresh")
+    
+    try:
+        with db_connection() as conn:
+            summary = rollup.refresh_daily_rollup(conn)
+            summary['conversations'] = conversations.refresh_conversations(conn)
+            summary['dimensions'] = dimensions.refresh_dimensions(conn)
+            # Particiones futuras (y retención si está configurada) en el mismo evento programado
+            summary['partitions'] = partitions.maintain_partitions(conn)
+        print(f"✅ Rollup refreshed: {summary}")
+        
+        # Los agregados han cambiado: descartamos las respuestas cacheadas
+        if summary['batches']:
+            response_cache.get_cache().invalidate()
+        return create_response(200, summary)
+    
+    except Exception as e:
+        print(f"❌ Error in rollup refresh: {e}")
+        import traceback
+        traceback.print_exc()
+        return create_response(500, {'error': str(e)})
+
+def handle_migrate(event):
+    """Evento {"action": "migrate"}: crea los índices de web_queries que falten"""
+    import migrations
+    
+    print("🔧 Handling index migration")
+    
+    try:
+        with db_connection() as conn:
+            summary = migrations.apply_indexes(conn, analyze=event.get('analyze', True))
+        print(f"✅ Indexes: {summary}")
+        return create_response(200, summary)
+    
+    except Exception as e:
+        print(f"❌ Error in migration: {e}")
+        import traceback
+        traceback.print_exc()
+        return create_response(500, {'error': str(e)})
+
+def handle_maintain_partitions(event):
+    """Evento {"action": "maintain-partitions"}: particiones futuras y retención de web_queries"""
+    import partitions
+    
+    print("🗂️ Handling partition maintenance")
+    
+    try:
+        with db_connection() as conn:
+            summary = partitions.maintain_partitions(
+                conn,
+                ahead=event.get('ahead', partitions.PARTITIONS_AHEAD),
+                retention_days=event.get('retention_days', partitions.PARTITION_RETENTION_DAYS),
+                mode=event.get('mode', partitions.PARTITION_RETENTION_MODE)
+            )
+        print(f"✅ Partitions: {summary}")
+        # Las particiones desancladas ya no aparecen en las respuestas
+        if summary.get('detached'):
+            response_cache.get_cache().invalidate()
+        return create_response(200, summary)
+    
+    except Exception as e:
+        print(f"❌ Error in partition maintenance: {e}")
+        import traceback
+        traceback.print_exc()
+        return create_response(500, {'error': str(e)})
+
+def handle_batch(event, headers, origin=None, remaining=None):
+    """
+    POST /batch: varias sub-peticiones en una sola invocación.
+    Las idénticas se ejecutan una vez y cada una pasa por la caché de respuestas.
+    Cada una usa el statement_timeout de su endpoint, todas con el mismo límite de la invocación.
+    """
+    import batch
+    
+    deadline = time.monotonic() + remaining / 1000 if remaining else None
+    try:
+        requests = batch.parse_batch(batch.read_event_body(event))
+    except (batch.BatchError, ValueError) as e:
+        return create_response(400, {'error': str(e)}, origin)
+
+    cache_control = headers.get('cache-control') or headers.get('Cache-Control')
+
+    def execute(path, query_params, etag):
+        sub_headers = {'Cache-Control': cache_control or '', 'If-None-Match': etag or ''}
+        endpoint = endpoint_name(path)
+        try:
+            with instrumentation.tags(handler=endpoint), db_session(endpoint, deadline=deadline):
+                return response_cache.cached_call(
+                    path, query_params, sub_headers,
+                    lambda: route_request(path, query_params, origin)
+                )
+        except Exception as e:
+            print(f"❌ Error in batch sub-request {path}: {e}")
+            return error_response(e, origin)
+
+    responses, stats = batch.run_batch(requests, execute)
+    print(f"✅ Batch: {stats}")
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json'
+        },
+        'body': batch.build_batch_body(responses, stats)
+    }
+
+def endpoint_name(path):
+    """Ruta normalizada para métricas y timeouts: /query-logs/123 -> /query-logs/{id}"""
+    endpoint = response_cache.normalize_path(path)
+    if endpoint.startswith('/query-logs/') and endpoint != '/query-logs/export':
+        endpoint = '/query-logs/{id}'
+    elif endpoint.startswith('/conversations/'):
+        endpoint = '/conversations/{id}'
+    return endpoint
+
+def remaining_ms(context):
+    """Tiempo que le queda a la invocación (None fuera de Lambda)"""
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    return get_remaining() if get_remaining else None
+
+def handle_metrics(query_params, origin=None):
+    """Endpoint: /metrics"""
+    return create_response(200, {
+        **instrumentation.get_metrics(),
+        'init_ms': INIT_MS,
+        'pool': get_pool_stats(),
+        'cache': response_cache.get_cache().get_stats()
+    }, origin)
+
+def handle_health(query_params, origin=None):
+    """Endpoint: /health"""
+    return create_response(200, {
+        'status': 'healthy',
+        'service': 'dashboard-lambda-rds',
+        'version': '3.0.0',
+        'pool': get_pool_stats(),
+        'cache': response_cache.get_cache().get_stats()
+    }, origin)
+
+# Rutas servidas también bajo /api/dashboard
+API_ROUTES = {
+    '/analytics': handle_analytics,
+    '/filters': handle_filters,
+    '/query-logs': handle_query_logs,
+    '/query-logs/export': handle_query_logs_export,
+    '/user-metrics': handle_user_metrics,
+    '/team-metrics': handle_team_metrics,
+    '/percentiles': handle_percentiles,
+    '/conversations': handle_conversations,
+    '/usage': handle_usage
+}
+# Rutas solo en la raíz
+ROOT_ROUTES = {
+    '/trust-analytics': handle_trust_analytics,
+    '/metrics': handle_metrics,
+    '/health': handle_health
+}
+# Tabla precalculada path exacto -> handler: un único lookup por petición
+ROUTE_TABLE = {
+    **{path: handler for path, handler in API_ROUTES.items()},
+    **{response_cache.PATH_PREFIX + path: handler for path, handler in API_ROUTES.items()},
+    **ROOT_ROUTES
+}
+QUERY_LOG_DETAIL_RE = re.compile(r'^(?:/api/dashboard)?/query-logs/([^/]+)$')
+CONVERSATION_DETAIL_RE = re.compile(r'^(?:/api/dashboard)?/conversations/([^/]+)$')
+
+def route_request(path, query_params, origin=None):
+    """Despacha path al handler correspondiente - todos reciben origin para CORS"""
+    handler = ROUTE_TABLE.get(path)
+    if handler is not None:
+        return handler(query_params, origin)
+    
+    match = QUERY_LOG_DETAIL_RE.match(path)
+    if match:
+        return handle_query_log_detail(match.group(1), query_params, origin)
+    
+    match = CONVERSATION_DETAIL_RE.match(path)
+    if match:
+        return handle_conversation_detail(match.group(1), query_params, origin)
+    
+    return create_response(404, {'error': 'Endpoint not found'}, origin)
+
+def handle_oversized_response(path, query_params, response, accept_encoding, origin=None):
+    """
+    Respuesta por encima del límite de Lambda (6 MB).
+    /query-logs en modo cursor se repite con un limit menor (el cliente sigue con next_cursor);
+    en el resto de casos se devuelve 413 indicando cómo paginar o exportar.
+    """
+    import compression
+    
+    size = compression.response_size(response)
+    ratio = compression.MAX_RESPONSE_BYTES / size
+    print(f"⚠️ Response for {path} too large ({size} bytes)")
+    
+    is_query_logs = response_cache.normalize_path(path) == '/query-logs'
+    limit = int(query_params.get('limit', ['100'])[0])
+    suggested_limit = max(1, int(limit * ratio * 0.8))
+    
+    if is_query_logs and ('after' in query_params or query_params.get('pagination', [''])[0] == 'cursor'):
+        if suggested_limit < limit:
+            retry_params = {**query_params, 'limit': [str(suggested_limit)]}
+            retry = compression.compress_response(handle_query_logs(retry_params, origin), accept_encoding)
+            if compression.response_size(retry) <= compression.MAX_RESPONSE_BYTES:
+                return retry
+    
+    body = {
+        'error': 'Response too large',
+        'max_bytes': compression.MAX_RESPONSE_BYTES,
+        'response_bytes': size
+    }
+    if is_query_logs:
+        body['suggestion'] = {
+            'pagination': 'cursor',
+            'limit': suggested_limit,
+            'view': 'summary',
+            'export': '/query-logs/export'
+        }
+    return create_response(413, body, origin)
 
 def lambda_handler(event, context):
     """
     Main Lambda handler - Direct RDS connection
     """
-    print(f"📊 Lambda invoked - Event: {json.dumps(event)}")
+    # El evento completo solo con LOG_LEVEL=DEBUG: serializarlo en cada invocación tiene coste
+    if instrumentation.log_enabled('DEBUG'):
+        print(f"📊 Lambda invoked - Event: {json.dumps(event)}")
+    
+    # Scheduled event (EventBridge): refresco incremental del rollup diario
+    if event.get('source') == 'aws.events' or event.get('action') == 'refresh-rollup':
+        return handle_rollup_refresh(event)
+    if event.get('action') == 'migrate':
+        return handle_migrate(event)
+    if event.get('action') == 'maintain-partitions':
+        return handle_maintain_partitions(event)
     
     # Extract origin for CORS
     headers = event.get('headers', {})
@@ -520,47 +1731,60 @@ def lambda_handler(event, context):
     
     # Parse query string if it's a string
     if isinstance(query_string, str):
+        from urllib.parse import parse_qs
         query_params = parse_qs(query_string)
     else:
         query_params = {k: [v] for k, v in query_string.items()}
     
-    print(f"🔄 {method} {path}")
-    print(f"📝 Query params: {query_params}")
-    print(f"🌐 Origin: {origin}")
+    instrumentation.log('INFO', f"🔄 {method} {path}")
+    instrumentation.log('DEBUG', f"📝 Query params: {query_params}")
+    instrumentation.log('DEBUG', f"🌐 Origin: {origin}")
+    
+    endpoint = endpoint_name(path)
+    trace = instrumentation.start_trace(method, path)
+    response = None
     
     try:
-        # Route to appropriate handler - todos pasan origin para CORS correcto
-        if path == '/analytics' or path == '/api/dashboard/analytics':
-            return handle_analytics(query_params, origin)
-        
-        elif path == '/filters' or path == '/api/dashboard/filters':
-            return handle_filters(query_params, origin)
-        
-        elif path == '/query-logs' or path == '/api/dashboard/query-logs':
-            return handle_query_logs(query_params, origin)
-        
-        elif path.startswith('/query-logs/') or path.startswith('/api/dashboard/query-logs/'):
-            query_id = path.split('/')[-1]
-            return handle_query_log_detail(query_id, origin)
+        if endpoint == '/batch':
+            if method != 'POST':
+                response = create_response(405, {'error': 'Use POST for /batch'}, origin)
+            else:
+                response = handle_batch(event, headers, origin, remaining_ms(context))
+        else:
+            # Los endpoints de analytics se sirven desde caché mientras su TTL siga vigente.
+            # Solo lectura (réplica si existe) y statement_timeout del endpoint, acotado
+            # por el tiempo que le queda a la invocación
+            with instrumentation.tags(handler=endpoint), db_session(endpoint, remaining_ms=remaining_ms(context)):
+                response = response_cache.cached_call(
+                    path, query_params, headers,
+                    lambda: route_request(path, query_params, origin)
+                )
+
+        import compression
         
-        elif path == '/trust-analytics':
-            return handle_trust_analytics(query_params, origin)
+        accept_encoding = headers.get('accept-encoding') or headers.get('Accept-Encoding')
+        response = compression.compress_response(response, accept_encoding)
         
-        elif path == '/health':
-            return create_response(200, {
-                'status': 'healthy',
-                'service': 'dashboard-lambda-rds',
-                'version': '3.0.0'
-            }, origin)
+        # La exportación ya se corta sola por tamaño (EXPORT_MAX_BYTES) y devuelve X-Next-Cursor
+        if endpoint != '/query-logs/export' and \
+                compression.response_size(response) > compression.MAX_RESPONSE_BYTES:
+            response = handle_oversized_response(path, query_params, response, accept_encoding, origin)
         
-        else:
-            return create_response(404, {'error': 'Endpoint not found'}, origin)
+        return response
             
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         import traceback
         traceback.print_exc()
-        return create_response(500, {
+        response = create_response(500, {
             'error': 'Internal server error',
             'message': str(e)
         }, origin)
+        return response
+    
+    finally:
+        instrumentation.finish_trace(trace, response or {'statusCode': 500}, endpoint)
+
+# Duración del init del módulo (imports incluidos); la primera traza del contenedor la informa
+INIT_MS = round((time.perf_counter() - _INIT_STARTED) * 1000, 2)
+instrumentation.record_init(INIT_MS)
@@ -0,0 +1,218 @@
+"""
+Dashboard Lambda - Índices de web_queries
+Define los índices que necesitan las consultas de los handlers y los crea con
+CREATE INDEX CONCURRENTLY (sin bloquear las escrituras del RAG).
+
+Uso:
+    python migrations.py apply      # crea los índices que falten
+    python migrations.py status     # lista los índices y si existen
+    python migrations.py drop       # elimina los índices de este módulo
+
+También se puede lanzar desde Lambda con el evento {"action": "migrate"}.
+Si web_queries está particionada (partitions.py), cada índice se crea en el
+padre con ON ONLY y CONCURRENTLY en cada partición, y después se anclan.
+"""
+
+import sys
+import time
+
+# Predicado común de /query-logs (build_query_logs_filters)
+QUERY_LOGS_PREDICATE = (
+    "person_name IS NOT NULL AND app_name IS NOT NULL AND llm_trust_category IS NOT NULL"
+)
+
+# (nombre, definición, qué consultas cubre)
+INDEXES = [
+    (
+        'idx_web_queries_logs_recent',
+        f"ON web_queries (created_at DESC, id DESC) WHERE {QUERY_LOGS_PREDICATE}",
+        "/query-logs y export: ORDER BY created_at DESC, id DESC con keyset (created_at, id) < (...)"
+    ),
+    (
+        'idx_web_queries_logs_person',
+        f"ON web_queries (person_name, created_at DESC, id DESC) WHERE {QUERY_LOGS_PREDICATE}",
+        "/query-logs?person=... paginado"
+    ),
+    (
+        'idx_web_queries_logs_team',
+        f"ON web_queries (app_name, created_at DESC, id DESC) WHERE {QUERY_LOGS_PREDICATE}",
+        "/query-logs?team=... paginado"
+    ),
+    (
+        'idx_web_queries_person_stats',
+        "ON web_queries (person_name) INCLUDE (response_time_ms) WHERE person_name IS NOT NULL",
+        "/analytics (sin rollup) y /filters: GROUP BY / DISTINCT person_name con index-only scan"
+    ),
+    (
+        'idx_web_queries_team_stats',
+        "ON web_queries (app_name) INCLUDE (response_time_ms) WHERE app_name IS NOT NULL",
+        "/analytics (sin rollup) y /filters: GROUP BY / DISTINCT app_name con index-only scan"
+    ),
+    (
+        'idx_web_queries_created_metrics',
+        "ON web_queries (created_at) INCLUDE (person_name, app_name, llm_trust_category, "
+        "confidence_score, response_time_ms, tokens_input, tokens_output, tokens_total)",
+        "/analytics, /user-metrics, /team-metrics, /trust-analytics y el rollup: rangos de created_at "
+        "sin leer query_text/llm_response del heap"
+    ),
+    (
+        'idx_web_queries_conversation',
+        "ON web_queries (conversation_id_bedrock, created_at, id) WHERE conversation_id_bedrock IS NOT NULL",
+        "/conversations/{id}: los turnos de una conversación en orden y su delta tras el watermark del resumen"
+    ),
+    (
+        'idx_web_queries_created_brin',
+        "ON web_queries USING brin (created_at) WITH (pages_per_range = 32)",
+        "Rangos históricos amplios (backfill del rollup, exportaciones): unas pocas páginas de índice"
+    ),
+]
+
+INDEX_NAMES = [name for name, _, _ in INDEXES]
+
+
+def existing_indexes(cursor):
+    """Nombres de los índices de este módulo que ya existen y son válidos"""
+    cursor.execute("""
+        SELECT c.relname as name
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'web_queries'::regclass
+            AND i.indisvalid
+            AND c.relname = ANY(%s)
+    """, [INDEX_NAMES])
+    return {row['name'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()}
+
+
+def _drop_invalid(cursor):
+    """Un CREATE INDEX CONCURRENTLY interrumpido deja el índice INVALID: se elimina para reintentar"""
+    cursor.execute("""
+        SELECT c.relname as name
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'web_queries'::regclass
+            AND NOT i.indisvalid
+            AND c.relname = ANY(%s)
+    """, [INDEX_NAMES])
+    for row in cursor.fetchall():
+        name = row['name'] if isinstance(row, dict) else row[0]
+        print(f"⚠️ Dropping invalid index {name}")
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def _partitions(cursor):
+    """Particiones de web_queries, o None si no es una tabla particionada"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'web_queries'::regclass")
+    row = cursor.fetchone()
+    if (row['relkind'] if isinstance(row, dict) else row[0]) != 'p':
+        return None
+    cursor.execute("""
+        SELECT c.relname as name FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'web_queries'::regclass
+    """)
+    return [row['name'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+
+
+def _create_partitioned_index(cursor, name, definition, partitions):
+    """
+    CREATE INDEX CONCURRENTLY no admite tablas particionadas: índice vacío en el
+    padre (ON ONLY), CONCURRENTLY en cada partición y ATTACH. El índice del padre
+    pasa a válido cuando todas las particiones tienen el suyo anclado.
+    """
+    parent_definition = definition.replace('ON web_queries', 'ON ONLY web_queries', 1)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} {parent_definition}")
+    for partition in partitions:
+        child = f"{name}_{partition[len('web_queries_'):]}"[:63]
+        child_definition = definition.replace('ON web_queries', f'ON {partition}', 1)
+        cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} {child_definition}")
+        cursor.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+
+def apply_indexes(conn, analyze=True):
+    """
+    Crea los índices que falten. CONCURRENTLY no puede ir dentro de una
+    transacción, así que la conexión pasa a autocommit mientras dura.
+    Devuelve {'created': [...], 'existing': [...], 'seconds': float}
+    """
+    summary = {'created': [], 'existing': [], 'seconds': 0.0}
+    started = time.monotonic()
+    conn.rollback()
+    previous_autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            partitions = _partitions(cursor)
+            # En una tabla particionada un índice inválido solo espera a que se anclen sus particiones
+            if partitions is None:
+                _drop_invalid(cursor)
+            present = existing_indexes(cursor)
+            for name, definition, _ in INDEXES:
+                if name in present:
+                    summary['existing'].append(name)
+                    continue
+                print(f"🔧 Creating index {name}")
+                index_started = time.monotonic()
+                if partitions is None:
+                    cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+                else:
+                    _create_partitioned_index(cursor, name, definition, partitions)
+                print(f"✅ {name} created in {time.monotonic() - index_started:.1f}s")
+                summary['created'].append(name)
+
+            # Estadísticas y visibility map al día para que el planner elija index-only scans
+            if analyze and summary['created']:
+                cursor.execute("VACUUM (ANALYZE) web_queries")
+    finally:
+        conn.autocommit = previous_autocommit
+
+    summary['seconds'] = round(time.monotonic() - started, 2)
+    return summary
+
+
+def drop_indexes(conn):
+    """Elimina los índices definidos en este módulo"""
+    conn.rollback()
+    previous_autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            # DROP INDEX CONCURRENTLY no admite índices particionados
+            concurrently = '' if _partitions(cursor) is not None else 'CONCURRENTLY '
+            for name in INDEX_NAMES:
+                cursor.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
+    finally:
+        conn.autocommit = previous_autocommit
+    return INDEX_NAMES
+
+
+def main():
+    import argparse
+
+    import psycopg2
+
+    from db import DB_CONFIG
+
+    parser = argparse.ArgumentParser(description="Índices de web_queries")
+    parser.add_argument('command', choices=('apply', 'status', 'drop'))
+    parser.add_argument('--dsn', help="DSN de PostgreSQL (por defecto DB_CONFIG)")
+    parser.add_argument('--no-analyze', action='store_true', help="No ejecutar VACUUM ANALYZE tras crear")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn) if args.dsn else psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.command == 'apply':
+            print(apply_indexes(conn, analyze=not args.no_analyze))
+        elif args.command == 'drop':
+            print(f"🗑️ Dropped: {drop_indexes(conn)}")
+        else:
+            with conn.cursor() as cursor:
+                present = existing_indexes(cursor)
+            for name, definition, purpose in INDEXES:
+                mark = '✅' if name in present else '❌'
+                print(f"{mark} {name}\n     {definition}\n     {purpose}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
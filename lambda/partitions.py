@@ -0,0 +1,343 @@
+"""
+Dashboard Lambda - Particionado de web_queries por created_at
+- migrate: convierte web_queries en tabla particionada por rango (mes o semana).
+  La tabla original queda como web_queries_legacy y sus filas se copian
+  partición a partición, de la más reciente a la más antigua
+- maintain: crea las particiones futuras (moviendo lo que haya caído en la
+  partición DEFAULT) y desancla las antiguas pasada la retención, archivándolas
+  en otro esquema o eliminándolas
+- status: particiones con sus límites y filas estimadas
+
+Los handlers siempre filtran por created_at, así PostgreSQL solo lee las
+particiones del rango pedido (partition pruning).
+
+Uso:
+    python partitions.py migrate [--interval month|week] [--drop-legacy]
+    python partitions.py maintain [--ahead 3] [--retention-days 730] [--archive|--drop]
+    python partitions.py status
+
+También desde Lambda con el evento {"action": "maintain-partitions"}.
+"""
+
+import os
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import migrations
+
+PARENT_TABLE = 'web_queries'
+LEGACY_TABLE = 'web_queries_legacy'
+DEFAULT_PARTITION = 'web_queries_default'
+# month | week
+PARTITION_INTERVAL = os.environ.get('PARTITION_INTERVAL', 'month')
+# Particiones futuras que deben existir siempre
+PARTITIONS_AHEAD = int(os.environ.get('PARTITIONS_AHEAD', '3'))
+# Días de histórico que se mantienen anclados (0 = sin límite)
+PARTITION_RETENTION_DAYS = int(os.environ.get('PARTITION_RETENTION_DAYS', '0'))
+# archive: se mueven a ARCHIVE_SCHEMA | drop: se eliminan
+PARTITION_RETENTION_MODE = os.environ.get('PARTITION_RETENTION_MODE', 'archive')
+ARCHIVE_SCHEMA = os.environ.get('PARTITION_ARCHIVE_SCHEMA', 'web_queries_archive')
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def interval_start(value, interval=PARTITION_INTERVAL):
+    """Inicio de la partición que contiene value (día 1 del mes o lunes)"""
+    day = value.date() if isinstance(value, datetime) else value
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_start(start, interval=PARTITION_INTERVAL):
+    if interval == 'week':
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(start):
+    return f"{PARENT_TABLE}_p{start:%Y%m%d}"
+
+
+def _value(row, key):
+    return row[key] if isinstance(row, dict) else row[0]
+
+
+def is_partitioned(cursor):
+    """True si web_queries ya es una tabla particionada"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [PARENT_TABLE])
+    row = cursor.fetchone()
+    return bool(row) and _value(row, 'relkind') == 'p'
+
+
+def list_partitions(cursor):
+    """[{'name', 'start', 'end', 'rows'}] ordenadas por inicio; la DEFAULT lleva start/end None"""
+    cursor.execute("""
+        SELECT c.relname as name, pg_get_expr(c.relpartbound, c.oid) as bound, c.reltuples as rows
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, [PARENT_TABLE])
+    partitions = []
+    for row in cursor.fetchall():
+        name, bound, rows = (row['name'], row['bound'], row['rows']) if isinstance(row, dict) else row
+        match = _BOUND_RE.search(bound)
+        partitions.append({
+            'name': name,
+            'start': datetime.fromisoformat(match.group(1)).date() if match else None,
+            'end': datetime.fromisoformat(match.group(2)).date() if match else None,
+            'rows': max(int(rows), 0)
+        })
+    partitions.sort(key=lambda p: (p['start'] is None, p['start'] or date.min))
+    return partitions
+
+
+def create_partition(cursor, start, interval=PARTITION_INTERVAL):
+    """
+    Crea y ancla la partición [start, next_start). Las filas de ese rango que
+    estén en la DEFAULT se mueven antes (ATTACH fallaría si quedaran allí).
+    Los índices del padre se crean en la partición al anclarla.
+    """
+    name = partition_name(start)
+    end = next_start(start, interval)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name}
+            (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    """)
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL as present", [DEFAULT_PARTITION])
+    if _value(cursor.fetchone(), 'present'):
+        cursor.execute(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """, [start, end])
+        if cursor.rowcount:
+            print(f"📦 Moved {cursor.rowcount} rows from {DEFAULT_PARTITION} to {name}")
+    cursor.execute(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                   [start, end])
+    return name
+
+
+def ensure_future_partitions(conn, ahead=PARTITIONS_AHEAD, interval=PARTITION_INTERVAL):
+    """Particiones desde la actual hasta `ahead` intervalos por delante. Cada una en su transacción."""
+    created = []
+    with conn.cursor() as cursor:
+        existing = {p['start'] for p in list_partitions(cursor)}
+    conn.commit()
+
+    start = interval_start(datetime.now(), interval)
+    for _ in range(ahead + 1):
+        if start not in existing:
+            with conn.cursor() as cursor:
+                created.append(create_partition(cursor, start, interval))
+            conn.commit()
+            print(f"✅ Partition {created[-1]} created")
+        start = next_start(start, interval)
+    return created
+
+
+def detach_old_partitions(conn, retention_days=PARTITION_RETENTION_DAYS, mode=PARTITION_RETENTION_MODE):
+    """
+    Desancla las particiones que terminan antes de now - retention_days.
+    Solo las ya procesadas por el rollup: su histórico agregado sigue en
+    web_queries_daily aunque las filas salgan de web_queries.
+    """
+    if retention_days <= 0:
+        return []
+    cutoff = datetime.now().date() - timedelta(days=retention_days)
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('rollup_watermarks') IS NOT NULL as present")
+        if _value(cursor.fetchone(), 'present'):
+            cursor.execute("SELECT watermark FROM rollup_watermarks WHERE name = 'web_queries_daily'")
+            row = cursor.fetchone()
+            if row and _value(row, 'watermark'):
+                cutoff = min(cutoff, _value(row, 'watermark').date())
+        candidates = [p for p in list_partitions(cursor) if p['end'] is not None and p['end'] <= cutoff]
+    conn.commit()
+
+    detached = []
+    for partition in candidates:
+        with conn.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {partition['name']}")
+            if mode == 'drop':
+                cursor.execute(f"DROP TABLE {partition['name']}")
+            else:
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+                cursor.execute(f"ALTER TABLE {partition['name']} SET SCHEMA {ARCHIVE_SCHEMA}")
+        conn.commit()
+        print(f"🗄️ Partition {partition['name']} {'dropped' if mode == 'drop' else 'archived'}")
+        detached.append(partition['name'])
+    return detached
+
+
+def maintain_partitions(conn, ahead=PARTITIONS_AHEAD, retention_days=PARTITION_RETENTION_DAYS,
+                        mode=PARTITION_RETENTION_MODE):
+    """Particiones futuras + retención. No hace nada si web_queries no está particionada."""
+    started = time.monotonic()
+    with conn.cursor() as cursor:
+        partitioned = is_partitioned(cursor)
+    conn.commit()
+    if not partitioned:
+        return {'partitioned': False}
+    return {
+        'partitioned': True,
+        'created': ensure_future_partitions(conn, ahead),
+        'detached': detach_old_partitions(conn, retention_days, mode),
+        'seconds': round(time.monotonic() - started, 2)
+    }
+
+
+def migrate_to_partitioned(conn, interval=PARTITION_INTERVAL, ahead=PARTITIONS_AHEAD, drop_legacy=False):
+    """
+    1. En una transacción: renombra web_queries (y sus índices) a *_legacy, crea
+       el padre particionado con las mismas columnas, las particiones del rango
+       de datos + `ahead` futuras + DEFAULT, y los índices de migrations.INDEXES.
+       La secuencia de id pasa al nuevo padre. Las escrituras nuevas ya van aquí.
+    2. Copia las filas de web_queries_legacy partición a partición (una
+       transacción cada una), de la más reciente a la más antigua, para que las
+       ventanas por defecto del dashboard estén completas cuanto antes.
+    """
+    started = time.monotonic()
+    with conn.cursor() as cursor:
+        if is_partitioned(cursor):
+            conn.rollback()
+            return {'migrated': False, 'reason': 'already partitioned'}
+
+        cursor.execute("SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+                       [PARENT_TABLE])
+        if _value(cursor.fetchone(), 'attidentity'):
+            raise RuntimeError("web_queries.id is an identity column; convert it to a serial default first")
+        cursor.execute(f"SELECT COUNT(*) as missing FROM {PARENT_TABLE} WHERE created_at IS NULL")
+        if _value(cursor.fetchone(), 'missing'):
+            raise RuntimeError("web_queries has rows without created_at; they cannot be routed to a partition")
+
+        cursor.execute(f"SELECT MIN(created_at) as first, MAX(created_at) as last FROM {PARENT_TABLE}")
+        row = cursor.fetchone()
+        first, last = (row['first'], row['last']) if isinstance(row, dict) else row
+        now = datetime.now()
+        first_start = interval_start(first or now, interval)
+        last_start = interval_start(max(last or now, now), interval)
+        for _ in range(ahead):
+            last_start = next_start(last_start, interval)
+
+        # Índices de la tabla original: liberan sus nombres para el nuevo padre
+        cursor.execute("""
+            SELECT c.relname as name FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass
+        """, [PARENT_TABLE])
+        for index_row in cursor.fetchall():
+            name = _value(index_row, 'name')
+            cursor.execute(f"ALTER INDEX {name} RENAME TO {(name + '_legacy')[:63]}")
+
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id') as sequence", [PARENT_TABLE])
+        sequence = _value(cursor.fetchone(), 'sequence')
+
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} RENAME TO {LEGACY_TABLE}")
+        cursor.execute(f"""
+            CREATE TABLE {PARENT_TABLE}
+                (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                PARTITION BY RANGE (created_at)
+        """)
+        # La clave primaria de una tabla particionada debe incluir la clave de partición
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} ADD PRIMARY KEY (id, created_at)")
+        if sequence:
+            # Que DROP de web_queries_legacy no arrastre la secuencia
+            cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {PARENT_TABLE}.id")
+
+        partitions = []
+        start = first_start
+        while start <= last_start:
+            partitions.append(create_partition(cursor, start, interval))
+            start = next_start(start, interval)
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT")
+
+        # Padre y particiones vacíos: los índices se crean al instante
+        for name, definition, _ in migrations.INDEXES:
+            cursor.execute(f"CREATE INDEX {name} {definition}")
+    conn.commit()
+    print(f"✅ {PARENT_TABLE} partitioned by {interval}: {len(partitions)} partitions")
+
+    copied = 0
+    for name in reversed(partitions):
+        start = datetime.strptime(name.rsplit('_p', 1)[1], '%Y%m%d').date()
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {name}
+                SELECT * FROM {LEGACY_TABLE}
+                WHERE created_at >= %s AND created_at < %s
+            """, [start, next_start(start, interval)])
+            rows = cursor.rowcount
+        conn.commit()
+        copied += rows
+        print(f"📦 {name}: {rows} rows")
+
+    previous_autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"VACUUM (ANALYZE) {PARENT_TABLE}")
+            if drop_legacy:
+                cursor.execute(f"DROP TABLE {LEGACY_TABLE}")
+    finally:
+        conn.autocommit = previous_autocommit
+
+    return {
+        'migrated': True,
+        'interval': interval,
+        'partitions': len(partitions),
+        'rows': copied,
+        'legacy_dropped': drop_legacy,
+        'seconds': round(time.monotonic() - started, 2)
+    }
+
+
+def main():
+    import argparse
+
+    import psycopg2
+
+    from db import DB_CONFIG
+
+    parser = argparse.ArgumentParser(description="Particionado de web_queries")
+    parser.add_argument('command', choices=('migrate', 'maintain', 'status'))
+    parser.add_argument('--dsn', help="DSN de PostgreSQL (por defecto DB_CONFIG)")
+    parser.add_argument('--interval', choices=('month', 'week'), default=PARTITION_INTERVAL)
+    parser.add_argument('--ahead', type=int, default=PARTITIONS_AHEAD, help="Particiones futuras")
+    parser.add_argument('--drop-legacy', action='store_true', help="Eliminar web_queries_legacy tras copiar")
+    parser.add_argument('--retention-days', type=int, default=PARTITION_RETENTION_DAYS,
+                        help="Desanclar particiones más antiguas (0 = nunca)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--archive', dest='mode', action='store_const', const='archive',
+                      help=f"Mover las desancladas al esquema {ARCHIVE_SCHEMA}")
+    mode.add_argument('--drop', dest='mode', action='store_const', const='drop',
+                      help="Eliminar las desancladas")
+    parser.set_defaults(mode=PARTITION_RETENTION_MODE)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn) if args.dsn else psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.command == 'migrate':
+            print(migrate_to_partitioned(conn, args.interval, args.ahead, args.drop_legacy))
+        elif args.command == 'maintain':
+            print(maintain_partitions(conn, args.ahead, args.retention_days, args.mode))
+        else:
+            with conn.cursor() as cursor:
+                if not is_partitioned(cursor):
+                    print(f"❌ {PARENT_TABLE} is not partitioned (python partitions.py migrate)")
+                    return 1
+                for partition in list_partitions(cursor):
+                    bounds = f"{partition['start']} .. {partition['end']}" if partition['start'] else 'DEFAULT'
+                    print(f"📁 {partition['name']:<28} {bounds:<26} ~{partition['rows']} rows")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Dashboard Lambda - Caché de respuestas
+LRU en proceso (sobrevive entre invocaciones warm) con TTL por endpoint,
+backend compartido opcional (SQLite) entre contenedores y soporte de
+ETag / If-None-Match para devolver 304 al navegador.
+Si la consulta se cancela por statement_timeout (503), se sirve la última
+respuesta caducada hace menos de CACHE_STALE_SECONDS (X-Cache: STALE).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# TTL (segundos) por endpoint normalizado; los que no aparecen no se cachean
+DEFAULT_TTLS = {
+    '/analytics': 60,
+    '/filters': 300,
+    '/trust-analytics': 60,
+    '/percentiles': 60,
+    '/usage': 60,
+    '/user-metrics': 60,
+    '/team-metrics': 60
+}
+
+CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '256'))
+# JSON opcional con TTLs que sustituyen a los de DEFAULT_TTLS, p.ej. {"/filters": 600}
+CACHE_TTLS = {**DEFAULT_TTLS, **json.loads(os.environ.get('RESPONSE_CACHE_TTLS', '{}'))}
+# Tras caducar, una entrada se conserva este tiempo para servirla si la consulta se cancela
+CACHE_STALE_SECONDS = int(os.environ.get('RESPONSE_CACHE_STALE_SECONDS', '900'))
+# Ruta del SQLite compartido (p.ej. en EFS); vacío = solo caché en proceso
+CACHE_SQLITE_PATH = os.environ.get('RESPONSE_CACHE_SQLITE_PATH', '')
+
+PATH_PREFIX = '/api/dashboard'
+
+
+def normalize_path(path):
+    """'/api/dashboard/analytics' y '/analytics' comparten entrada"""
+    if path.startswith(PATH_PREFIX + '/'):
+        path = path[len(PATH_PREFIX):]
+    return path.rstrip('/') or '/'
+
+
+def cache_key(path, query_params):
+    """Clave estable: ruta normalizada + parámetros ordenados"""
+    params = sorted((k, tuple(v)) for k, v in query_params.items() if k != 'refresh')
+    return normalize_path(path) + '?' + json.dumps(params, separators=(',', ':'))
+
+
+def compute_etag(body):
+    return 'W/"' + hashlib.sha1(body.encode('utf-8')).hexdigest() + '"'
+
+
+class SqliteBackend:
+    """Backend compartido: una tabla clave -> (respuesta, creada, expira)"""
+
+    def __init__(self, path):
+        # sqlite3 solo se carga si hay backend compartido configurado
+        import sqlite3
+        self._sqlite3 = sqlite3
+        self.Error = sqlite3.Error
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, stale_seconds=0):
+        row = self._connect().execute(
+            "SELECT response, created_at, expires_at FROM response_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if not row or row[2] + stale_seconds <= time.time():
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key, response, created_at, expires_at):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO response_cache (key, response, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(response), created_at, expires_at)
+        )
+
+    def delete_prefix(self, prefix):
+        self._connect().execute("DELETE FROM response_cache WHERE key LIKE ?", (prefix + '%',))
+
+
+class ResponseCache:
+    """LRU en proceso con TTL y backend compartido opcional"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttls=None, backend=None, stale_seconds=CACHE_STALE_SECONDS):
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self.ttls = dict(CACHE_TTLS if ttls is None else ttls)
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'shared_hits': 0, 'stale_hits': 0}
+
+    def ttl_for(self, path):
+        return self.ttls.get(normalize_path(path))
+
+    def get(self, key):
+        """Devuelve (respuesta, edad en segundos) o None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, created_at, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return response, now - created_at
+                # Caducada: se conserva un tiempo por si hay que servirla como STALE
+                if expires_at + self.stale_seconds <= now:
+                    del self._entries[key]
+
+        if self.backend is not None:
+            try:
+                shared = self.backend.get(key)
+            except self.backend.Error as e:
+                print(f"⚠️ Shared cache read failed: {e}")
+                shared = None
+            if shared is not None:
+                response, created_at, expires_at = shared
+                self._store_local(key, response, created_at, expires_at)
+                with self._lock:
+                    self.stats['hits'] += 1
+                    self.stats['shared_hits'] += 1
+                return response, now - created_at
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def get_stale(self, key):
+        """Entrada caducada hace menos de stale_seconds: (respuesta, edad) o None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.backend is not None:
+            try:
+                entry = self.backend.get(key, self.stale_seconds)
+            except self.backend.Error as e:
+                print(f"⚠️ Shared cache read failed: {e}")
+        if entry is None:
+            return None
+        response, created_at, expires_at = entry
+        if expires_at + self.stale_seconds <= now:
+            return None
+        with self._lock:
+            self.stats['stale_hits'] += 1
+        return response, now - created_at
+
+    def set(self, key, response, ttl):
+        created_at = time.time()
+        expires_at = created_at + ttl
+        self._store_local(key, response, created_at, expires_at)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, response, created_at, expires_at)
+            except self.backend.Error as e:
+                print(f"⚠️ Shared cache write failed: {e}")
+
+    def _store_local(self, key, response, created_at, expires_at):
+        with self._lock:
+            self._entries[key] = (response, created_at, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path=None):
+        """Invalida un endpoint (o toda la caché si path es None)"""
+        prefix = normalize_path(path) + '?' if path else ''
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+        if self.backend is not None:
+            try:
+                self.backend.delete_prefix(prefix)
+            except self.backend.Error as e:
+                print(f"⚠️ Shared cache invalidation failed: {e}")
+
+    def hit_ratio(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.0
+
+    def get_stats(self):
+        with self._lock:
+            entries = len(self._entries)
+        return {**self.stats, 'entries': entries, 'hit_ratio': round(self.hit_ratio(), 4)}
+
+
+_cache = None
+
+
+def get_cache():
+    """Caché del contenedor, creada en el primer uso"""
+    global _cache
+    if _cache is None:
+        backend = SqliteBackend(CACHE_SQLITE_PATH) if CACHE_SQLITE_PATH else None
+        _cache = ResponseCache(backend=backend)
+    return _cache
+
+
+def with_cache_headers(response, status, age, cache, etag):
+    """Copia la respuesta añadiendo cabeceras de caché"""
+    headers = dict(response.get('headers') or {})
+    headers['X-Cache'] = status
+    headers['X-Cache-Age'] = str(int(age))
+    headers['X-Cache-Hit-Ratio'] = f"{cache.hit_ratio():.4f}"
+    headers['ETag'] = etag
+    # El navegador revalida siempre con If-None-Match
+    headers['Cache-Control'] = 'no-cache'
+    return {**response, 'headers': headers}
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match puede traer varias ETags separadas por comas o '*'"""
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+def not_modified(response):
+    """Respuesta 304 sin cuerpo conservando las cabeceras de caché"""
+    return {'statusCode': 304, 'headers': response['headers'], 'body': ''}
+
+
+def cached_call(path, query_params, request_headers, compute):
+    """
+    Sirve path desde la caché si su endpoint tiene TTL; si no, llama a compute().
+    Soporta refresh=1 / Cache-Control: no-cache para saltarse la caché e
+    If-None-Match para responder 304. Un 503 (statement_timeout) se sustituye
+    por la última respuesta caducada si existe; las respuestas parciales no se guardan.
+    """
+    cache = get_cache()
+    ttl = cache.ttl_for(path)
+    if not ttl:
+        return compute()
+
+    key = cache_key(path, query_params)
+    if_none_match = request_headers.get('if-none-match') or request_headers.get('If-None-Match')
+    cache_control = request_headers.get('cache-control') or request_headers.get('Cache-Control') or ''
+    bypass = query_params.get('refresh', [''])[0] in ('1', 'true') or 'no-cache' in cache_control
+
+    cached = None if bypass else cache.get(key)
+    if cached is not None:
+        response, age = cached
+        response = with_cache_headers(response, 'HIT', age, cache, response['headers']['ETag'])
+    else:
+        response = compute()
+        if response.get('statusCode') == 503:
+            stale = cache.get_stale(key)
+            if stale is None:
+                return response
+            print(f"⚠️ Serving stale {key} after timeout")
+            response, age = stale
+            response = with_cache_headers(response, 'STALE', age, cache, response['headers']['ETag'])
+        elif response.get('statusCode') != 200 or 'X-Partial-Result' in response.get('headers', {}):
+            return response
+        else:
+            etag = compute_etag(response['body'])
+            response = with_cache_headers(response, 'BYPASS' if bypass else 'MISS', 0, cache, etag)
+            cache.set(key, response, ttl)
+
+    if if_none_match and etag_matches(if_none_match, response['headers']['ETag']):
+        return not_modified(response)
+    return response
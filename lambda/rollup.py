@@ -0,0 +1,454 @@
+"""
+Dashboard Lambda - Rollup diario incremental de web_queries
+Mantiene web_queries_daily, un resumen por (day, app_name, person_name,
+trust_category), procesando solo las filas posteriores al watermark guardado.
+Los handlers de analytics leen del rollup y completan con filas en bruto
+únicamente para el día en curso.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+
+from sketches import QuantileSketch
+
+ROLLUP_TABLE = 'web_queries_daily'
+ROLLUP_NAME = 'web_queries_daily'
+
+# auto: usar el rollup si ya tiene watermark | off: siempre filas en bruto
+ROLLUP_MODE = os.environ.get('ROLLUP_MODE', 'auto')
+# No se agregan filas más recientes que esto (inserciones aún en vuelo)
+ROLLUP_LAG_SECONDS = int(os.environ.get('ROLLUP_LAG_SECONDS', '120'))
+# Cada lote del refresco cubre como máximo este intervalo de created_at
+ROLLUP_BATCH_HOURS = int(os.environ.get('ROLLUP_BATCH_HOURS', '24'))
+ROLLUP_FETCH_SIZE = int(os.environ.get('ROLLUP_FETCH_SIZE', '5000'))
+# Presupuesto de tiempo por invocación del refresco (por debajo del timeout de Lambda)
+ROLLUP_MAX_SECONDS = float(os.environ.get('ROLLUP_MAX_SECONDS', '240'))
+
+# Las claves del rollup no admiten NULL: se guardan como cadena vacía
+NULL_KEY = ''
+
+SCHEMA_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+        day date NOT NULL,
+        app_name text NOT NULL DEFAULT '',
+        person_name text NOT NULL DEFAULT '',
+        trust_category text NOT NULL DEFAULT '',
+        query_count bigint NOT NULL DEFAULT 0,
+        scored_count bigint NOT NULL DEFAULT 0,
+        confidence_sum double precision NOT NULL DEFAULT 0,
+        confidence_min double precision,
+        confidence_max double precision,
+        response_time_count bigint NOT NULL DEFAULT 0,
+        response_time_sum double precision NOT NULL DEFAULT 0,
+        tokens_input_sum bigint NOT NULL DEFAULT 0,
+        tokens_output_sum bigint NOT NULL DEFAULT 0,
+        tokens_total_sum bigint NOT NULL DEFAULT 0,
+        confidence_sketch jsonb,
+        latency_sketch jsonb,
+        updated_at timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY (day, app_name, person_name, trust_category)
+    );
+
+    CREATE TABLE IF NOT EXISTS rollup_watermarks (
+        name text PRIMARY KEY,
+        watermark timestamptz NOT NULL,
+        updated_at timestamptz NOT NULL DEFAULT now()
+    );
+"""
+
+ROLLUP_COLUMNS = (
+    'day', 'app_name', 'person_name', 'trust_category',
+    'query_count', 'scored_count', 'confidence_sum', 'confidence_min', 'confidence_max',
+    'response_time_count', 'response_time_sum',
+    'tokens_input_sum', 'tokens_output_sum', 'tokens_total_sum',
+    'confidence_sketch', 'latency_sketch'
+)
+
+
+class DailyBucket:
+    """Acumulador de un grupo (day, app_name, person_name, trust_category)"""
+
+    __slots__ = ('query_count', 'scored_count', 'confidence_sum', 'confidence_min',
+                 'confidence_max', 'response_time_count', 'response_time_sum',
+                 'tokens_input_sum', 'tokens_output_sum', 'tokens_total_sum',
+                 'confidence_sketch', 'latency_sketch')
+
+    def __init__(self):
+        self.query_count = 0
+        self.scored_count = 0
+        self.confidence_sum = 0.0
+        self.confidence_min = None
+        self.confidence_max = None
+        self.response_time_count = 0
+        self.response_time_sum = 0.0
+        self.tokens_input_sum = 0
+        self.tokens_output_sum = 0
+        self.tokens_total_sum = 0
+        self.confidence_sketch = QuantileSketch()
+        self.latency_sketch = QuantileSketch()
+
+    def add_row(self, confidence, response_time, tokens_input, tokens_output, tokens_total):
+        self.query_count += 1
+        if confidence is not None:
+            confidence = float(confidence)
+            self.scored_count += 1
+            self.confidence_sum += confidence
+            self.confidence_min = confidence if self.confidence_min is None else min(self.confidence_min, confidence)
+            self.confidence_max = confidence if self.confidence_max is None else max(self.confidence_max, confidence)
+            self.confidence_sketch.add(confidence)
+        if response_time is not None:
+            self.response_time_count += 1
+            self.response_time_sum += float(response_time)
+            self.latency_sketch.add(response_time)
+        self.tokens_input_sum += tokens_input or 0
+        self.tokens_output_sum += tokens_output or 0
+        self.tokens_total_sum += tokens_total or 0
+
+    def merge(self, other):
+        self.query_count += other.query_count
+        self.scored_count += other.scored_count
+        self.confidence_sum += other.confidence_sum
+        for attr, pick in (('confidence_min', min), ('confidence_max', max)):
+            mine, theirs = getattr(self, attr), getattr(other, attr)
+            if theirs is not None:
+                setattr(self, attr, theirs if mine is None else pick(mine, theirs))
+        self.response_time_count += other.response_time_count
+        self.response_time_sum += other.response_time_sum
+        self.tokens_input_sum += other.tokens_input_sum
+        self.tokens_output_sum += other.tokens_output_sum
+        self.tokens_total_sum += other.tokens_total_sum
+        self.confidence_sketch.merge(other.confidence_sketch)
+        self.latency_sketch.merge(other.latency_sketch)
+        return self
+
+    @classmethod
+    def from_row(cls, row):
+        """Reconstruye un acumulador desde una fila de web_queries_daily"""
+        bucket = cls()
+        for attr in ('query_count', 'scored_count', 'response_time_count',
+                     'tokens_input_sum', 'tokens_output_sum', 'tokens_total_sum'):
+            setattr(bucket, attr, int(row[attr] or 0))
+        bucket.confidence_sum = float(row['confidence_sum'] or 0)
+        bucket.response_time_sum = float(row['response_time_sum'] or 0)
+        bucket.confidence_min = row['confidence_min']
+        bucket.confidence_max = row['confidence_max']
+        if row['confidence_sketch']:
+            bucket.confidence_sketch = QuantileSketch.from_dict(row['confidence_sketch'])
+        if row['latency_sketch']:
+            bucket.latency_sketch = QuantileSketch.from_dict(row['latency_sketch'])
+        return bucket
+
+    def as_values(self, key):
+        return key + (
+            self.query_count, self.scored_count, self.confidence_sum,
+            self.confidence_min, self.confidence_max,
+            self.response_time_count, self.response_time_sum,
+            self.tokens_input_sum, self.tokens_output_sum, self.tokens_total_sum,
+            Json(self.confidence_sketch.to_dict()), Json(self.latency_sketch.to_dict())
+        )
+
+
+def ensure_schema(conn):
+    """Crea las tablas del rollup si no existen"""
+    with conn.cursor() as cursor:
+        cursor.execute(SCHEMA_SQL)
+    conn.commit()
+
+
+def aggregate_raw_rows(conn, start, end=None):
+    """
+    Agrega en memoria las filas en bruto con created_at en (start, end].
+    Lee con un cursor de servidor para no cargar el lote entero en memoria.
+    Devuelve {(day, app_name, person_name, trust_category): DailyBucket}
+    """
+    clauses = ["created_at > %s"]
+    params = [start]
+    if end is not None:
+        clauses.append("created_at <= %s")
+        params.append(end)
+
+    cursor = conn.cursor(name='rollup_raw_rows')
+    cursor.itersize = ROLLUP_FETCH_SIZE
+    cursor.execute(f"""
+        SELECT
+            DATE(created_at) as day,
+            app_name,
+            person_name,
+            llm_trust_category,
+            confidence_score,
+            response_time_ms,
+            tokens_input,
+            tokens_output,
+            tokens_total
+        FROM web_queries
+        WHERE {" AND ".join(clauses)}
+    """, params)
+
+    buckets = {}
+    try:
+        for row in cursor:
+            key = (
+                row['day'],
+                row['app_name'] or NULL_KEY,
+                row['person_name'] or NULL_KEY,
+                row['llm_trust_category'] or NULL_KEY
+            )
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = DailyBucket()
+            bucket.add_row(row['confidence_score'], row['response_time_ms'],
+                           row['tokens_input'], row['tokens_output'], row['tokens_total'])
+    finally:
+        cursor.close()
+    return buckets
+
+
+def _read_watermark(cursor):
+    cursor.execute(
+        "SELECT watermark FROM rollup_watermarks WHERE name = %s FOR UPDATE",
+        [ROLLUP_NAME]
+    )
+    row = cursor.fetchone()
+    if row:
+        return row['watermark']
+
+    # Primera ejecución: empezamos justo antes de la fila más antigua
+    cursor.execute("SELECT (MIN(created_at) - interval '1 microsecond')::timestamptz as watermark FROM web_queries")
+    return cursor.fetchone()['watermark']
+
+
+def _upsert_buckets(cursor, buckets):
+    """Combina los acumuladores nuevos con las filas existentes y hace upsert"""
+    days = sorted({key[0] for key in buckets})
+    cursor.execute(f"""
+        SELECT * FROM {ROLLUP_TABLE}
+        WHERE day = ANY(%s)
+        FOR UPDATE
+    """, [days])
+    for row in cursor.fetchall():
+        key = (row['day'], row['app_name'], row['person_name'], row['trust_category'])
+        if key in buckets:
+            buckets[key].merge(DailyBucket.from_row(row))
+
+    columns = ", ".join(ROLLUP_COLUMNS)
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in ROLLUP_COLUMNS[4:])
+    execute_values(cursor, f"""
+        INSERT INTO {ROLLUP_TABLE} ({columns})
+        VALUES %s
+        ON CONFLICT (day, app_name, person_name, trust_category)
+        DO UPDATE SET {updates}, updated_at = now()
+    """, [bucket.as_values(key) for key, bucket in buckets.items()])
+
+
+def refresh_daily_rollup(conn, max_seconds=ROLLUP_MAX_SECONDS):
+    """
+    Procesa las filas posteriores al watermark en lotes de ROLLUP_BATCH_HOURS.
+    Cada lote es una transacción (rollup + watermark se confirman juntos).
+    """
+    ensure_schema(conn)
+    started = time.monotonic()
+    summary = {'batches': 0, 'rows': 0, 'groups': 0, 'watermark': None, 'caught_up': False}
+
+    while time.monotonic() - started < max_seconds:
+        cursor = conn.cursor()
+
+        # Un único refresco a la vez entre contenedores
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s)) as locked", [ROLLUP_NAME])
+        if not cursor.fetchone()['locked']:
+            conn.rollback()
+            summary['skipped'] = 'locked'
+            break
+
+        watermark = _read_watermark(cursor)
+        if watermark is None:
+            conn.rollback()
+            summary['caught_up'] = True
+            break
+
+        cursor.execute("SELECT now() - %s * interval '1 second' as upper", [ROLLUP_LAG_SECONDS])
+        upper = cursor.fetchone()['upper']
+        batch_upper = min(upper, watermark + timedelta(hours=ROLLUP_BATCH_HOURS))
+        if batch_upper <= watermark:
+            conn.rollback()
+            summary['caught_up'] = True
+            break
+
+        buckets = aggregate_raw_rows(conn, watermark, batch_upper)
+        if buckets:
+            _upsert_buckets(cursor, buckets)
+
+        cursor.execute("""
+            INSERT INTO rollup_watermarks (name, watermark, updated_at)
+            VALUES (%s, %s, now())
+            ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = now()
+        """, [ROLLUP_NAME, batch_upper])
+        conn.commit()
+
+        summary['batches'] += 1
+        summary['groups'] += len(buckets)
+        summary['rows'] += sum(bucket.query_count for bucket in buckets.values())
+        summary['watermark'] = batch_upper
+        if batch_upper >= upper:
+            summary['caught_up'] = True
+            break
+
+    return summary
+
+
+def rollup_boundary(cursor):
+    """
+    Inicio del primer día que NO está completo en el rollup (día del watermark).
+    Los días anteriores se leen del rollup; desde aquí, de web_queries.
+    Devuelve None si el rollup está desactivado o aún no existe.
+    """
+    if ROLLUP_MODE == 'off':
+        return None
+    try:
+        cursor.execute(
+            "SELECT date_trunc('day', watermark) as boundary FROM rollup_watermarks WHERE name = %s",
+            [ROLLUP_NAME]
+        )
+        row = cursor.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        cursor.connection.rollback()
+        return None
+    if not row or row['boundary'] is None:
+        return None
+    boundary = row['boundary']
+    # Comparamos contra created_at / DATE(created_at), que son naive
+    return boundary.replace(tzinfo=None) if isinstance(boundary, datetime) else boundary
+
+
+def load_daily_buckets(cursor, boundary, start_day=None, group_by=('day', 'app_name', 'trust_category')):
+    """
+    Acumuladores por group_by desde start_day: días < boundary del rollup y
+    el resto (día en curso) agregado de web_queries.
+    """
+    clauses = ["day < %s"]
+    params = [boundary.date()]
+    if start_day is not None:
+        clauses.append("day >= %s")
+        params.append(start_day)
+
+    cursor.execute(f"""
+        SELECT * FROM {ROLLUP_TABLE}
+        WHERE {" AND ".join(clauses)}
+    """, params)
+
+    key_index = [ROLLUP_COLUMNS.index(col) for col in group_by]
+    merged = {}
+
+    def add(full_key, bucket):
+        key = tuple(full_key[i] for i in key_index)
+        if key in merged:
+            merged[key].merge(bucket)
+        else:
+            merged[key] = bucket
+
+    for row in cursor.fetchall():
+        add((row['day'], row['app_name'], row['person_name'], row['trust_category']),
+            DailyBucket.from_row(row))
+
+    raw_start = boundary
+    if start_day is not None:
+        raw_start = max(boundary, datetime.combine(start_day, datetime.min.time()))
+    for key, bucket in aggregate_raw_rows(cursor.connection, raw_start - timedelta(microseconds=1)).items():
+        add(key, bucket)
+
+    return merged
+
+
+def load_sketches(cursor, boundary, start_day, end_day, teams=None):
+    """
+    Sketches de confianza y latencia por equipo para [start_day, end_day]:
+    solo las columnas de sketch del rollup para los días completos y el día
+    en curso agregado de web_queries. teams limita a un subconjunto de app_name.
+    Devuelve {app_name: {'confidence': QuantileSketch, 'latency': QuantileSketch}}
+    """
+    merged = {}
+
+    def add(team, confidence_sketch, latency_sketch):
+        entry = merged.get(team)
+        if entry is None:
+            entry = merged[team] = {'confidence': QuantileSketch(), 'latency': QuantileSketch()}
+        entry['confidence'].merge(confidence_sketch)
+        entry['latency'].merge(latency_sketch)
+
+    clauses = ["day >= %s", "day <= %s", "day < %s"]
+    params = [start_day, end_day, boundary.date()]
+    if teams:
+        clauses.append("app_name = ANY(%s)")
+        params.append(list(teams))
+
+    cursor.execute(f"""
+        SELECT app_name, confidence_sketch, latency_sketch
+        FROM {ROLLUP_TABLE}
+        WHERE {" AND ".join(clauses)}
+    """, params)
+    for row in cursor.fetchall():
+        add(row['app_name'],
+            QuantileSketch.from_dict(row['confidence_sketch']) if row['confidence_sketch'] else None,
+            QuantileSketch.from_dict(row['latency_sketch']) if row['latency_sketch'] else None)
+
+    if end_day >= boundary.date():
+        raw_start = max(boundary, datetime.combine(start_day, datetime.min.time()))
+        raw_end = datetime.combine(end_day + timedelta(days=1), datetime.min.time()) - timedelta(microseconds=1)
+        raw = aggregate_raw_rows(cursor.connection, raw_start - timedelta(microseconds=1), raw_end)
+        for (_, app_name, _, _), bucket in raw.items():
+            if not teams or app_name in teams:
+                add(app_name, bucket.confidence_sketch, bucket.latency_sketch)
+
+    return merged
+
+
+def entity_totals(cursor, column, boundary, start_day, end_day):
+    """
+    Conteo y latencia media por person_name / app_name en [start_day, end_day]:
+    SUM sobre el rollup + GROUP BY sobre las filas desde boundary.
+    """
+    cursor.execute(f"""
+        SELECT
+            {column} as entity,
+            SUM(query_count) as count,
+            SUM(response_time_sum) as response_time_sum,
+            SUM(response_time_count) as response_time_count
+        FROM {ROLLUP_TABLE}
+        WHERE day >= %s AND day <= %s AND day < %s
+            AND {column} <> ''
+        GROUP BY {column}
+    """, [start_day, end_day, boundary.date()])
+    totals = {}
+    for row in cursor.fetchall():
+        totals[row['entity']] = [int(row['count']), float(row['response_time_sum'] or 0),
+                                 int(row['response_time_count'] or 0)]
+
+    if end_day >= boundary.date():
+        cursor.execute(f"""
+            SELECT
+                {column} as entity,
+                COUNT(*) as count,
+                SUM(response_time_ms) as response_time_sum,
+                COUNT(response_time_ms) as response_time_count
+            FROM web_queries
+            WHERE created_at >= %s AND created_at < %s
+                AND {column} IS NOT NULL
+            GROUP BY {column}
+        """, [max(boundary, datetime.combine(start_day, datetime.min.time())),
+              datetime.combine(end_day + timedelta(days=1), datetime.min.time())])
+        for row in cursor.fetchall():
+            entry = totals.setdefault(row['entity'], [0, 0.0, 0])
+            entry[0] += row['count']
+            entry[1] += float(row['response_time_sum'] or 0)
+            entry[2] += row['response_time_count']
+
+    return {
+        entity: {
+            'count': count,
+            'avg_response_time': rt_sum / rt_count if rt_count else None
+        }
+        for entity, (count, rt_sum, rt_count) in totals.items()
+    }
@@ -0,0 +1,153 @@
+"""
+Dashboard Lambda - Serialización JSON
+- dumps(): usa orjson si está instalado y json de la stdlib si no, con
+  soporte nativo de datetime/date/Decimal/UUID
+- RowEncoder / get_row_encoder(): una única función compilada por lista de
+  campos que convierte las tuplas del cursor en dicts de salida sin pasar por
+  RealDictCursor; las dos cachés son LRU acotadas (fields llega del cliente)
+"""
+
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del paquete desplegado
+    orjson = None
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+# Máximo de encoders (y de funciones compiladas) que se conservan entre invocaciones
+ENCODER_CACHE_SIZE = int(os.environ.get('SERIALIZATION_ENCODER_CACHE_SIZE', '64'))
+
+
+def _default(value):
+    """Tipos que la librería JSON no sabe serializar"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).decode('utf-8', errors='replace')
+    return str(value)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_UUID
+
+    def dumps(body):
+        """Serializa body a str JSON"""
+        return orjson.dumps(body, default=_default, option=_ORJSON_OPTIONS).decode('utf-8')
+else:
+    _encoder = json.JSONEncoder(default=_default, ensure_ascii=True, separators=(', ', ': '))
+
+    def dumps(body):
+        """Serializa body a str JSON"""
+        return _encoder.encode(body)
+
+
+# Conversiones por columna: plantilla de código sobre la variable de la fila `r`
+CONVERTERS = {
+    None: "r[{i}]",
+    'str': "(str(r[{i}]) if r[{i}] is not None else None)",
+    'iso': "(r[{i}].isoformat() if r[{i}] is not None else None)",
+    'float0': "(float(r[{i}]) if r[{i}] else 0)",
+    'bool': "bool(r[{i}])"
+}
+
+# orjson ya escribe datetime en ISO 8601, no hace falta convertir antes
+if orjson is not None:
+    CONVERTERS['iso'] = "r[{i}]"
+
+
+class RowEncoder:
+    """
+    Encoder compilado para una lista de campos de salida.
+    - select_sql: expresiones SQL deduplicadas (person/person_name comparten columna)
+    - encode(row): tupla del cursor -> dict de salida
+    """
+
+    def __init__(self, fields, expressions, converters=None):
+        converters = converters or {}
+        self.fields = tuple(fields)
+        self.columns = []
+        self._index = {}
+        column_index = {}
+        layout = []
+
+        for field in self.fields:
+            expr = expressions[field]
+            if expr not in column_index:
+                column_index[expr] = len(self.columns)
+                self.columns.append((field, expr))
+            self._index[field] = column_index[expr]
+            layout.append((field, column_index[expr], converters.get(field)))
+
+        # El código solo depende de campo/posición/conversión, no de las expresiones SQL
+        self.encode = _compile_encode(tuple(layout))
+
+    @property
+    def select_sql(self):
+        return ",\n                    ".join(f"{expr} as {field}" for field, expr in self.columns)
+
+    def index_of(self, field):
+        """Posición en la tupla del cursor de un campo"""
+        return self._index[field]
+
+    def encode_all(self, rows):
+        encode = self.encode
+        return [encode(row) for row in rows]
+
+
+class _LRU:
+    """Diccionario acotado a max_entries (descarta el menos usado)"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, create):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+        value = create()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_compiled = _LRU(ENCODER_CACHE_SIZE)
+_encoders = _LRU(ENCODER_CACHE_SIZE)
+
+
+def _compile_encode(layout):
+    """Función encode(r) para ((campo, posición, conversión), ...), cacheada por layout"""
+    def create():
+        parts = [f"{field!r}: {CONVERTERS[converter].format(i=i)}" for field, i, converter in layout]
+        source = "def encode(r):\n    return {" + ", ".join(parts) + "}\n"
+        namespace = {}
+        name = ','.join(field for field, _, _ in layout)
+        exec(compile(source, f"<row encoder {name}>", 'exec'), namespace)
+        return namespace['encode']
+    return _compiled.get_or_create(layout, create)
+
+
+def get_row_encoder(name, fields, expressions, converters=None):
+    """Encoder cacheado por (endpoint, campos) para reutilizarlo entre invocaciones"""
+    return _encoders.get_or_create(
+        (name, tuple(fields)), lambda: RowEncoder(fields, expressions, converters)
+    )
@@ -0,0 +1,156 @@
+"""
+Dashboard Lambda - Sketches de cuantiles
+Sketch mergeable estilo DDSketch: buckets logarítmicos con error relativo
+acotado, de forma que p50/p80/p95 se pueden responder combinando sketches
+precalculados sin ordenar filas en bruto.
+"""
+
+import json
+import math
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_QUANTILES = (0.5, 0.8, 0.95, 0.99)
+
+
+def quantile_label(q):
+    """0.5 -> 'p50', 0.995 -> 'p99.5'"""
+    return f"p{q * 100:g}"
+
+
+def parse_quantiles(value):
+    """'0.5,0.95' o 'p50,p95' -> (0.5, 0.95); lanza ValueError si no están en (0, 1)"""
+    quantiles = []
+    for part in value.split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        q = float(part[1:]) / 100 if part.startswith('p') else float(part)
+        if not 0 < q < 1:
+            raise ValueError(f"Quantile out of range: {part}")
+        quantiles.append(q)
+    if not quantiles:
+        raise ValueError("No quantiles given")
+    return tuple(quantiles)
+
+
+class QuantileSketch:
+    """
+    Sketch de cuantiles con error relativo `relative_accuracy`.
+    Los valores <= 0 se cuentan aparte (zero_count).
+    """
+
+    __slots__ = ('relative_accuracy', 'gamma', '_log_gamma', 'bins',
+                 'zero_count', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value, weight=1):
+        """Añade un valor (se ignoran los None)"""
+        if value is None:
+            return
+        value = float(value)
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + weight
+        self.count += weight
+        self.sum += value * weight
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Combina otro sketch con la misma precisión en este"""
+        if other is None or not other.count:
+            return self
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """Cuantil aproximado (None si el sketch está vacío)"""
+        if not self.count:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return min(self.min, 0.0)
+
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+
+        return self.max
+
+    def summary(self, quantiles=DEFAULT_QUANTILES):
+        """count/mean/min/max y los cuantiles pedidos como {'p50': ..., 'p95': ...}"""
+        result = {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max
+        }
+        for q in quantiles:
+            result[quantile_label(q)] = self.quantile(q)
+        return result
+
+    def to_dict(self):
+        """Forma serializable (JSON) del sketch"""
+        return {
+            'a': self.relative_accuracy,
+            'n': self.count,
+            'z': self.zero_count,
+            's': self.sum,
+            'mn': self.min,
+            'mx': self.max,
+            'b': [[index, count] for index, count in sorted(self.bins.items())]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Reconstruye un sketch desde to_dict() (acepta también JSON en texto)"""
+        if isinstance(data, (str, bytes)):
+            data = json.loads(data)
+        sketch = cls(data.get('a', DEFAULT_RELATIVE_ACCURACY))
+        sketch.count = data.get('n', 0)
+        sketch.zero_count = data.get('z', 0)
+        sketch.sum = data.get('s', 0.0)
+        sketch.min = data.get('mn')
+        sketch.max = data.get('mx')
+        sketch.bins = {int(index): count for index, count in data.get('b', [])}
+        return sketch
+
+
+def merge_sketches(sketches, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """Combina una colección de sketches (u objetos serializados) en uno nuevo"""
+    merged = QuantileSketch(relative_accuracy)
+    for sketch in sketches:
+        if sketch is None:
+            continue
+        if not isinstance(sketch, QuantileSketch):
+            sketch = QuantileSketch.from_dict(sketch)
+        merged.merge(sketch)
+    return merged
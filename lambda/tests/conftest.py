@@ -0,0 +1,130 @@
+"""
+Tests de la Lambda del dashboard: los módulos viven planos en lambda/, igual
+que en el ZIP desplegado, así que se añaden al path como hacen los benchmarks.
+
+Uso (desde lambda/): python -m pytest -q
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Sin líneas de métricas mientras corren los tests
+os.environ.setdefault('METRICS_FORMAT', 'off')
+
+
+class FakeCursor:
+    """Cursor que responde con database.respond(sql, params) (dicts o tuplas, según el test)"""
+
+    def __init__(self, database):
+        self.database = database
+        self.itersize = None
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self._rows = list(self.database.execute(sql, params) or [])
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=None):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def __iter__(self):
+        while self._rows:
+            yield self._rows.pop(0)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    closed = False
+    readonly = True
+
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, name=None, cursor_factory=None):
+        return FakeCursor(self.database)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeDatabase:
+    """Sustituye al pool de db: cada conexión prestada es una FakeConnection"""
+
+    def __init__(self):
+        self.statements = []
+        self.respond = lambda sql, params: []
+        self._lock = threading.Lock()
+
+    def execute(self, sql, params):
+        with self._lock:
+            self.statements.append((sql, params))
+        return self.respond(sql, params)
+
+    def executed(self, fragment):
+        """Sentencias ejecutadas que contienen fragment"""
+        return [(sql, params) for sql, params in self.statements if fragment in sql]
+
+
+class _Pooled:
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class _Pool:
+    def release(self, pooled, broken=False):
+        pass
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """db_connection / run_concurrently sin PostgreSQL"""
+    import db
+
+    database = FakeDatabase()
+    pool = _Pool()
+    monkeypatch.setattr(db, '_acquire', lambda session: (pool, _Pooled(FakeConnection(database)), 'primary'))
+    monkeypatch.setattr(db, '_prepare', lambda pooled, session: None)
+    return database
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    """Caché de respuestas vacía y sin backend compartido"""
+    import response_cache
+
+    cache = response_cache.ResponseCache(backend=None)
+    monkeypatch.setattr(response_cache, '_cache', cache)
+    return cache
+
+
+def url_event(path, params=None, headers=None, method='GET'):
+    """Evento de Lambda Function URL (payload 2.0)"""
+    return {
+        'rawPath': path,
+        'requestContext': {'http': {'method': method}},
+        'headers': headers or {},
+        'queryStringParameters': params or {}
+    }
@@ -0,0 +1,92 @@
+"""/batch: validación del cuerpo y deduplicación de sub-peticiones"""
+
+import json
+import threading
+
+import pytest
+
+from batch import BATCH_MAX_REQUESTS, BatchError, build_batch_body, parse_batch, run_batch
+
+
+class Execute:
+    """execute(path, query_params, etag) que registra cada ejecución"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, path, query_params, etag):
+        with self._lock:
+            self.calls.append((path, query_params, etag))
+        body = json.dumps({'path': path, 'params': query_params})
+        return {'statusCode': 200, 'headers': {'ETag': 'W/"x"', 'Content-Type': 'application/json'}, 'body': body}
+
+
+def test_parse_batch_accepts_strings_and_objects():
+    requests = parse_batch(json.dumps({'requests': [
+        '/analytics?days=7',
+        {'id': 'logs', 'path': '/query-logs', 'params': {'limit': 100, 'team': ['a', 'b']}, 'etag': 'W/"1"'}
+    ]}))
+
+    assert requests == [
+        ('0', '/analytics', {'days': ['7']}, None),
+        ('logs', '/query-logs', {'limit': ['100'], 'team': ['a', 'b']}, 'W/"1"')
+    ]
+
+
+@pytest.mark.parametrize('body', [
+    'not json',
+    '{"requests": []}',
+    '[{"params": {}}]',
+    '["/batch"]',
+    '["/api/dashboard/query-logs/export"]',
+    '[{"id": "a", "path": "/filters"}, {"id": "a", "path": "/analytics"}]',
+    json.dumps(['/filters'] * (BATCH_MAX_REQUESTS + 1))
+])
+def test_parse_batch_rejects_invalid_bodies(body):
+    with pytest.raises(BatchError):
+        parse_batch(body)
+
+
+def test_run_batch_executes_equivalent_requests_once():
+    requests = parse_batch([
+        {'id': 'a', 'path': '/analytics?days=7&team=x'},
+        {'id': 'b', 'path': '/api/dashboard/analytics', 'params': {'team': 'x', 'days': 7}},
+        {'id': 'd', 'path': '/filters'}
+    ])
+    execute = Execute()
+
+    responses, stats = run_batch(requests, execute, max_workers=4)
+
+    assert len(execute.calls) == 2
+    assert stats['requests'] == 3
+    assert stats['executed'] == 2
+    assert stats['deduplicated'] == 1
+    assert responses['a'] is responses['b']
+    assert responses['d'] is not responses['a']
+
+
+def test_run_batch_keeps_requests_with_different_etags_apart():
+    requests = parse_batch([
+        {'id': 'a', 'path': '/filters'},
+        {'id': 'b', 'path': '/filters', 'etag': 'W/"1"'}
+    ])
+    execute = Execute()
+
+    _, stats = run_batch(requests, execute, max_workers=1)
+
+    assert stats['executed'] == 2
+    assert sorted(etag or '' for _, _, etag in execute.calls) == ['', 'W/"1"']
+
+
+def test_build_batch_body_embeds_sub_responses():
+    responses, stats = run_batch(parse_batch(['/filters']), Execute())
+
+    body = json.loads(build_batch_body(responses, stats))
+
+    assert body['responses']['0'] == {
+        'status': 200,
+        'headers': {'ETag': 'W/"x"'},
+        'body': {'path': '/filters', 'params': {}}
+    }
+    assert body['batch']['executed'] == 1
@@ -0,0 +1,129 @@
+"""compression: negociación de Accept-Encoding, umbral y respuestas por encima del límite"""
+
+import base64
+import gzip
+import json
+
+import pytest
+
+import compression
+import lambda_function
+from compression import choose_encoding, compress_response, parse_accept_encoding, response_size
+
+
+class FakeBrotli:
+    @staticmethod
+    def compress(data, quality):
+        return b'br:' + data
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    monkeypatch.setattr(compression, '_brotli', FakeBrotli)
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, '_brotli', False)
+
+
+def big_response(status=200, size=4096, headers=None):
+    return {'statusCode': status, 'headers': dict(headers or {}), 'body': json.dumps({'data': 'x' * size})}
+
+
+def test_parse_accept_encoding_reads_q_values():
+    assert parse_accept_encoding('gzip;q=0.8, BR , deflate;q=bad') == {'gzip': 0.8, 'br': 1.0, 'deflate': 0.0}
+    assert parse_accept_encoding(None) == {}
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, deflate, br', 'br'),
+    ('gzip;q=1.0, br;q=0.5', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('*', 'br'),
+    ('identity', None),
+    (None, None)
+])
+def test_choose_encoding_prefers_br(with_brotli, header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_choose_encoding_falls_back_to_gzip_without_brotli(without_brotli):
+    assert choose_encoding('br') is None
+    assert choose_encoding('br, gzip') == 'gzip'
+
+
+def test_compressed_body_is_base64_gzip(without_brotli):
+    response = big_response(headers={'Content-Type': 'application/json'})
+    compressed = compress_response(response, 'gzip')
+
+    assert compressed['isBase64Encoded'] is True
+    assert compressed['headers']['Content-Encoding'] == 'gzip'
+    assert compressed['headers']['Vary'] == 'Accept-Encoding'
+    assert compressed['headers']['Content-Type'] == 'application/json'
+    assert compressed['headers']['X-Uncompressed-Length'] == str(len(response['body']))
+    assert gzip.decompress(base64.b64decode(compressed['body'])).decode('utf-8') == response['body']
+
+
+def test_small_bodies_are_not_compressed(without_brotli, monkeypatch):
+    monkeypatch.setattr(compression, 'COMPRESSION_MIN_BYTES', 1024)
+    response = big_response(size=100)
+    assert compress_response(response, 'gzip') is response
+
+
+@pytest.mark.parametrize('response', [
+    big_response(status=304),
+    {**big_response(), 'isBase64Encoded': True},
+    big_response(headers={'Content-Encoding': 'gzip'})
+])
+def test_skips_304_binary_and_encoded_responses(without_brotli, response):
+    assert compress_response(response, 'gzip') is response
+
+
+def test_response_size_counts_the_encoded_body(without_brotli):
+    response = {'statusCode': 200, 'body': 'ñ' * 10}
+    assert response_size(response) == 20
+
+    compressed = compress_response(big_response(), 'gzip')
+    assert response_size(compressed) == len(compressed['body'])
+
+
+@pytest.fixture
+def small_limit(monkeypatch):
+    monkeypatch.setattr(compression, 'MAX_RESPONSE_BYTES', 2000)
+
+
+def test_oversized_response_becomes_413(small_limit):
+    response = lambda_function.handle_oversized_response('/user-metrics', {}, big_response(), None)
+    body = json.loads(response['body'])
+
+    assert response['statusCode'] == 413
+    assert body['max_bytes'] == 2000
+    assert body['response_bytes'] > 2000
+    assert 'suggestion' not in body
+
+
+def test_oversized_query_logs_suggests_smaller_cursor_pages(small_limit):
+    response = lambda_function.handle_oversized_response(
+        '/query-logs', {'limit': ['100']}, big_response(size=8000), None
+    )
+    suggestion = json.loads(response['body'])['suggestion']
+
+    assert response['statusCode'] == 413
+    assert suggestion['pagination'] == 'cursor'
+    assert 1 <= suggestion['limit'] < 100
+
+
+def test_oversized_cursor_page_is_retried_with_smaller_limit(small_limit, fake_db):
+    fields = lambda_function.resolve_query_log_fields({})
+    encoder = lambda_function.query_log_encoder(fields, lambda_function.QUERY_LOGS_PREVIEW_LENGTH)
+    row = tuple(1.0 if field in lambda_function.QUERY_LOG_CONVERTERS else 'v' for field, _ in encoder.columns)
+    fake_db.respond = lambda sql, params: [row] * params[-1]
+
+    response = lambda_function.handle_oversized_response(
+        '/query-logs', {'pagination': ['cursor'], 'limit': ['100']}, big_response(size=80000), None
+    )
+
+    assert response['statusCode'] == 200
+    assert response_size(response) <= 2000
+    assert 1 <= fake_db.executed('LIMIT')[0][1][-1] - 1 < 100
@@ -0,0 +1,134 @@
+"""conversations: combinación resumen + delta, listado keyset y validación de /conversations"""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import conversations
+import lambda_function
+import rollup
+from conversations import merge, to_response
+
+WATERMARK = datetime(2025, 6, 1, 0, 0, 0)
+
+
+def summary(conversation_id, first_at, last_at, turns=1, person='Ana', team='team-a', tools=(), confidence=0.0,
+            scored=0):
+    return {
+        'conversation_id': conversation_id, 'session_token': f's-{conversation_id}',
+        'person_name': person, 'app_name': team,
+        'turn_count': turns, 'tokens_input': 10 * turns, 'tokens_output': 5 * turns, 'tokens_total': 15 * turns,
+        'scored_count': scored, 'confidence_sum': confidence,
+        'first_at': first_at, 'last_at': last_at, 'tools': list(tools)
+    }
+
+
+def test_merge_adds_delta_to_stored_row():
+    stored = summary('c1', WATERMARK - timedelta(hours=2), WATERMARK - timedelta(hours=1), turns=2,
+                     person=None, tools=['search'], confidence=1.5, scored=2)
+    delta = summary('c1', WATERMARK + timedelta(minutes=1), WATERMARK + timedelta(minutes=5), turns=1,
+                    person='Luis', tools=['calc', 'search'], confidence=0.9, scored=1)
+
+    merged = merge(stored, delta)
+
+    assert merged['person_name'] == 'Luis'
+    assert (merged['turn_count'], merged['tokens_total'], merged['scored_count']) == (3, 45, 3)
+    assert (merged['first_at'], merged['last_at']) == (stored['first_at'], delta['last_at'])
+    assert merged['tools'] == ['calc', 'search']
+    assert merge(None, delta) == delta and merge(stored, None) == stored
+
+
+def test_response_has_average_trust_and_duration():
+    body = to_response(summary('c1', WATERMARK, WATERMARK + timedelta(seconds=90), turns=3,
+                               confidence=2.4, scored=3))
+
+    assert body['avg_trust'] == pytest.approx(0.8)
+    assert body['duration_seconds'] == 90.0
+    assert (body['person'], body['team'], body['turn_count']) == ('Ana', 'team-a', 3)
+    assert to_response(summary('c2', WATERMARK, WATERMARK))['avg_trust'] is None
+
+
+@pytest.fixture
+def summary_db(fake_db, monkeypatch):
+    """Resumen hasta WATERMARK: c1 tiene turnos nuevos; c2..c5 solo están en el resumen"""
+    monkeypatch.setattr(rollup, 'ROLLUP_MODE', 'auto')
+    hour = timedelta(hours=1)
+    delta = [summary('c1', WATERMARK + timedelta(minutes=1), WATERMARK + timedelta(minutes=9))]
+    stored_c1 = summary('c1', WATERMARK - 5 * hour, WATERMARK - 4 * hour, turns=4)
+    table = [summary(f'c{i}', WATERMARK - 3 * i * hour, WATERMARK - i * hour) for i in range(2, 6)]
+
+    def respond(sql, params):
+        if 'rollup_watermarks' in sql:
+            return [{'watermark': WATERMARK}]
+        if 'WITH turns' in sql:
+            return delta
+        if 'NOT (conversation_id = ANY' in sql:
+            return table[:params[-1]]
+        if 'conversation_id = ANY' in sql:
+            return [stored_c1]
+        return []
+
+    fake_db.respond = respond
+    return fake_db
+
+
+def test_list_puts_delta_first_then_summary_page(summary_db):
+    with lambda_function.db_connection() as conn:
+        rows, has_more, watermark = conversations.list_conversations(conn, limit=3)
+
+    assert [row['conversation_id'] for row in rows] == ['c1', 'c2', 'c3']
+    assert rows[0]['turn_count'] == 5
+    assert has_more is True
+    assert watermark == WATERMARK
+    # El resumen excluye las conversaciones del delta y pide solo las filas que faltan (+1)
+    sql, params = summary_db.executed('NOT (conversation_id = ANY')[0]
+    assert params[0] == ['c1'] and params[-1] == 3
+
+
+def test_handler_pages_with_cursor(summary_db):
+    response = lambda_function.handle_conversations({'limit': ['2'], 'start_date': ['2025-05-31']})
+    body = json.loads(response['body'])
+
+    assert response['statusCode'] == 200
+    assert [row['conversation_id'] for row in body['data']] == ['c1', 'c2']
+    assert body['has_more'] is True
+    assert lambda_function.decode_cursor(body['next_cursor']) == (WATERMARK - timedelta(hours=2), 'c2')
+    sql, params = summary_db.executed('NOT (conversation_id = ANY')[0]
+    assert 'last_at >= %s' in sql and datetime(2025, 5, 31) in params
+
+
+def test_without_summary_reads_recent_raw_rows(fake_db, monkeypatch):
+    monkeypatch.setattr(rollup, 'ROLLUP_MODE', 'off')
+
+    with lambda_function.db_connection() as conn:
+        rows, has_more, watermark = conversations.list_conversations(conn)
+
+    assert (rows, has_more, watermark) == ([], False, None)
+    assert len(fake_db.statements) == 1
+    start = fake_db.statements[0][1]['start']
+    expected = datetime.now() - timedelta(days=conversations.CONVERSATIONS_FALLBACK_DAYS)
+    assert abs(start - expected) < timedelta(minutes=1)
+
+
+@pytest.mark.parametrize('params', [
+    {'limit': '0'},
+    {'limit': 'many'},
+    {'start_date': '2025-02-30'},
+    {'end_date': 'yesterday'},
+    {'after': '!!'}
+])
+def test_bad_list_parameters_return_400(fake_db, params):
+    response = lambda_function.handle_conversations({name: [value] for name, value in params.items()})
+
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error']
+    assert fake_db.statements == []
+
+
+@pytest.mark.parametrize('preview_length', ['-1', 'all'])
+def test_bad_detail_preview_length_returns_400(fake_db, preview_length):
+    response = lambda_function.handle_conversation_detail('c1', {'preview_length': [preview_length]})
+
+    assert response['statusCode'] == 400
+    assert fake_db.statements == []
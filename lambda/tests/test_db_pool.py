@@ -0,0 +1,109 @@
+"""ConnectionPool: reutilización, descarte de conexiones y contadores bajo concurrencia"""
+
+import threading
+import time
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from db import ConnectionPool, _PooledConnection
+
+
+class PoolConnection:
+    """Conexión psycopg2 mínima para el pool"""
+
+    def __init__(self):
+        self.closed = False
+        self.status = TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(ConnectionPool):
+    """Pool que crea PoolConnection en lugar de conectar a PostgreSQL"""
+
+    def __init__(self, **kwargs):
+        super().__init__({}, **kwargs)
+        self.connects = 0
+
+    def _connect(self):
+        with self._lock:
+            self.connects += 1
+        return _PooledConnection(PoolConnection())
+
+
+def test_released_connection_is_reused():
+    pool = FakePool()
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+
+    assert second is first
+    stats = pool.get_stats()
+    assert (stats['hits'], stats['misses'], stats['in_use']) == (1, 1, 1)
+    assert stats['hit_ratio'] == 0.5
+
+
+def test_closed_and_expired_connections_are_replaced():
+    pool = FakePool(max_idle=60)
+    closed, expired = pool.acquire(), pool.acquire()
+    pool.release(closed)
+    pool.release(expired)
+    closed.conn.closed = True
+    expired.last_used_at = time.monotonic() - 120
+
+    fresh = pool.acquire()
+
+    assert fresh not in (closed, expired)
+    stats = pool.get_stats()
+    assert stats['reconnects'] == 2
+    assert stats['discarded'] == 2
+    assert stats['idle'] == 0
+    assert expired.conn.closed
+
+
+def test_release_rolls_back_and_discards_broken_or_surplus():
+    pool = FakePool(max_size=1)
+    in_transaction, broken, surplus = pool.acquire(), pool.acquire(), pool.acquire()
+    in_transaction.conn.status = TRANSACTION_STATUS_INTRANS
+
+    pool.release(in_transaction)
+    pool.release(broken, broken=True)
+    pool.release(surplus)
+
+    assert in_transaction.conn.rollbacks == 1
+    assert broken.conn.closed and surplus.conn.closed
+    stats = pool.get_stats()
+    assert (stats['idle'], stats['in_use'], stats['discarded']) == (1, 0, 2)
+
+
+def test_counters_are_exact_under_concurrency():
+    pool = FakePool(max_size=4)
+    threads, rounds = 8, 500
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        barrier.wait()
+        for i in range(rounds):
+            pooled = pool.acquire()
+            pool.release(pooled, broken=(i % 50 == 0))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    stats = pool.get_stats()
+    assert stats['hits'] + stats['misses'] == threads * rounds
+    assert stats['misses'] == pool.connects
+    assert stats['in_use'] == 0
+    assert stats['discarded'] == pool.connects - stats['idle']
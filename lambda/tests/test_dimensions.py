@@ -0,0 +1,143 @@
+"""dimensions: búsqueda por prefijo, catálogo incremental desde el watermark y /filters"""
+
+import json
+from datetime import datetime, timedelta
+
+import psycopg2.errors
+import pytest
+
+import dimensions
+import lambda_function
+from dimensions import DimensionCatalog, DimensionValues
+
+SEEN = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def test_values_sort_case_insensitively_without_duplicates():
+    values = DimensionValues(['bravo', 'Alpha', 'charlie'])
+    values.update(['alpha', 'Bravo', 'bravo'])
+
+    assert values.search() == ['Alpha', 'alpha', 'Bravo', 'bravo', 'charlie']
+    assert len(values) == 5
+
+
+def test_prefix_search_with_limit():
+    values = DimensionValues(['Ana', 'andrés', 'Antonio', 'Beatriz', 'an'])
+
+    assert values.search('AN') == ['an', 'Ana', 'andrés', 'Antonio']
+    assert values.search('an', limit=2) == ['an', 'Ana']
+    assert values.search('', limit=1) == ['an']
+    assert values.search('z') == []
+
+
+class CatalogCursor:
+    """Cursor que sirve la tabla del catálogo y los deltas por orden"""
+
+    def __init__(self, table, deltas=(), missing=False):
+        self.table = table
+        self.deltas = list(deltas)
+        self.missing = missing
+        self.executed = []
+        self.rollbacks = 0
+        self.connection = self
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        if 'UNION ALL' in sql:
+            self._rows = self.deltas.pop(0) if self.deltas else []
+        elif self.missing:
+            raise psycopg2.errors.UndefinedTable('relation "web_queries_dimensions" does not exist')
+        else:
+            self._rows = self.table
+
+    def fetchall(self):
+        return self._rows
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def row(dimension, value, last_seen=SEEN):
+    return {'dimension': dimension, 'value': value, 'last_seen': last_seen}
+
+
+@pytest.fixture
+def no_memo(monkeypatch):
+    monkeypatch.setattr(dimensions, 'DIMENSIONS_MEMO_SECONDS', 0)
+
+
+def test_first_refresh_loads_table_then_reads_delta_from_watermark(no_memo):
+    cursor = CatalogCursor(
+        [row('person_name', 'Ana'), row('app_name', 'team-a', SEEN - timedelta(days=1))],
+        deltas=[[], [row('person_name', 'Luis', SEEN + timedelta(minutes=5))]]
+    )
+    catalog = DimensionCatalog()
+
+    assert catalog.refresh(cursor) is True
+    assert catalog.watermark == SEEN
+    assert cursor.executed[1][1] == {'since': SEEN - dimensions.OVERLAP}
+
+    assert catalog.refresh(cursor) is True
+    assert len(cursor.executed) == 3
+    assert catalog.search('person_name') == ['Ana', 'Luis']
+    assert catalog.search('app_name') == ['team-a']
+    assert catalog.watermark == SEEN + timedelta(minutes=5)
+
+
+def test_refresh_is_memoized(monkeypatch):
+    monkeypatch.setattr(dimensions, 'DIMENSIONS_MEMO_SECONDS', 60)
+    cursor = CatalogCursor([row('person_name', 'Ana')])
+    catalog = DimensionCatalog()
+
+    catalog.refresh(cursor)
+    catalog.refresh(cursor)
+
+    assert len(cursor.executed) == 2
+
+
+def test_missing_or_empty_table_is_not_ready(no_memo):
+    missing = CatalogCursor([], missing=True)
+    assert DimensionCatalog().refresh(missing) is False
+    assert missing.rollbacks == 1
+
+    assert DimensionCatalog().refresh(CatalogCursor([])) is False
+
+
+@pytest.fixture
+def catalog_db(fake_db, monkeypatch, no_memo):
+    monkeypatch.setattr(dimensions, '_catalog', DimensionCatalog())
+    table = [row('person_name', name) for name in ('Ana', 'andrés', 'Beatriz')] + [row('app_name', 'team-a')]
+    fake_db.respond = lambda sql, params: [] if 'UNION ALL' in sql else table
+    return fake_db
+
+
+def call(params):
+    response = lambda_function.handle_filters({name: [value] for name, value in params.items()})
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_filters_search_the_catalog(catalog_db):
+    status, body = call({'prefix': 'an', 'dimension': 'persons', 'limit': '1'})
+
+    assert status == 200
+    assert body['persons'] == ['Ana']
+    assert 'teams' not in body
+    assert not catalog_db.executed('DISTINCT')
+
+
+def test_filters_limit_zero_returns_everything(catalog_db):
+    status, body = call({'limit': '0'})
+
+    assert status == 200
+    assert body['persons'] == ['Ana', 'andrés', 'Beatriz']
+    assert body['teams'] == ['team-a']
+
+
+@pytest.mark.parametrize('params', [{'limit': '-1'}, {'limit': 'all'}, {'dimension': 'models'}])
+def test_bad_filter_parameters_return_400(catalog_db, params):
+    status, body = call(params)
+
+    assert status == 400
+    assert body['error']
+    assert catalog_db.statements == []
@@ -0,0 +1,106 @@
+"""/user-metrics y /team-metrics: rango de fechas, agregación y resultados parciales"""
+
+import json
+from datetime import date, datetime
+
+import psycopg2.errors
+import pytest
+
+import lambda_function
+
+DAILY = [
+    {'entity': 'Ana', 'date': date(2025, 1, 30), 'count': 3, 'tokens_input': 30, 'tokens_output': 9, 'tokens_total': 39},
+    {'entity': 'Ana', 'date': date(2025, 2, 1), 'count': 2, 'tokens_input': 20, 'tokens_output': None, 'tokens_total': 20},
+    {'entity': 'Luis', 'date': date(2025, 2, 1), 'count': 1, 'tokens_input': 5, 'tokens_output': 5, 'tokens_total': 10},
+    {'entity': 'Ghost', 'date': date(2025, 2, 1), 'count': 9, 'tokens_input': 1, 'tokens_output': 1, 'tokens_total': 2}
+]
+LATENCY = [
+    {'entity': 'Ana', 'team': 'team-a', 'count': 5, 'avg_response_time_ms': 120.5,
+     'p50_response_time_ms': 100, 'p95_response_time_ms': 300},
+    {'entity': 'Luis', 'team': 'team-b', 'count': 1, 'avg_response_time_ms': None,
+     'p50_response_time_ms': None, 'p95_response_time_ms': None}
+]
+
+
+def test_end_date_includes_the_whole_day():
+    start, end = lambda_function.parse_date_range({'start_date': ['2025-01-01'], 'end_date': ['2025-01-31']})
+    assert (start, end) == (datetime(2025, 1, 1), datetime(2025, 2, 1))
+
+
+def test_days_counts_back_from_end_date():
+    start, end = lambda_function.parse_date_range({'end_date': ['2025-01-31'], 'days': ['7']})
+    assert (start, end) == (datetime(2025, 1, 25), datetime(2025, 2, 1))
+
+
+def test_aware_timestamps_are_normalized_to_utc():
+    start, end = lambda_function.parse_date_range({
+        'start_date': ['2025-01-01T02:00:00+02:00'], 'end_date': ['2025-01-02T00:00:00Z']
+    })
+    assert (start, end) == (datetime(2025, 1, 1), datetime(2025, 1, 2))
+
+
+def test_aggregate_folds_daily_rows_into_months():
+    metrics = lambda_function.aggregate_entity_metrics(DAILY, LATENCY)
+
+    assert set(metrics) == {'Ana', 'Luis'}
+    assert metrics['Ana']['daily'] == {'2025-01-30': 3, '2025-02-01': 2}
+    assert metrics['Ana']['monthly'] == {'2025-01': 3, '2025-02': 2}
+    assert (metrics['Ana']['tokens_input'], metrics['Ana']['tokens_output']) == (50, 9)
+    assert metrics['Luis']['avg_response_time_ms'] == 0.0
+
+
+@pytest.fixture
+def metrics_db(fake_db):
+    def respond(sql, params):
+        if 'EXTRACT(HOUR' in sql:
+            return [{'hour': 9, 'count': 4}]
+        if 'PERCENTILE_CONT' in sql:
+            return LATENCY
+        return DAILY
+
+    fake_db.respond = respond
+    return fake_db
+
+
+def test_user_metrics_queries_with_exclusive_end(metrics_db):
+    response = lambda_function.handle_user_metrics({'start_date': ['2025-01-01'], 'end_date': ['2025-02-01']})
+    body = json.loads(response['body'])
+
+    assert response['statusCode'] == 200
+    assert body['users']['Ana']['total'] == 5
+    assert body['hourlyToday'][9] == 4
+    sql, params = metrics_db.executed('PERCENTILE_CONT')[0]
+    assert 'created_at < %s' in sql
+    assert params == [datetime(2025, 1, 1), datetime(2025, 2, 2)]
+
+
+def test_team_metrics_drop_the_team_field(metrics_db):
+    body = json.loads(lambda_function.handle_team_metrics({'days': ['30']})['body'])
+    assert 'team' not in body['teams']['Ana']
+
+
+def test_cancelled_task_gives_partial_result(fake_db):
+    def respond(sql, params):
+        if 'PERCENTILE_CONT' in sql:
+            raise psycopg2.errors.QueryCanceled('canceling statement due to statement timeout')
+        return []
+
+    fake_db.respond = respond
+    response = lambda_function.handle_team_metrics({})
+
+    assert response['statusCode'] == 200
+    assert response['headers']['X-Partial-Result'] == 'latency'
+    assert json.loads(response['body'])['partial'] == ['latency']
+
+
+@pytest.mark.parametrize('handler', [lambda_function.handle_user_metrics, lambda_function.handle_team_metrics])
+@pytest.mark.parametrize('params', [
+    {'days': ['abc']},
+    {'days': ['-3']},
+    {'end_date': ['31/01/2025']},
+    {'start_date': ['2025-02-01'], 'end_date': ['2025-01-01']}
+])
+def test_bad_ranges_return_400(fake_db, handler, params):
+    response = handler(params)
+    assert response['statusCode'] == 400
+    assert fake_db.statements == []
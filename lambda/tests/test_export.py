@@ -0,0 +1,153 @@
+"""/query-logs/export: tope de bytes por respuesta y cursor de continuación"""
+
+import base64
+import gzip
+import json
+import os
+import random
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+import compression
+import export
+import lambda_function
+
+
+def test_export_cap_leaves_room_for_base64():
+    assert export.EXPORT_MAX_BYTES * 4 // 3 + export.EXPORT_MARGIN_BYTES < compression.MAX_RESPONSE_BYTES
+
+
+def test_export_buffer_fills_at_max_bytes():
+    buffer = export.ExportBuffer(max_bytes=10)
+    buffer.write(b'12345')
+    assert not buffer.full
+    buffer.write(b'67890')
+    assert buffer.full
+    assert buffer.getvalue() == b'1234567890'
+
+
+def test_encode_chunks_gzip_round_trip():
+    chunks = ['{"a": 1}\n', '', '{"a": 2}\n']
+    data = b''.join(export.encode_chunks(iter(chunks), compress=True))
+    assert zlib.decompress(data, 31) == b'{"a": 1}\n{"a": 2}\n'
+
+
+@pytest.fixture
+def fake_rows(monkeypatch):
+    """
+    Filas sin base de datos: textos aleatorios en base64 (comprimen poco) para
+    superar el tope con gzip y sin él. Devuelve el número de filas generadas.
+    """
+    @contextmanager
+    def fake_connection():
+        yield None
+
+    encoder = lambda_function.query_log_encoder(
+        lambda_function.resolve_query_log_fields({}, default_view='full')
+    )
+    rng = random.Random(5)
+    started = datetime(2025, 6, 1)
+    generated = {'rows': 0}
+
+    def iter_rows(conn, query, params, itersize=None):
+        for i in range(100000):
+            generated['rows'] += 1
+            row = []
+            for field, _ in encoder.columns:
+                if field == 'query_id':
+                    row.append(100000 - i)
+                elif field.endswith('timestamp'):
+                    row.append(started - timedelta(seconds=i))
+                elif field in lambda_function.QUERY_LOG_CONVERTERS:
+                    row.append(1.0)
+                else:
+                    row.append(base64.b64encode(rng.randbytes(600)).decode('ascii'))
+            yield tuple(row)
+
+    monkeypatch.setattr(lambda_function, 'db_connection', fake_connection)
+    monkeypatch.setattr(export, 'iter_rows', iter_rows)
+    return generated
+
+
+def export_event(**params):
+    return {
+        'rawPath': '/query-logs/export',
+        'requestContext': {'http': {'method': 'GET'}},
+        'headers': {},
+        'queryStringParameters': params
+    }
+
+
+@pytest.mark.parametrize('gzip_param', ['1', '0'])
+def test_export_stops_under_response_cap_with_cursor(fake_rows, gzip_param):
+    response = lambda_function.lambda_handler(export_event(gzip=gzip_param), None)
+
+    assert response['statusCode'] == 200
+    assert compression.response_size(response) <= compression.MAX_RESPONSE_BYTES
+    assert 'X-Next-Cursor' in response['headers']
+
+    if gzip_param == '1':
+        # Fichero .gz que se guarda tal cual: sin Content-Encoding que el navegador deshaga
+        assert response['isBase64Encoded']
+        assert response['headers']['Content-Type'] == 'application/gzip'
+        assert 'Content-Encoding' not in response['headers']
+        assert response['headers']['Content-Disposition'].endswith('.ndjson.gz"')
+        payload = gzip.decompress(base64.b64decode(response['body'])).decode('utf-8')
+    else:
+        payload = response['body']
+    lines = payload.splitlines()
+    exported = int(response['headers']['X-Export-Rows'])
+    assert len(lines) == exported
+    assert exported < fake_rows['rows']
+
+    # El cursor apunta a la última fila exportada
+    last = json.loads(lines[-1])
+    assert lambda_function.decode_cursor(response['headers']['X-Next-Cursor'])[1] == last['query_id']
+
+
+def test_export_max_rows_is_not_truncated_by_bytes(fake_rows):
+    response = lambda_function.lambda_handler(export_event(max_rows='5'), None)
+
+    assert response['statusCode'] == 200
+    assert response['headers']['X-Export-Rows'] == '5'
+    assert len(response['body'].splitlines()) == 5
+
+
+def test_export_defaults_to_full_view(fake_rows):
+    response = lambda_function.lambda_handler(export_event(max_rows='1'), None)
+    record = json.loads(response['body'])
+
+    assert {'user_query', 'llm_response', 'tools_used'} <= set(record)
+    assert 'user_query_truncated' not in record
+
+
+def test_export_csv_has_header_row(fake_rows):
+    response = lambda_function.lambda_handler(export_event(format='csv', max_rows='2'), None)
+    lines = response['body'].splitlines()
+
+    assert response['headers']['Content-Type'] == 'text/csv'
+    assert lines[0].split(',')[:2] == ['query_id', 'user_id']
+
+
+@pytest.mark.parametrize('params', [
+    {'max_rows': 'many'},
+    {'max_rows': '0'},
+    {'format': 'xml'},
+    {'view': 'huge'},
+    {'after': '!!'},
+    {'start_date': '2025-02-30'}
+])
+def test_export_bad_parameters_return_400(fake_rows, params):
+    response = lambda_function.lambda_handler(export_event(**params), None)
+
+    assert response['statusCode'] == 400
+    assert fake_rows['rows'] == 0
+
+
+@pytest.mark.skipif(os.environ.get('EXPORT_MAX_BYTES') is not None, reason='EXPORT_MAX_BYTES fijado en el entorno')
+def test_default_cap_derives_from_response_cap():
+    expected = compression.MAX_RESPONSE_BYTES * 3 // 4 - export.EXPORT_MARGIN_BYTES
+    assert export.EXPORT_MAX_BYTES == expected
@@ -0,0 +1,67 @@
+"""instrumentation: ventanas de sentencias acotadas, etiquetas fijas y bytes de respuesta"""
+
+import json
+from collections import OrderedDict
+
+import pytest
+
+import conftest
+import instrumentation
+import lambda_function
+
+
+class TimedFakeCursor(instrumentation._TimedCursorMixin, conftest.FakeCursor):
+    arraysize = 100
+
+
+@pytest.fixture
+def statement_windows(monkeypatch):
+    """Ventanas de sentencias vacías y con 10 sentencias como máximo"""
+    windows = OrderedDict()
+    monkeypatch.setattr(instrumentation, '_statement_windows', windows)
+    monkeypatch.setattr(instrumentation, 'METRICS_MAX_STATEMENTS', 10)
+    return windows
+
+
+def test_statement_windows_evict_least_recently_used(statement_windows):
+    for name in range(10):
+        instrumentation._statement_window(f's{name}').append(1.0)
+    instrumentation._statement_window('s0').append(2.0)
+    instrumentation._statement_window('new').append(3.0)
+
+    assert len(statement_windows) == 10
+    assert 's1' not in statement_windows
+    assert list(statement_windows['s0']) == [1.0, 2.0]
+
+
+def test_untagged_sql_variants_stay_bounded(statement_windows, fake_db):
+    cursor = TimedFakeCursor(fake_db)
+    for limit in range(50):
+        cursor.execute(f"SELECT id FROM web_queries LIMIT {limit}")
+
+    assert len(statement_windows) == 10
+    assert all(name.startswith('select:web_queries#') for name in statement_windows)
+
+
+def test_query_logs_statements_have_fixed_tags(statement_windows, fake_db, monkeypatch):
+    monkeypatch.setattr(conftest, 'FakeCursor', TimedFakeCursor)
+    fake_db.respond = lambda sql, params: [(0,)] if 'COUNT(*)' in sql else []
+
+    for params in ({'total': ['exact']},
+                   {'total': ['exact'], 'fields': ['query_id,person'], 'team': ['team-a']},
+                   {'total': ['exact'], 'view': ['full'], 'search': ['hola']}):
+        assert lambda_function.handle_query_logs(params)['statusCode'] == 200
+
+    assert list(statement_windows) == ['query-logs:list', 'query-logs:count']
+    assert len(statement_windows['query-logs:list']) == 3
+
+
+def test_response_bytes_are_encoded_bytes(monkeypatch, capsys):
+    monkeypatch.setattr(instrumentation, 'METRICS_FORMAT', 'json')
+    trace = instrumentation.start_trace('GET', '/analytics')
+
+    instrumentation.finish_trace(trace, {'statusCode': 200, 'body': json.dumps({'name': 'ñandú'}, ensure_ascii=False)})
+    record = json.loads(capsys.readouterr().out.splitlines()[-1])
+
+    assert record['response_bytes'] == len('{"name": "ñandú"}'.encode('utf-8'))
+    assert record['uncompressed_bytes'] == record['response_bytes']
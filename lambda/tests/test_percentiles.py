@@ -0,0 +1,88 @@
+"""/percentiles: sketches del rollup, validación y ETag estable entre recálculos"""
+
+import json
+import random
+from datetime import datetime
+
+import pytest
+
+import lambda_function
+import rollup
+from conftest import url_event
+from sketches import QuantileSketch
+
+
+def sketch_of(values):
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+@pytest.fixture
+def rollup_sketches(monkeypatch, fake_db):
+    """Rollup con watermark y sketches de dos equipos"""
+    rng = random.Random(11)
+    by_team = {
+        team: {
+            'confidence': sketch_of(rng.uniform(0.3, 1.0) for _ in range(500)),
+            'latency': sketch_of(rng.lognormvariate(6, 1) for _ in range(500))
+        }
+        for team in ('team-a', 'team-b')
+    }
+    calls = []
+
+    def load_sketches(cursor, boundary, start_day, end_day, teams=None):
+        calls.append(teams)
+        return {team: entry for team, entry in by_team.items() if not teams or team in teams}
+
+    monkeypatch.setattr(rollup, 'rollup_boundary', lambda cursor: datetime(2025, 6, 10))
+    monkeypatch.setattr(rollup, 'load_sketches', load_sketches)
+    return by_team, calls
+
+
+def test_overall_merges_team_sketches(rollup_sketches):
+    by_team, _ = rollup_sketches
+    response = lambda_function.handle_percentiles({'quantiles': ['0.5,0.95']})
+    body = json.loads(response['body'])
+
+    assert response['statusCode'] == 200
+    assert body['source'] == 'sketch'
+    assert body['quantiles'] == ['p50', 'p95']
+    assert body['overall']['latency']['count'] == 1000
+    assert body['byTeam']['team-a']['confidence']['p50'] == by_team['team-a']['confidence'].quantile(0.5)
+    assert 'elapsed_ms' not in body
+    assert response['headers']['Server-Timing'].startswith('query;dur=')
+
+
+def test_teams_filter_is_passed_to_the_rollup(rollup_sketches):
+    _, calls = rollup_sketches
+    body = json.loads(lambda_function.handle_percentiles({'teams': ['team-b, ']})['body'])
+
+    assert calls == [['team-b']]
+    assert list(body['byTeam']) == ['team-b']
+
+
+@pytest.mark.parametrize('params', [
+    {'quantiles': ['1.5']},
+    {'quantiles': ['median']},
+    {'days': ['0']},
+    {'start_date': ['2025-02-01'], 'end_date': ['2025-01-01']},
+    {'end_date': ['yesterday']}
+])
+def test_bad_parameters_return_400(rollup_sketches, params):
+    assert lambda_function.handle_percentiles(params)['statusCode'] == 400
+
+
+def test_etag_is_stable_across_recomputes(rollup_sketches, fresh_cache):
+    params = {'start_date': '2025-06-01', 'end_date': '2025-06-09'}
+    first = lambda_function.lambda_handler(url_event('/percentiles', {**params, 'refresh': '1'}), None)
+    second = lambda_function.lambda_handler(url_event('/percentiles', {**params, 'refresh': '1'}), None)
+
+    assert first['headers']['X-Cache'] == second['headers']['X-Cache'] == 'BYPASS'
+    assert first['headers']['ETag'] == second['headers']['ETag']
+
+    revalidated = lambda_function.lambda_handler(
+        url_event('/percentiles', params, {'if-none-match': first['headers']['ETag']}), None
+    )
+    assert revalidated['statusCode'] == 304
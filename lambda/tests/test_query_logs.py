@@ -0,0 +1,153 @@
+"""/query-logs: paginación por cursor, bordes de limit y validación de parámetros"""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import lambda_function
+
+START = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def table_rows(count, preview_length=lambda_function.QUERY_LOGS_PREVIEW_LENGTH):
+    """Tuplas en el orden de columnas del encoder del listado (vista summary)"""
+    fields = lambda_function.resolve_query_log_fields({})
+    encoder = lambda_function.query_log_encoder(fields, preview_length)
+    rows = []
+    for i in range(count):
+        values = {
+            'query_id': 1000 - i,
+            'request_timestamp': START - timedelta(minutes=i),
+            'response_timestamp': START - timedelta(minutes=i) + timedelta(seconds=2)
+        }
+        rows.append(tuple(
+            values.get(field, (1.0 if field in lambda_function.QUERY_LOG_CONVERTERS else f'{field}-{i}'))
+            for field, _ in encoder.columns
+        ))
+    return rows
+
+
+@pytest.fixture
+def logs_db(fake_db):
+    """Cinco filas; la consulta principal devuelve tantas como pida su LIMIT"""
+    rows = table_rows(5)
+
+    def respond(sql, params):
+        if 'EXPLAIN' in sql:
+            return [([{'Plan': {'Plan Rows': 42}}],)]
+        if 'COUNT(*)' in sql:
+            return [(5,)]
+        limit = params[-2] if 'OFFSET' in sql else params[-1]
+        offset = params[-1] if 'OFFSET' in sql else 0
+        return rows[offset:offset + limit]
+
+    fake_db.respond = respond
+    return fake_db
+
+
+def call(params):
+    response = lambda_function.handle_query_logs({name: [value] for name, value in params.items()})
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_cursor_page_has_next_cursor_from_last_row(logs_db):
+    status, body = call({'pagination': 'cursor', 'limit': '2'})
+
+    assert status == 200
+    assert [row['query_id'] for row in body['data']] == ['1000', '999']
+    assert body['has_more'] is True
+    assert lambda_function.decode_cursor(body['next_cursor'])[1] == '999'
+    assert body['total'] is None
+    # Se pide una fila extra para saber si hay más
+    assert logs_db.executed('LIMIT')[0][1][-1] == 3
+
+
+def test_last_cursor_page_has_no_next_cursor(logs_db):
+    status, body = call({'pagination': 'cursor', 'limit': '10'})
+
+    assert status == 200
+    assert len(body['data']) == 5
+    assert body['has_more'] is False
+    assert body['next_cursor'] is None
+
+
+def test_cursor_limit_zero_does_not_fail(logs_db):
+    status, body = call({'pagination': 'cursor', 'limit': '0'})
+
+    assert status == 200
+    assert body['data'] == []
+    assert body['has_more'] is True
+    assert body['next_cursor'] is None
+
+
+def test_cursor_limit_zero_keeps_the_current_cursor(logs_db):
+    after = lambda_function.encode_cursor(START, '1000')
+    status, body = call({'after': after, 'limit': '0'})
+
+    assert status == 200
+    assert body['next_cursor'] == after
+
+
+def test_after_adds_keyset_predicate_with_time_bound(logs_db):
+    after = lambda_function.encode_cursor(START, '1000')
+    call({'after': after, 'limit': '2'})
+
+    sql, params = logs_db.executed('LIMIT')[0]
+    assert "created_at <= %s AND (created_at, id) < (%s, %s)" in sql
+    assert params[-4:] == [START, START, '1000', 3]
+
+
+def test_offset_mode_pages_with_offset(logs_db):
+    status, body = call({'limit': '2', 'offset': '2', 'total': 'exact'})
+
+    assert status == 200
+    assert [row['query_id'] for row in body['data']] == ['998', '997']
+    assert body['offset'] == 2
+    assert body['total'] == 5
+
+
+def test_offset_mode_estimates_total_by_default(logs_db):
+    status, body = call({'limit': '2'})
+
+    assert status == 200
+    assert (body['total'], body['total_mode']) == (42, 'estimate')
+    assert logs_db.executed('EXPLAIN')
+    assert not logs_db.executed('COUNT(*)')
+
+
+def test_total_none_skips_counting(logs_db):
+    status, body = call({'limit': '2', 'total': 'none'})
+
+    assert status == 200
+    assert body['total'] is None
+    assert len(logs_db.statements) == 1
+
+
+def test_preview_length_truncates_in_sql(logs_db):
+    status, body = call({'limit': '1', 'preview_length': '50'})
+
+    assert status == 200
+    assert body['preview_length'] == 50
+    assert 'LEFT(query_text, 50)' in logs_db.executed('LIMIT')[0][0]
+
+
+@pytest.mark.parametrize('params', [
+    {'limit': '-1'},
+    {'limit': 'ten'},
+    {'offset': '-5'},
+    {'offset': '1.5'},
+    {'preview_length': '-1'},
+    {'preview_length': 'all'},
+    {'after': 'not-a-cursor'},
+    {'total': 'approximate'},
+    {'fields': 'query_id,secret'},
+    {'view': 'everything'},
+    {'end_date': '2025-13-45'}
+])
+def test_bad_parameters_return_400_without_querying(logs_db, params):
+    status, body = call(params)
+
+    assert status == 400
+    assert body['error']
+    assert logs_db.statements == []
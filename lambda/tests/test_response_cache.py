@@ -0,0 +1,141 @@
+"""cached_call: HIT / 304 / STALE y respuestas que no se guardan"""
+
+import pytest
+
+import lambda_function
+import response_cache
+import rollup
+from conftest import url_event
+from response_cache import ResponseCache, cache_key, cached_call
+
+PATH = '/analytics'
+PARAMS = {'days': ['7']}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Caché en proceso aislada, sin backend compartido"""
+    cache = ResponseCache(max_entries=8, ttls={PATH: 60}, backend=None, stale_seconds=900)
+    monkeypatch.setattr(response_cache, '_cache', cache)
+    return cache
+
+
+class Compute:
+    """compute() que cuenta llamadas y devuelve las respuestas indicadas en orden"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def ok(body='{"total": 1}', headers=None):
+    return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', **(headers or {})}, 'body': body}
+
+
+def test_miss_then_hit(cache):
+    compute = Compute(ok())
+    first = cached_call(PATH, PARAMS, {}, compute)
+    second = cached_call('/api/dashboard/analytics', PARAMS, {}, compute)
+
+    assert compute.calls == 1
+    assert first['headers']['X-Cache'] == 'MISS'
+    assert second['headers']['X-Cache'] == 'HIT'
+    assert second['body'] == first['body']
+    assert second['headers']['ETag'] == first['headers']['ETag']
+
+
+def test_if_none_match_returns_304(cache):
+    etag = cached_call(PATH, PARAMS, {}, Compute(ok()))['headers']['ETag']
+
+    response = cached_call(PATH, PARAMS, {'if-none-match': f'W/"other", {etag}'}, Compute())
+
+    assert response['statusCode'] == 304
+    assert response['body'] == ''
+    assert response['headers']['ETag'] == etag
+
+
+def test_refresh_bypasses_but_shares_the_entry(cache):
+    compute = Compute(ok('{"total": 1}'), ok('{"total": 2}'))
+    cached_call(PATH, PARAMS, {}, compute)
+    refreshed = cached_call(PATH, {**PARAMS, 'refresh': ['1']}, {}, compute)
+    after = cached_call(PATH, PARAMS, {}, compute)
+
+    assert compute.calls == 2
+    assert refreshed['headers']['X-Cache'] == 'BYPASS'
+    assert after['headers']['X-Cache'] == 'HIT'
+    assert after['body'] == '{"total": 2}'
+
+
+def test_timeout_serves_stale_entry(cache):
+    cached_call(PATH, PARAMS, {}, Compute(ok()))
+    key = cache_key(PATH, PARAMS)
+    response, created_at, _ = cache._entries[key]
+    cache._entries[key] = (response, created_at - 120, created_at - 60)
+
+    timeout = {'statusCode': 503, 'headers': {'Retry-After': '30'}, 'body': '{"timeout": true}'}
+    stale = cached_call(PATH, PARAMS, {}, Compute(timeout))
+
+    assert stale['statusCode'] == 200
+    assert stale['headers']['X-Cache'] == 'STALE'
+    assert stale['body'] == '{"total": 1}'
+    assert cache.stats['stale_hits'] == 1
+
+
+def test_timeout_without_stale_entry_is_returned(cache):
+    timeout = {'statusCode': 503, 'headers': {}, 'body': '{"timeout": true}'}
+    assert cached_call(PATH, PARAMS, {}, Compute(timeout)) is timeout
+
+
+@pytest.mark.parametrize('response', [
+    ok(headers={'X-Partial-Result': 'latency'}),
+    {'statusCode': 500, 'headers': {}, 'body': '{"error": "boom"}'}
+])
+def test_partial_and_error_responses_are_not_cached(cache, response):
+    compute = Compute(response, ok())
+    cached_call(PATH, PARAMS, {}, compute)
+    second = cached_call(PATH, PARAMS, {}, compute)
+
+    assert compute.calls == 2
+    assert second['headers']['X-Cache'] == 'MISS'
+
+
+def test_paths_without_ttl_are_not_cached(cache):
+    compute = Compute(ok(), ok())
+    cached_call('/query-logs', PARAMS, {}, compute)
+    response = cached_call('/query-logs', PARAMS, {}, compute)
+
+    assert compute.calls == 2
+    assert 'X-Cache' not in response['headers']
+
+
+@pytest.fixture
+def trust_db(fake_db, monkeypatch):
+    """/trust-analytics sin rollup, con el mismo resultado en cada recálculo"""
+    def respond(sql, params):
+        if sql is lambda_function.TRUST_P80_SQL:
+            return [{'p80_period': 0.9, 'p80_today': None}]
+        return []
+
+    fake_db.respond = respond
+    monkeypatch.setattr(rollup, 'rollup_boundary', lambda cursor: None)
+    return fake_db
+
+
+def test_trust_analytics_etag_is_stable_across_recomputes(trust_db, fresh_cache):
+    first = lambda_function.lambda_handler(url_event('/trust-analytics', {'days': '7', 'refresh': '1'}), None)
+    second = lambda_function.lambda_handler(url_event('/trust-analytics', {'days': '7', 'refresh': '1'}), None)
+
+    assert second['headers']['X-Cache'] == 'BYPASS'
+    assert first['headers']['ETag'] == second['headers']['ETag']
+    # Los tiempos por fase van en la cabecera, no en el cuerpo que fija la ETag
+    assert 'scan;dur=' in second['headers']['Server-Timing']
+    assert 'timings' not in second['body']
+
+    revalidated = lambda_function.lambda_handler(
+        url_event('/trust-analytics', {'days': '7'}, {'If-None-Match': first['headers']['ETag']}), None
+    )
+    assert revalidated['statusCode'] == 304
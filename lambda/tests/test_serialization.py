@@ -0,0 +1,81 @@
+"""serialization: dumps, RowEncoder y cachés acotadas de encoders"""
+
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+import lambda_function
+import serialization
+from serialization import RowEncoder, dumps, get_row_encoder
+
+EXPRESSIONS = {'id': 'id', 'person': 'person_name', 'person_name': 'person_name', 'score': 'confidence_score'}
+
+
+def test_dumps_handles_database_types():
+    value = uuid.UUID('12345678-1234-5678-1234-567812345678')
+    body = json.loads(dumps({
+        'at': datetime(2025, 1, 2, 3, 4, 5), 'day': date(2025, 1, 2),
+        'score': Decimal('0.75'), 'id': value, 'raw': b'abc', 1: 'key'
+    }))
+    assert body == {
+        'at': '2025-01-02T03:04:05', 'day': '2025-01-02',
+        'score': 0.75, 'id': str(value), 'raw': 'abc', '1': 'key'
+    }
+
+
+def test_row_encoder_shares_columns_and_converts():
+    encoder = RowEncoder(['id', 'person', 'person_name', 'score'], EXPRESSIONS, {'id': 'str', 'score': 'float0'})
+
+    assert encoder.columns == [('id', 'id'), ('person', 'person_name'), ('score', 'confidence_score')]
+    assert encoder.index_of('person_name') == 1
+    assert encoder.select_sql.split(',\n')[1].strip() == 'person_name as person'
+    assert encoder.encode_all([(7, 'Ana', None)]) == [{'id': '7', 'person': 'Ana', 'person_name': 'Ana', 'score': 0}]
+
+
+def test_field_order_is_kept_in_output():
+    encoder = RowEncoder(['score', 'id'], EXPRESSIONS)
+    assert list(encoder.encode((0.5, 1))) == ['score', 'id']
+
+
+@pytest.fixture
+def small_caches(monkeypatch):
+    """Cachés de encoders vacías y con 4 entradas como máximo"""
+    compiled = serialization._LRU(4)
+    encoders = serialization._LRU(4)
+    monkeypatch.setattr(serialization, '_compiled', compiled)
+    monkeypatch.setattr(serialization, '_encoders', encoders)
+    return compiled, encoders
+
+
+def test_preview_lengths_reuse_one_compiled_function(small_caches):
+    compiled, encoders = small_caches
+    fields = lambda_function.resolve_query_log_fields({})
+
+    produced = [lambda_function.query_log_encoder(fields, length) for length in range(50)]
+
+    assert len(compiled) == 1
+    assert len(encoders) == 4
+    assert len({encoder.encode for encoder in produced}) == 1
+    assert 'LEFT(query_text, 49)' in produced[-1].select_sql
+
+
+def test_caches_stay_bounded_for_client_field_orders(small_caches):
+    compiled, encoders = small_caches
+    orders = [['id', 'person', 'score'], ['score', 'id', 'person'], ['person', 'score', 'id'],
+              ['id', 'score', 'person'], ['score', 'person', 'id'], ['person', 'id', 'score']]
+
+    for fields in orders * 3:
+        encoder = get_row_encoder('test', fields, EXPRESSIONS)
+        assert list(encoder.encode((1, 'Ana', 0.5))) == fields
+
+    assert len(compiled) == 4
+    assert len(encoders) == 4
+
+
+def test_cached_encoder_is_reused(small_caches):
+    first = get_row_encoder('test', ['id', 'score'], EXPRESSIONS)
+    assert get_row_encoder('test', ['id', 'score'], EXPRESSIONS) is first
+    assert get_row_encoder('other', ['id', 'score'], EXPRESSIONS) is not first
@@ -0,0 +1,73 @@
+"""QuantileSketch: cota de error relativo, merge y serialización"""
+
+import json
+import math
+import random
+
+import pytest
+
+from sketches import DEFAULT_RELATIVE_ACCURACY, QuantileSketch, merge_sketches
+
+QUANTILES = (0.01, 0.25, 0.5, 0.8, 0.95, 0.99)
+
+
+def exact_quantile(values, q):
+    """Mismo rango que QuantileSketch.quantile: q * (n - 1) sobre los valores ordenados"""
+    ordered = sorted(values)
+    return ordered[math.floor(q * (len(ordered) - 1))]
+
+
+def sketch_of(values):
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+@pytest.fixture
+def latencies():
+    rng = random.Random(7)
+    return [rng.lognormvariate(6, 1.2) for _ in range(20000)]
+
+
+def test_quantiles_within_relative_accuracy(latencies):
+    sketch = sketch_of(latencies)
+    for q in QUANTILES:
+        expected = exact_quantile(latencies, q)
+        assert abs(sketch.quantile(q) - expected) <= DEFAULT_RELATIVE_ACCURACY * expected
+
+
+def test_zero_and_none_values():
+    sketch = sketch_of([None, 0, 0, 0, 5.0])
+    assert sketch.count == 4
+    assert sketch.zero_count == 3
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1) == 5.0
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_merge_matches_single_sketch(latencies):
+    whole = sketch_of(latencies)
+    parts = [sketch_of(latencies[i::4]) for i in range(4)]
+
+    merged = merge_sketches([part.to_dict() for part in parts[:2]] + parts[2:] + [None])
+
+    assert merged.bins == whole.bins
+    assert merged.count == whole.count
+    assert (merged.min, merged.max) == (whole.min, whole.max)
+    assert merged.sum == pytest.approx(whole.sum)
+    for q in QUANTILES:
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_merge_rejects_different_accuracy():
+    other = QuantileSketch(0.05)
+    other.add(2.0)
+    with pytest.raises(ValueError):
+        sketch_of([1.0]).merge(other)
+
+
+def test_round_trip_through_json(latencies):
+    sketch = sketch_of(latencies[:1000])
+    restored = QuantileSketch.from_dict(json.dumps(sketch.to_dict()))
+    assert restored.summary() == sketch.summary()
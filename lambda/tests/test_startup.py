@@ -0,0 +1,41 @@
+"""Cold start: importar lambda_function no carga módulos de rutas concretas ni compila encoders"""
+
+import json
+import os
+import subprocess
+import sys
+
+import lambda_function
+import serialization
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PROBE = """
+import json, sys
+import lambda_function, serialization
+print(json.dumps({
+    'modules': sorted(name for name in ('rollup', 'sketches', 'compression', 'numpy', 'export', 'usage')
+                      if name in sys.modules),
+    'encoders': len(serialization._encoders)
+}))
+"""
+
+
+def test_import_is_lazy():
+    # Proceso nuevo: en este ya están importados por otros tests
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=LAMBDA_DIR, capture_output=True, text=True, check=True,
+        env={**os.environ, 'METRICS_FORMAT': 'off'}
+    )
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert loaded == {'modules': [], 'encoders': 0}
+
+
+def test_detail_encoder_is_built_once(monkeypatch):
+    monkeypatch.setattr(serialization, '_encoders', serialization._LRU(4))
+    encoder = lambda_function.query_log_detail_encoder()
+
+    assert lambda_function.query_log_detail_encoder() is encoder
+    assert encoder.index_of('tool_results') == len(encoder.columns) - 1
+    assert encoder.index_of('response_time_ms') == encoder.index_of('processing_time_ms')
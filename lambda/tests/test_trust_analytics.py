@@ -0,0 +1,170 @@
+"""/trust-analytics: filas de GROUPING SETS, ruta del rollup y p80 solo para los indicadores"""
+
+import json
+import math
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import lambda_function
+import rollup
+from lambda_function import (
+    TRUST_GSET_CATEGORY, TRUST_GSET_DAY, TRUST_GSET_PERIOD, TRUST_GSET_TEAM_DAY, TRUST_GSET_TODAY,
+    build_trust_analytics, trust_rows_from_rollup
+)
+
+TODAY = date(2025, 6, 10)
+
+
+def category_of(confidence):
+    if confidence is None:
+        return None
+    return 'high' if confidence >= 0.8 else 'medium' if confidence >= 0.5 else 'low'
+
+
+@pytest.fixture(scope='module')
+def raw_rows():
+    """Filas del periodo (los últimos 7 días) con ~5% sin puntuar"""
+    rng = random.Random(4)
+    rows = []
+    for _ in range(2000):
+        confidence = round(rng.betavariate(5, 2), 4) if rng.random() > 0.05 else None
+        rows.append({
+            'day': TODAY - timedelta(days=rng.randrange(7)),
+            'team': rng.choice(['team-a', 'team-b', 'team-c']),
+            'category': category_of(confidence),
+            'confidence': confidence
+        })
+    return rows
+
+
+def grouping_row(gset, members, in_period=None, is_today=None, team=None, day=None, category=None):
+    """Fila de TRUST_ANALYTICS_SQL para un grupo (mismas columnas que el SELECT)"""
+    scored = [row['confidence'] for row in members if row['confidence'] is not None]
+    return {
+        'gset': gset, 'in_period': in_period, 'is_today': is_today,
+        'team': team, 'day': day, 'category': category,
+        'row_count': len(members),
+        'scored_count': len(scored),
+        'avg_trust': sum(scored) / len(scored) if scored else None,
+        'min_trust': min(scored) if scored else None,
+        'max_trust': max(scored) if scored else None,
+        'high_scored': sum(1 for row in members if row['category'] == 'high' and row['confidence'] is not None),
+        'low_count': sum(1 for row in members if row['category'] == 'low'),
+        'medium_count': sum(1 for row in members if row['category'] == 'medium'),
+        'high_count': sum(1 for row in members if row['category'] == 'high')
+    }
+
+
+def sql_rows(rows):
+    """Lo que devolvería el GROUPING SETS de PostgreSQL para rows (todas dentro del periodo)"""
+    def groups(key):
+        result = {}
+        for row in rows:
+            result.setdefault(key(row), []).append(row)
+        return result.items()
+
+    output = [grouping_row(TRUST_GSET_PERIOD, rows, in_period=True)]
+    output += [grouping_row(TRUST_GSET_TODAY, members, is_today=is_today)
+               for is_today, members in groups(lambda row: row['day'] == TODAY)]
+    output += [grouping_row(TRUST_GSET_TEAM_DAY, members, in_period=True, team=team, day=day)
+               for (team, day), members in groups(lambda row: (row['team'], row['day']))]
+    output += [grouping_row(TRUST_GSET_CATEGORY, members, in_period=True, category=category)
+               for category, members in groups(lambda row: row['category'])]
+    output += [grouping_row(TRUST_GSET_DAY, members, in_period=True, day=day)
+               for day, members in groups(lambda row: row['day'])]
+    return output
+
+
+def rollup_buckets(rows):
+    buckets = {}
+    for row in rows:
+        bucket = buckets.setdefault((row['day'], row['team'], row['category'] or ''), rollup.DailyBucket())
+        bucket.add_row(row['confidence'], None, 0, 0, 0)
+    return buckets
+
+
+def exact_p80(values):
+    ordered = sorted(values)
+    return ordered[math.floor(0.8 * (len(ordered) - 1))]
+
+
+def rounded(value):
+    """Redondea floats en estructuras anidadas (el orden de las sumas cambia entre rutas)"""
+    if isinstance(value, float):
+        return round(value, 9)
+    if isinstance(value, dict):
+        return {key: rounded(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [rounded(item) for item in value]
+    return value
+
+
+def test_sql_rows_are_split_into_sections(raw_rows):
+    result = build_trust_analytics(sql_rows(raw_rows))
+    scored = [row['confidence'] for row in raw_rows if row['confidence'] is not None]
+
+    assert result['indicators']['avgTrustPeriod'] == pytest.approx(sum(scored) / len(scored))
+    assert result['indicators']['highConfidenceRatePeriod'] == pytest.approx(
+        100.0 * sum(1 for value in scored if value >= 0.8) / len(scored)
+    )
+    assert sum(result['charts']['trustDistribution'].values()) == len(scored)
+    assert len(result['tables']['trustByTeamDay']) == 3 * 7
+    assert [row['date'] for row in result['charts']['trustLevelsEvolution']] == sorted(
+        {row['day'] for row in raw_rows}
+    )
+    # Sin p80 en las filas, el indicador es 0
+    assert result['indicators']['percentile80Period'] == 0.0
+
+
+def test_rollup_path_matches_sql_path(raw_rows):
+    from_sql = build_trust_analytics(sql_rows(raw_rows))
+    from_rollup = build_trust_analytics(trust_rows_from_rollup(rollup_buckets(raw_rows), TODAY))
+
+    assert rounded(from_rollup['tables']) == rounded(from_sql['tables'])
+    assert rounded(from_rollup['charts']) == rounded(from_sql['charts'])
+    for name in ('avgTrustToday', 'avgTrustPeriod', 'highConfidenceRateToday', 'highConfidenceRatePeriod'):
+        assert from_rollup['indicators'][name] == pytest.approx(from_sql['indicators'][name])
+
+
+def test_rollup_p80_only_for_indicator_sets(raw_rows):
+    rows = trust_rows_from_rollup(rollup_buckets(raw_rows), TODAY)
+
+    with_p80 = {row['gset'] for row in rows if row['p80_trust'] is not None}
+    assert with_p80 == {TRUST_GSET_PERIOD, TRUST_GSET_TODAY}
+
+    period = next(row for row in rows if row['gset'] == TRUST_GSET_PERIOD)
+    expected = exact_p80(row['confidence'] for row in raw_rows if row['confidence'] is not None)
+    assert abs(period['p80_trust'] - expected) <= 0.01 * expected
+
+
+@pytest.fixture
+def raw_trust_db(fake_db, monkeypatch, raw_rows):
+    """Sin rollup: TRUST_ANALYTICS_SQL y TRUST_P80_SQL contra fake_db"""
+    def respond(sql, params):
+        if sql is lambda_function.TRUST_P80_SQL:
+            return [{'p80_period': 0.91, 'p80_today': 0.87}]
+        if sql is lambda_function.TRUST_ANALYTICS_SQL:
+            return sql_rows(raw_rows)
+        return []
+
+    fake_db.respond = respond
+    monkeypatch.setattr(rollup, 'rollup_boundary', lambda cursor: None)
+    return fake_db
+
+
+def test_raw_path_takes_p80_from_its_own_query(raw_trust_db):
+    response = lambda_function.handle_trust_analytics({'days': ['7']})
+    indicators = json.loads(response['body'])['indicators']
+
+    assert response['statusCode'] == 200
+    assert (indicators['percentile80Period'], indicators['percentile80Today']) == (0.91, 0.87)
+    assert 'PERCENTILE_CONT' not in lambda_function.TRUST_ANALYTICS_SQL
+    assert len(raw_trust_db.executed('PERCENTILE_CONT')) == 1
+
+
+@pytest.mark.parametrize('days', ['0', '-1', 'week'])
+def test_bad_days_return_400(fake_db, days):
+    assert lambda_function.handle_trust_analytics({'days': [days]})['statusCode'] == 400
+    assert fake_db.statements == []
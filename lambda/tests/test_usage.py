@@ -0,0 +1,238 @@
+"""/usage: el modo offline (NumPy) da las mismas cifras que merge_rows y que el SQL de /usage"""
+
+import gzip
+import itertools
+import json
+import random
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import lambda_function
+import rollup
+import usage
+from conftest import url_event
+
+# Solo el modo offline necesita NumPy
+pytest.importorskip('numpy')
+
+FIRST_DAY = date(2025, 1, 1)
+DAYS = 20
+
+
+@pytest.fixture(scope='module')
+def export_columns(tmp_path_factory):
+    """Export NDJSON gzip sintético con personas/equipos nulos y tokens nulos"""
+    rng = random.Random(3)
+    path = str(tmp_path_factory.mktemp('usage') / 'export.ndjson.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for i in range(3000):
+            person = rng.randrange(40)
+            tokens_input = rng.randint(10, 500)
+            f.write(json.dumps({
+                'query_id': str(i),
+                'request_timestamp': f"{FIRST_DAY + timedelta(days=rng.randrange(DAYS))}T{rng.randrange(24):02d}:15:00",
+                'person': f'Person {person}' if rng.random() > 0.05 else None,
+                'team': f'team-{person % 5}' if rng.random() > 0.05 else None,
+                'model_id': 'claude-3-haiku',
+                'tokens_input': tokens_input,
+                'tokens_output': rng.randint(1, 200) if rng.random() > 0.05 else None,
+                'tokens_total': tokens_input
+            }) + '\n')
+    return usage.load_ndjson(path)
+
+
+def sql_like_groups(columns, group_by, start_day, end_day):
+    """Agrupa en Python como lo haría el GROUP BY (NULL -> NULL_KEY) y pasa por merge_rows"""
+    sums = {}
+    for i, day in enumerate(columns['day']):
+        if not start_day.isoformat() <= day <= end_day.isoformat():
+            continue
+        key = tuple(date.fromisoformat(day) if name == 'day' else columns[name][i] for name in group_by)
+        entry = sums.setdefault(key, [0, 0, 0, 0])
+        entry[0] += 1
+        for j, measure in enumerate(usage.MEASURES[1:], start=1):
+            entry[j] += columns[measure][i]
+    rows = [
+        {**{name: (rollup.NULL_KEY if value is None else value) for name, value in zip(group_by, key)},
+         **dict(zip(usage.MEASURES, values))}
+        for key, values in sums.items()
+    ]
+    return usage.merge_rows([rows], group_by)
+
+
+@pytest.mark.parametrize('group_by', [
+    group_by
+    for size in range(len(usage.GROUP_DIMENSIONS) + 1)
+    for group_by in itertools.combinations(usage.GROUP_DIMENSIONS, size)
+])
+def test_offline_groups_match_merge_rows(export_columns, group_by):
+    frame = usage.offline_frame(export_columns)
+    start_day = FIRST_DAY + timedelta(days=1)
+    end_day = FIRST_DAY + timedelta(days=DAYS - 2)
+
+    offline = usage.offline_groups(frame, group_by, start_day, end_day)
+
+    assert offline == sql_like_groups(export_columns, group_by, start_day, end_day)
+    assert usage.build_usage(offline, group_by) == usage.build_usage(
+        sql_like_groups(export_columns, group_by, start_day, end_day), group_by
+    )
+
+
+def test_merge_rows_adds_rollup_and_raw_parts():
+    rollup_rows = [{'team': 'a', 'queries': 2, 'tokens_input': 10, 'tokens_output': 5, 'tokens_total': 15}]
+    raw_rows = [
+        {'team': 'a', 'queries': 1, 'tokens_input': 1, 'tokens_output': None, 'tokens_total': 1},
+        {'team': rollup.NULL_KEY, 'queries': 1, 'tokens_input': 3, 'tokens_output': 3, 'tokens_total': 6}
+    ]
+    groups = usage.merge_rows([rollup_rows, raw_rows, None], ('team', 'model'))
+    assert groups == {
+        ('a', usage.USAGE_MODEL_ID): [3, 11, 5, 16],
+        (None, usage.USAGE_MODEL_ID): [1, 3, 3, 6]
+    }
+
+
+def test_parse_group_by_rejects_unknown_dimensions():
+    assert usage.parse_group_by('team, day,team') == ('team', 'day')
+    with pytest.raises(ValueError):
+        usage.parse_group_by('team,region')
+
+
+# --- Paridad con el SQL: mismo web_queries para /usage y para el export ---------
+
+sqlite3.register_converter('pgtimestamp', lambda value: datetime.fromisoformat(value.decode('utf-8')))
+
+WEB_QUERIES_SQL = """
+    CREATE TABLE web_queries (
+        id integer PRIMARY KEY, created_at pgtimestamp, response_timestamp pgtimestamp,
+        user_name text, person_name text, app_name text, session_token text,
+        conversation_id_bedrock text, query_text text, llm_response text, status text,
+        response_time_ms real, tokens_input integer, tokens_output integer, tokens_total integer,
+        confidence_score real, llm_trust_category text, tools_used text
+    )
+"""
+
+
+@pytest.fixture
+def web_queries():
+    """web_queries en SQLite con persona, equipo, categoría y tokens nulos en algunas filas"""
+    rng = random.Random(7)
+    conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+    conn.execute(WEB_QUERIES_SQL)
+    for i in range(600):
+        created_at = datetime.combine(FIRST_DAY, datetime.min.time()) + timedelta(minutes=rng.randrange(DAYS * 1440))
+        person = rng.randrange(12)
+        tokens_input = rng.randint(10, 500) if rng.random() > 0.05 else None
+        conn.execute("INSERT INTO web_queries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+            i, created_at.isoformat(' '), (created_at + timedelta(seconds=3)).isoformat(' '),
+            f'user{person}', f'Person {person}' if rng.random() > 0.1 else None,
+            f'team-{person % 4}' if rng.random() > 0.1 else None, f's{i}', f'c{i}', 'q', 'r', None,
+            1200.0, tokens_input, rng.randint(1, 200) if rng.random() > 0.05 else None, tokens_input,
+            0.7, rng.choice(['high', 'medium', 'low', None]), None
+        ))
+    yield conn
+    conn.close()
+
+
+def sqlite_sql(sql, params):
+    params = [value.isoformat(' ') if isinstance(value, datetime) else value for value in params or ()]
+    return sql.replace('%s', '?'), params
+
+
+class DictCursor:
+    """RealDictCursor sobre SQLite para las tareas de usage_tasks (day como date, igual que psycopg2)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        cursor = self.conn.execute(*sqlite_sql(sql, params))
+        names = [column[0] for column in cursor.description]
+        self.rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+        for row in self.rows:
+            if isinstance(row.get('day'), str):
+                row['day'] = date.fromisoformat(row['day'])
+
+    def fetchall(self):
+        return self.rows
+
+
+def export_ndjson(fake_db, web_queries, tmp_path, params):
+    """Ejecuta /query-logs/export contra la tabla SQLite y guarda el NDJSON"""
+    fake_db.respond = lambda sql, sql_params: web_queries.execute(*sqlite_sql(sql, sql_params)).fetchall()
+    response = lambda_function.handle_query_logs_export({'format': ['ndjson'], **params})
+    assert response['statusCode'] == 200
+    path = tmp_path / 'export.ndjson'
+    path.write_text(response['body'], encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('group_by', [('team',), ('person', 'day'), ('team', 'person', 'model'), ()])
+def test_offline_scope_all_export_matches_usage_sql(fake_db, web_queries, tmp_path, group_by):
+    start_day, end_day = FIRST_DAY, FIRST_DAY + timedelta(days=DAYS - 1)
+    raw = usage.usage_tasks(None, start_day, end_day, group_by)['raw'](DictCursor(web_queries))
+    expected = usage.merge_rows([raw], group_by)
+
+    path = export_ndjson(fake_db, web_queries, tmp_path, {'scope': ['all']})
+    offline = usage.offline_groups(usage.offline_frame(usage.load_ndjson(path)), group_by, start_day, end_day)
+
+    assert offline == expected
+    assert sum(totals[0] for totals in offline.values()) == 600
+    if group_by:
+        assert any(None in key for key in offline)
+
+
+def test_default_export_drops_rows_usage_counts(fake_db, web_queries, tmp_path):
+    path = export_ndjson(fake_db, web_queries, tmp_path, {})
+    listed = web_queries.execute(
+        "SELECT COUNT(*) FROM web_queries WHERE " + " AND ".join(lambda_function.build_query_logs_filters({})[0])
+    ).fetchone()[0]
+
+    assert len(usage.load_ndjson(path)['day']) == listed < 600
+
+
+def test_scope_all_omits_the_listing_predicate():
+    listed, _ = lambda_function.build_query_logs_filters({'team': ['team-a']})
+    everything, params = lambda_function.build_query_logs_filters({'team': ['team-a']}, base=False)
+
+    assert 'person_name IS NOT NULL' in listed
+    assert everything == ['app_name = %s'] and params == ['team-a']
+
+
+def test_bad_export_scope_returns_400(fake_db):
+    response = lambda_function.handle_query_logs_export({'scope': ['everything']})
+
+    assert response['statusCode'] == 400
+    assert fake_db.statements == []
+
+
+# --- Endpoint -------------------------------------------------------------
+
+@pytest.fixture
+def usage_db(fake_db, monkeypatch):
+    """/usage sin rollup: el GROUP BY devuelve siempre las mismas filas"""
+    fake_db.respond = lambda sql, params: [
+        {'team': 'team-a', 'queries': 3, 'tokens_input': 30, 'tokens_output': 9, 'tokens_total': 39},
+        {'team': rollup.NULL_KEY, 'queries': 1, 'tokens_input': 5, 'tokens_output': None, 'tokens_total': 5}
+    ]
+    monkeypatch.setattr(rollup, 'rollup_boundary', lambda cursor: None)
+    return fake_db
+
+
+def test_usage_etag_is_stable_and_timing_is_a_header(usage_db, fresh_cache):
+    params = {'days': '7', 'refresh': '1'}
+    first = lambda_function.lambda_handler(url_event('/usage', params), None)
+    second = lambda_function.lambda_handler(url_event('/usage', params), None)
+    body = json.loads(second['body'])
+
+    assert first['headers']['ETag'] == second['headers']['ETag']
+    assert 'query;dur=' in second['headers']['Server-Timing']
+    assert 'elapsed_ms' not in body
+    assert body['totals']['queries'] == 4
+    assert [row['team'] for row in body['rows']] == ['team-a', None]
+
+    revalidated = lambda_function.lambda_handler(
+        url_event('/usage', {'days': '7'}, {'If-None-Match': first['headers']['ETag']}), None
+    )
+    assert revalidated['statusCode'] == 304
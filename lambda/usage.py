@@ -0,0 +1,296 @@
+"""
+Dashboard Lambda - Consumo de tokens y coste
+- usage_tasks(): totales de consultas y tokens por team / person / day / model
+  para un rango de días; los días completos se suman en web_queries_daily y
+  el resto con un GROUP BY sobre web_queries desde el watermark del rollup
+- Modo offline: las mismas cifras desde un export NDJSON de /query-logs/export
+  con group-bys vectorizados de NumPy (solo hace falta NumPy para este modo).
+  El export debe pedirse con scope=all: por defecto omite las filas sin persona,
+  equipo o categoría, que /usage sí cuenta
+
+Uso offline:
+    curl '.../query-logs/export?format=ndjson&scope=all&gzip=1' -o export.ndjson.gz
+    python usage.py export.ndjson[.gz] --group-by team,day [--start-date 2025-01-01] [--end-date 2025-03-31]
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import rollup
+from db import query_task
+
+# web_queries no guarda el modelo: todas las filas se atribuyen a este (como modelStats en /analytics)
+USAGE_MODEL_ID = os.environ.get('USAGE_MODEL_ID', 'claude-3-haiku')
+# USD por millón de tokens de entrada / salida
+DEFAULT_MODEL_PRICES = {
+    'claude-3-haiku': {'input': 0.25, 'output': 1.25}
+}
+# JSON opcional que añade o sustituye precios, p.ej. {"claude-3-haiku": {"input": 0.25, "output": 1.25}}
+MODEL_PRICES = {**DEFAULT_MODEL_PRICES, **json.loads(os.environ.get('USAGE_MODEL_PRICES', '{}'))}
+USAGE_CURRENCY = 'USD'
+
+GROUP_DIMENSIONS = ('team', 'person', 'day', 'model')
+MEASURES = ('queries', 'tokens_input', 'tokens_output', 'tokens_total')
+
+# Expresión de cada dimensión en el rollup y en las filas en bruto (model es constante)
+ROLLUP_EXPRESSIONS = {'team': 'app_name', 'person': 'person_name', 'day': 'day'}
+RAW_EXPRESSIONS = {
+    'team': f"COALESCE(app_name, '{rollup.NULL_KEY}')",
+    'person': f"COALESCE(person_name, '{rollup.NULL_KEY}')",
+    'day': 'DATE(created_at)'
+}
+ROLLUP_MEASURES_SQL = (
+    "SUM(query_count) as queries, SUM(tokens_input_sum) as tokens_input, "
+    "SUM(tokens_output_sum) as tokens_output, SUM(tokens_total_sum) as tokens_total"
+)
+RAW_MEASURES_SQL = (
+    "COUNT(*) as queries, COALESCE(SUM(tokens_input), 0) as tokens_input, "
+    "COALESCE(SUM(tokens_output), 0) as tokens_output, COALESCE(SUM(tokens_total), 0) as tokens_total"
+)
+
+
+def parse_group_by(value):
+    """'team,day' -> ('team', 'day'); ValueError con dimensiones desconocidas"""
+    group_by = tuple(dict.fromkeys(part.strip() for part in value.split(',') if part.strip()))
+    unknown = [part for part in group_by if part not in GROUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown group_by: {', '.join(unknown)} (expected any of {', '.join(GROUP_DIMENSIONS)})")
+    return group_by
+
+
+def _grouped_sql(source, expressions, measures_sql, clauses, group_by):
+    dimensions = [name for name in group_by if name != 'model']
+    select = [f"{expressions[name]} as {name}" for name in dimensions] + [measures_sql]
+    group = f"GROUP BY {', '.join(expressions[name] for name in dimensions)}" if dimensions else ""
+    return f"""
+        SELECT {", ".join(select)}
+        FROM {source}
+        WHERE {" AND ".join(clauses)}
+        {group}
+    """
+
+
+def usage_tasks(boundary, start_day, end_day, group_by, teams=None, person=None):
+    """
+    Tareas para run_concurrently: 'rollup' suma web_queries_daily en los días
+    completos (< boundary) y 'raw' agrupa web_queries desde boundary (o todo
+    el rango si no hay rollup). Las dos devuelven filas con group_by + MEASURES.
+    """
+    tasks = {}
+    range_end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    raw_start = datetime.combine(start_day, datetime.min.time())
+
+    if boundary is not None:
+        raw_start = max(boundary, raw_start)
+        if start_day < boundary.date():
+            clauses = ["day >= %s", "day <= %s", "day < %s"]
+            params = [start_day, end_day, boundary.date()]
+            if teams:
+                clauses.append("app_name = ANY(%s)")
+                params.append(list(teams))
+            if person:
+                clauses.append("person_name = %s")
+                params.append(person)
+            tasks['rollup'] = query_task(
+                _grouped_sql(rollup.ROLLUP_TABLE, ROLLUP_EXPRESSIONS, ROLLUP_MEASURES_SQL, clauses, group_by),
+                params
+            )
+
+    if raw_start < range_end:
+        clauses = ["created_at >= %s", "created_at < %s"]
+        params = [raw_start, range_end]
+        if teams:
+            clauses.append("app_name = ANY(%s)")
+            params.append(list(teams))
+        if person:
+            clauses.append("person_name = %s")
+            params.append(person)
+        tasks['raw'] = query_task(
+            _grouped_sql('web_queries', RAW_EXPRESSIONS, RAW_MEASURES_SQL, clauses, group_by),
+            params
+        )
+    return tasks
+
+
+def merge_rows(row_sets, group_by, model=USAGE_MODEL_ID):
+    """Filas de usage_tasks -> {clave en orden de group_by: [queries, tokens_input, tokens_output, tokens_total]}"""
+    groups = {}
+    for rows in row_sets:
+        for row in rows or ():
+            key = tuple(
+                model if name == 'model' else (row[name] if row[name] != rollup.NULL_KEY else None)
+                for name in group_by
+            )
+            totals = groups.get(key)
+            if totals is None:
+                totals = groups[key] = [0, 0, 0, 0]
+            for i, measure in enumerate(MEASURES):
+                totals[i] += int(row[measure] or 0)
+    return groups
+
+
+def cost(model, tokens_input, tokens_output):
+    """Coste en USAGE_CURRENCY, o None si el modelo no tiene precio"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return round((tokens_input * prices['input'] + tokens_output * prices['output']) / 1_000_000, 6)
+
+
+def build_usage(groups, group_by, model=USAGE_MODEL_ID):
+    """Filas (ordenadas por clave) y totales con coste a partir de merge_rows / offline_groups"""
+    model_index = group_by.index('model') if 'model' in group_by else None
+    rows = []
+    totals = dict.fromkeys(MEASURES, 0)
+    total_cost = 0.0
+    unpriced = set()
+
+    # None al final de cada dimensión; las fechas se ordenan como date
+    for key in sorted(groups, key=lambda key: tuple((value is None, value or '') for value in key)):
+        values = groups[key]
+        row_model = key[model_index] if model_index is not None else model
+        row_cost = cost(row_model, values[1], values[2])
+        if row_cost is None:
+            unpriced.add(row_model)
+        else:
+            total_cost += row_cost
+        rows.append({**dict(zip(group_by, key)), **dict(zip(MEASURES, values)), 'cost': row_cost})
+        for measure, value in zip(MEASURES, values):
+            totals[measure] += value
+
+    return {
+        'currency': USAGE_CURRENCY,
+        'prices': {name: MODEL_PRICES[name] for name in sorted({row.get('model', model) for row in rows} - unpriced)},
+        'unpricedModels': sorted(unpriced),
+        'totals': {**totals, 'cost': round(total_cost, 6)},
+        'rows': rows
+    }
+
+
+# --- Modo offline (NDJSON + NumPy) ------------------------------------------
+
+# Campo del export para cada dimensión (el primero que exista en la línea)
+EXPORT_FIELDS = {
+    'team': ('team', 'iam_group'),
+    'person': ('person', 'person_name'),
+    'day': ('request_timestamp',),
+    'model': ('model_id',)
+}
+
+
+def load_ndjson(path):
+    """Columnas del export: {dimensión: [str | None]} y {medida: [int]} (tokens nulos = 0)"""
+    import gzip
+
+    opener = gzip.open if path.endswith('.gz') else open
+    columns = {name: [] for name in (*GROUP_DIMENSIONS, *MEASURES[1:])}
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for name, fields in EXPORT_FIELDS.items():
+                value = next((record[field] for field in fields if record.get(field) is not None), None)
+                columns[name].append(value[:10] if name == 'day' and value else value)
+            for measure in MEASURES[1:]:
+                columns[measure].append(record.get(measure) or 0)
+    return columns
+
+
+def offline_frame(columns):
+    """
+    Columnas de load_ndjson -> arrays de NumPy. Cada dimensión se factoriza
+    una sola vez (np.unique con return_inverse): etiquetas + código por fila.
+    """
+    import numpy as np
+
+    days = np.array(columns['day'], dtype='datetime64[D]')
+    frame = {'day': days, 'labels': {}, 'codes': {}}
+    for name in GROUP_DIMENSIONS:
+        values = days if name == 'day' else np.array(
+            [value if value is not None else rollup.NULL_KEY for value in columns[name]], dtype=str
+        )
+        labels, codes = np.unique(values, return_inverse=True)
+        frame['labels'][name] = labels
+        frame['codes'][name] = codes.reshape(-1)
+    for measure in MEASURES[1:]:
+        frame[measure] = np.asarray(columns[measure], dtype=np.int64)
+    return frame
+
+
+def offline_groups(frame, group_by, start_day=None, end_day=None):
+    """
+    Mismo resultado que merge_rows sobre un offline_frame: un código compuesto
+    por fila (ravel_multi_index de los códigos de cada dimensión) y np.bincount
+    para las sumas, sin bucles de Python por fila.
+    """
+    import numpy as np
+
+    days = frame['day']
+    mask = np.ones(len(days), dtype=bool)
+    if start_day is not None:
+        mask &= days >= np.datetime64(start_day, 'D')
+    if end_day is not None:
+        mask &= days <= np.datetime64(end_day, 'D')
+
+    sizes = [len(frame['labels'][name]) for name in group_by]
+    if group_by:
+        composite = np.ravel_multi_index([frame['codes'][name][mask] for name in group_by], sizes)
+    else:
+        composite = np.zeros(int(mask.sum()), dtype=np.int64)
+    keys, group_ids = np.unique(composite, return_inverse=True)
+    group_ids = group_ids.reshape(-1)
+
+    sums = [np.bincount(group_ids, minlength=len(keys))]
+    for measure in MEASURES[1:]:
+        weights = frame[measure][mask]
+        sums.append(np.bincount(group_ids, weights=weights, minlength=len(keys)).round().astype(np.int64))
+
+    # Etiquetas de cada grupo: tolist() devuelve str y datetime.date
+    key_columns = []
+    if group_by:
+        for name, key_codes in zip(group_by, np.unravel_index(keys, sizes)):
+            labels = frame['labels'][name][key_codes].tolist()
+            key_columns.append(labels if name == 'day' else [label or None for label in labels])
+    group_keys = zip(*key_columns) if key_columns else [()] * len(keys)
+    values = zip(*(column.tolist() for column in sums))
+    return {tuple(key): list(totals) for key, totals in zip(group_keys, values)}
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Consumo de tokens y coste desde un export NDJSON")
+    parser.add_argument('path', help="Export de /query-logs/export?format=ndjson&scope=all (opcionalmente .gz)")
+    parser.add_argument('--group-by', default='team', help=f"Dimensiones separadas por comas: {', '.join(GROUP_DIMENSIONS)}")
+    parser.add_argument('--start-date', help="YYYY-MM-DD (incluido)")
+    parser.add_argument('--end-date', help="YYYY-MM-DD (incluido)")
+    args = parser.parse_args()
+
+    group_by = parse_group_by(args.group_by)
+    start_day = datetime.strptime(args.start_date, '%Y-%m-%d').date() if args.start_date else None
+    end_day = datetime.strptime(args.end_date, '%Y-%m-%d').date() if args.end_date else None
+
+    started = time.perf_counter()
+    frame = offline_frame(load_ndjson(args.path))
+    loaded = time.perf_counter()
+    groups = offline_groups(frame, group_by, start_day, end_day)
+    aggregated = time.perf_counter()
+
+    from serialization import dumps
+    print(dumps({
+        'startDate': start_day,
+        'endDate': end_day,
+        'groupBy': list(group_by),
+        'source': 'ndjson',
+        **build_usage(groups, group_by)
+    }))
+    print(f"📊 {len(frame['day'])} rows | load {(loaded - started) * 1000:.0f} ms | "
+          f"group-by {(aggregated - loaded) * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()